@@ -0,0 +1,58 @@
+import argparse
+import re
+import time
+import tracemalloc
+
+from benchmarks.corpus import make_markdown
+from converter.postprocess import FlipParentheses, PostProcessor
+
+LEGACY_MATH_PATTERN = re.compile(r'(\$[^$]*?\$|\$\$.*?\$\$)', flags=re.DOTALL)
+
+
+def legacy_flip(content):
+    """The regex-split implementation that flip_parentheses_outside_math used before MarkdownScanner."""
+    segments = LEGACY_MATH_PATTERN.split(content)
+
+    def flip_parens(s):
+        return s.replace('(', '§').replace(')', '(').replace('§', ')')
+
+    return ''.join(flip_parens(seg) if not LEGACY_MATH_PATTERN.fullmatch(seg) else seg for seg in segments)
+
+
+def scanner_flip(content, chunk_size=64 * 1024):
+    processor = PostProcessor([FlipParentheses()])
+    chunks = (content[i:i + chunk_size] for i in range(0, len(content), chunk_size))
+    return ''.join(processor.process_chunks(chunks))
+
+
+def measure(function, content, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(content)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    function(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the legacy and streaming parenthesis flippers.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000, 5_000_000],
+                        help="Document sizes in characters.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions; the best run is reported.")
+    args = parser.parse_args(argv)
+
+    print(f"{'size':>10}  {'legacy s':>9}  {'scanner s':>9}  {'legacy peak MB':>14}  {'scanner peak MB':>15}")
+    for size in args.sizes:
+        content = make_markdown(size)
+        legacy_time, legacy_peak = measure(legacy_flip, content, args.repeat)
+        scanner_time, scanner_peak = measure(scanner_flip, content, args.repeat)
+        print(f"{len(content):>10}  {legacy_time:>9.3f}  {scanner_time:>9.3f}  "
+              f"{legacy_peak / 1e6:>14.1f}  {scanner_peak / 1e6:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
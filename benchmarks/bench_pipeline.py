@@ -0,0 +1,160 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.corpus import make_markdown, write_corpus
+from benchmarks.stub_toolchain import write_stub_toolchain
+from converter.lyx_converter import LyxConverter
+from converter.postprocess import flip_parentheses_outside_math, remove_stray_character_from_md
+
+STAGES = ("export", "transcoding", "pandoc", "remove_stray_character", "flip_parentheses", "end_to_end")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def run_once(converter, lyx_paths, markdown_documents, workdir):
+    """
+    Runs every stage once over the whole corpus.
+
+    Returns:
+        dict: Total seconds spent in each stage.
+    """
+    timings = dict.fromkeys(STAGES, 0.0)
+    for lyx_path, markdown in zip(lyx_paths, markdown_documents):
+        tex_path = os.path.splitext(lyx_path)[0] + ".tex"
+        md_path = os.path.join(workdir, os.path.basename(lyx_path)[:-4] + ".md")
+
+        start = time.perf_counter()
+        converter._export_to_tex(lyx_path)
+        timings["export"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        latex = converter._convert_encoding_to_utf8(tex_path)
+        timings["transcoding"] += time.perf_counter() - start
+        os.remove(tex_path)
+
+        start = time.perf_counter()
+        converter._convert_tex_to_markdown(latex)
+        timings["pandoc"] += time.perf_counter() - start
+
+        # The post-processing functions rewrite the file in place, so each gets a fresh copy.
+        for stage, function in (("remove_stray_character", remove_stray_character_from_md),
+                                ("flip_parentheses", flip_parentheses_outside_math)):
+            with open(md_path, 'w', encoding='utf-8') as f:
+                f.write(markdown)
+            start = time.perf_counter()
+            function(md_path)
+            timings[stage] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        converter.convert(lyx_path, os.path.join(workdir, "out"))
+        timings["end_to_end"] += time.perf_counter() - start
+    return timings
+
+
+def summarize(runs):
+    """Reduces repeated runs to the best and median time of each stage."""
+    return {
+        stage: {"min": min(run[stage] for run in runs), "median": statistics.median(run[stage] for run in runs)}
+        for stage in STAGES
+    }
+
+
+def compare(results, baseline):
+    """
+    Compares the best times with a baseline.
+
+    Returns:
+        dict: {stage: relative change}, e.g. 0.3 for 30% slower.
+    """
+    changes = {}
+    for stage, timing in results.items():
+        reference = baseline.get("stages", {}).get(stage, {}).get("min")
+        if reference:
+            changes[stage] = timing["min"] / reference - 1
+    return changes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark every stage of the conversion pipeline on a synthetic corpus with stub LyX/Pandoc."
+    )
+    parser.add_argument("--documents", type=int, default=10, help="Number of documents in the corpus.")
+    parser.add_argument("--size", type=int, default=50_000, help="Approximate characters per document.")
+    parser.add_argument("--math-density", type=float, default=0.3,
+                        help="Probability that a sentence contains inline math.")
+    parser.add_argument("--lyx-latency", type=float, default=0.0, help="Seconds the LyX stub sleeps per export.")
+    parser.add_argument("--pandoc-latency", type=float, default=0.0,
+                        help="Seconds the Pandoc stub sleeps per conversion.")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions; the best and median runs are reported.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic corpus.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file to compare against.")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Relative slowdown of a stage's best time that counts as a regression.")
+    args = parser.parse_args(argv)
+
+    parameters = {
+        "documents": args.documents, "size": args.size, "math_density": args.math_density,
+        "lyx_latency": args.lyx_latency, "pandoc_latency": args.pandoc_latency, "seed": args.seed,
+    }
+
+    with tempfile.TemporaryDirectory(prefix="lyxtomarkdown-bench-") as workdir:
+        lyx_executable, pandoc_executable = write_stub_toolchain(
+            os.path.join(workdir, "bin"), args.lyx_latency, args.pandoc_latency
+        )
+        lyx_paths = write_corpus(os.path.join(workdir, "corpus"), args.documents, args.size,
+                                 args.math_density, seed=args.seed)
+        markdown_documents = [make_markdown(args.size, args.math_density, seed=args.seed + index)
+                              for index in range(args.documents)]
+        converter = LyxConverter(lyx_executable, pandoc_executable)
+        runs = [run_once(converter, lyx_paths, markdown_documents, workdir) for _ in range(args.repeat)]
+
+    results = summarize(runs)
+    megabytes = sum(len(markdown.encode('utf-8')) for markdown in markdown_documents) / 1e6
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get("parameters") != parameters:
+            print(f"Warning: {args.baseline} was recorded with different parameters: {baseline.get('parameters')}")
+    changes = compare(results, baseline) if baseline else {}
+
+    print(f"{args.documents} documents, {megabytes:.1f} MB of Markdown, best of {args.repeat} runs")
+    print(f"{'stage':<24}  {'best s':>8}  {'median s':>8}  {'MB/s':>8}  {'vs baseline':>11}")
+    regressions = []
+    for stage in STAGES:
+        timing = results[stage]
+        throughput = megabytes / timing["min"] if timing["min"] else float("inf")
+        change = changes.get(stage)
+        marker = ""
+        if change is not None:
+            marker = f"{change * 100:+.1f}%"
+            if change > args.tolerance:
+                marker += " !"
+                regressions.append(stage)
+        print(f"{stage:<24}  {timing['min']:>8.3f}  {timing['median']:>8.3f}  {throughput:>8.1f}  {marker:>11}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({
+                "parameters": parameters,
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "stages": results,
+            }, f, indent=4)
+        print(f"Saved baseline to {args.baseline}")
+
+    if regressions:
+        print(f"Regression in: {', '.join(regressions)} (more than {args.tolerance * 100:.0f}% slower than baseline)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+import os
+import random
+
+HEBREW_WORDS = ["שלום", "פונקציה", "(הגדרה)", "משפט", "הוכחה", "(ראו", "סעיף)", "נניח", "כי", "קבוצה", "רציפה"]
+INLINE_MATH = ["$f(x_{%d}) = (x+1)^2$", "$\\sum_{i=1}^{%d} a_i$", "$g(t) \\le %d$"]
+DISPLAY_MATH = "$$\\int_0^{%d} g(t)\\,dt$$"
+STRAY = "Ł"
+
+# Every generator below is deterministic for a given seed, so benchmark runs are comparable.
+
+LYX_HEADER = """#LyX 2.3 created this file. For more info see http://www.lyx.org/
+\\lyxformat 544
+\\begin_document
+\\begin_header
+\\save_transient_properties true
+\\origin unavailable
+\\textclass article
+\\use_default_options true
+\\language hebrew
+\\inputencoding cp1255
+\\end_header
+
+\\begin_body
+"""
+LYX_FOOTER = "\\end_body\n\\end_document\n"
+
+
+def _sentence(rng, math_density, math_format):
+    words = [rng.choice(HEBREW_WORDS) for _ in range(12)]
+    if rng.random() < math_density:
+        words.insert(rng.randrange(len(words)), math_format(rng.choice(INLINE_MATH) % rng.randint(1, 9)))
+    return " ".join(words)
+
+
+def make_markdown(size, math_density=0.3, stray_density=0.01, seed=0):
+    """
+    Builds a Markdown document of roughly size characters, like Pandoc's output for a Hebrew text.
+
+    Args:
+        size (int): The approximate length in characters.
+        math_density (float): The probability that a sentence contains inline math; a tenth of
+                              that is the probability of a display formula after it.
+        stray_density (float): The probability that a sentence contains a stray 'Ł'.
+        seed (int): The random seed.
+    """
+    rng = random.Random(seed)
+    blocks = []
+    length = 0
+    while length < size:
+        block = _sentence(rng, math_density, lambda math: math)
+        if rng.random() < stray_density:
+            block += f" {STRAY}$x$"
+        if rng.random() < math_density / 10:
+            block += "\n\n" + DISPLAY_MATH % rng.randint(1, 9)
+        if rng.random() < 0.02:
+            block += "\n\n```\nprint(f(x))\n```"
+        blocks.append(block)
+        length += len(block) + 2
+    return "\n\n".join(blocks) + "\n"
+
+
+def make_lyx(size, math_density=0.3, sections=10, seed=0):
+    """Builds a .lyx document of roughly size characters, split into the given number of sections."""
+    rng = random.Random(seed)
+    layouts = []
+    length = 0
+    section_every = max(1, size // max(1, sections))
+    next_section = 0
+    while length < size:
+        if length >= next_section:
+            layouts.append(f"\\begin_layout Section\nסעיף {len(layouts)}\n\\end_layout\n")
+            next_section += section_every
+        text = _sentence(
+            rng, math_density,
+            lambda math: f"\n\\begin_inset Formula {math}\n\\end_inset\n"
+        )
+        layouts.append(f"\\begin_layout Standard\n{text}\n\\end_layout\n")
+        length += len(text)
+    return LYX_HEADER + "\n" + "\n".join(layouts) + "\n" + LYX_FOOTER
+
+
+def write_corpus(directory, documents, size, math_density=0.3, seed=0):
+    """
+    Writes a corpus of .lyx documents. LyX files are UTF-8; the CP1255 comes in with the export.
+
+    Returns:
+        list: The paths of the written documents.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for index in range(documents):
+        path = os.path.join(directory, f"document_{index:03d}.lyx")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(make_lyx(size, math_density, seed=seed + index))
+        paths.append(path)
+    return paths
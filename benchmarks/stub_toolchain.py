@@ -0,0 +1,74 @@
+import os
+import stat
+import sys
+
+# Stand-ins for the LyX and Pandoc command-line tools. They do a small, realistic amount of text
+# processing and then sleep for a configurable latency, so the pipeline can be benchmarked on
+# machines without LyX or Pandoc.
+STUB_LYX = r'''#!{python}
+import os, sys, time
+# Usage: lyx --export latex FILE.lyx -> writes FILE.tex in CP1255, like a Hebrew LyX export.
+source = sys.argv[-1]
+with open(source, encoding="utf-8") as f:
+    text = f.read()
+body = text.split("\\begin_body\n", 1)[1]
+paragraphs, current, layout = [], [], None
+for line in body.splitlines():
+    if line.startswith("\\begin_layout "):
+        layout = line.split(" ", 1)[1]
+    elif line.startswith("\\end_layout"):
+        content = " ".join(current).strip()
+        paragraphs.append("\\section{{%s}}" % content if layout == "Section" else content)
+        current = []
+    elif line.startswith("\\begin_inset Formula "):
+        current.append(line[len("\\begin_inset Formula "):])
+    elif line and not line.startswith("\\"):
+        current.append(line)
+latex = ("\\documentclass{{article}}\n\\usepackage[hebrew]{{babel}}\n\\begin{{document}}\n"
+         + "\n\n".join(paragraphs) + "\n\\end{{document}}\n")
+with open(os.path.splitext(source)[0] + ".tex", "w", encoding="cp1255", errors="replace") as f:
+    f.write(latex)
+time.sleep({latency})
+'''
+
+STUB_PANDOC = r'''#!{python}
+import sys, time
+# Usage: pandoc --from=latex --to=markdown < FILE.tex -> Markdown on stdout.
+if "--version" in sys.argv:
+    print("pandoc 0.0-stub")
+    sys.exit(0)
+latex = sys.stdin.buffer.read().decode("utf-8")
+body = latex.split("\\begin{{document}}\n", 1)[-1].split("\\end{{document}}", 1)[0]
+blocks = []
+for block in body.split("\n\n"):
+    block = block.strip()
+    if block.startswith("\\section{{"):
+        block = "# " + block[len("\\section{{"):-1]
+    if block:
+        blocks.append(block)
+sys.stdout.buffer.write(("\n\n".join(blocks) + "\n").encode("utf-8"))
+time.sleep({latency})
+'''
+
+
+def write_stub_toolchain(directory, lyx_latency=0.0, pandoc_latency=0.0):
+    """
+    Writes executable stand-ins for lyx and pandoc.
+
+    Args:
+        directory (str): Where to write the stubs.
+        lyx_latency (float): Seconds the LyX stub sleeps after every export.
+        pandoc_latency (float): Seconds the Pandoc stub sleeps after every conversion.
+
+    Returns:
+        tuple: The paths of the lyx and pandoc stubs.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for name, template, latency in (("lyx", STUB_LYX, lyx_latency), ("pandoc", STUB_PANDOC, pandoc_latency)):
+        path = os.path.join(directory, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(template.format(python=sys.executable, latency=float(latency)))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        paths.append(path)
+    return tuple(paths)
@@ -1,3 +1,4 @@
+import copy
 import json
 import os
 from .settings import DEFAULT_CONFIG
@@ -14,18 +15,20 @@ class ConfigManager:
         If the file doesn't exist or is invalid, returns the default config.
         """
         if not os.path.exists(self.config_path):
-            return self.default_config.copy()
+            return copy.deepcopy(self.default_config)
         
         try:
             with open(self.config_path, 'r') as f:
                 config = json.load(f)
-                # Ensure all keys from default are present
-                for key, value in self.default_config["paths"].items():
-                    if key not in config.get("paths", {}):
-                        config["paths"][key] = value
+                # Ensure all sections and keys from default are present
+                for section, defaults in self.default_config.items():
+                    config.setdefault(section, {})
+                    for key, value in defaults.items():
+                        if key not in config[section]:
+                            config[section][key] = copy.deepcopy(value)
                 return config
         except (json.JSONDecodeError, IOError):
-            return self.default_config.copy()
+            return copy.deepcopy(self.default_config)
 
     def save_config(self, config_data):
         """Saves the given configuration data to the JSON file."""
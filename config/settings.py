@@ -4,5 +4,62 @@ DEFAULT_CONFIG = {
         "pandoc_executable": "/opt/homebrew/bin/pandoc",
         "last_lyx_file": "",
         "last_output_dir": ""
+    },
+    "converter": {
+        "export_backend": "lyx",
+        "pandoc_backend": "auto",
+        "pandoc_servers": 2,
+        "scratch_directory": "",
+        "output_formats": [],
+        "stage_timeouts": {
+            "export": 300,
+            "pandoc": 300
+        }
+    },
+    "assets": {
+        "enabled": False,
+        "directory": "assets",
+        "hardlinks": False
+    },
+    "postprocess": {
+        "enabled": ["remove_stray_character", "flip_parentheses"],
+        "rules": [],
+        "plugins": [],
+        "formats": {}
+    },
+    "reliability": {
+        "deadline_base_seconds": 60,
+        "deadline_seconds_per_mb": 60,
+        "retries": 2,
+        "retry_backoff_seconds": 1.0,
+        "quarantine_after": 3,
+        "quarantine_file": ""
+    },
+    "cache": {
+        "enabled": False,
+        "directory": "",
+        "max_size_mb": 512
+    },
+    "watch": {
+        "debounce_seconds": 0.5,
+        "poll_interval_seconds": 1.0,
+        "use_inotify": True
+    },
+    "metrics": {
+        "jsonl_path": "",
+        "prometheus_textfile": "",
+        "prometheus_flush_seconds": 5.0
+    },
+    "daemon": {
+        "host": "127.0.0.1",
+        "port": 8765,
+        "socket": "~/.cache/lyxtomarkdown/daemon.sock",
+        "token_file": "~/.cache/lyxtomarkdown/daemon.token",
+        "workers": 0
+    },
+    "distributed": {
+        "shard_size": 20,
+        "lease_seconds": 120,
+        "poll_seconds": 5
     }
 }
@@ -0,0 +1,314 @@
+import contextlib
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import uuid
+from urllib.parse import unquote
+
+from .cache import hash_file
+from .file_utils import atomic_write_text
+from .markdown_scanner import TEXT
+from .postprocess import PostProcessStep
+
+try:
+    import fcntl
+except ImportError:  # Windows: cross-process locking is unavailable, threads are still serialized.
+    fcntl = None
+
+DEFAULT_ASSET_DIRECTORY = "assets"
+# Insets whose filename parameter names a file the document displays.
+ASSET_INSETS = ("Graphics", "External")
+# Asset names keep this many hex digits of the SHA-256 of their content.
+DIGEST_LENGTH = 16
+# ioctl request that clones a file's extents on Linux (Btrfs, XFS, bcachefs).
+FICLONE = 0x40049409
+
+_INSET_START = re.compile(r'^\\begin_inset (\S+)')
+_FILENAME = re.compile(r'^\s*filename\s+(.+?)\s*$')
+# Link targets in Pandoc's Markdown: ](target), ](<target with spaces>) and src="target", and
+# links whose parentheses were already flipped for right-to-left text: ])target(.
+_LINK_TARGET = re.compile(
+    r'(?P<prefix>\]\(\s*)(?:<(?P<angled>[^>\n]+)>|(?P<bare>[^)\s]+))'
+    r'|\]\)\s*(?:<(?P<flipped_angled>[^>\n]+)>|(?P<flipped>[^(\s]+))\('
+    r'|(?P<src>\bsrc=")(?P<quoted>[^"\n]+)'
+)
+_index_lock = threading.Lock()
+
+
+def find_graphics(lyx_text):
+    """
+    Returns the filenames of the graphics and external files a LyX document references.
+
+    Filenames are returned as written in the document, usually relative to its directory, in
+    order of first appearance.
+    """
+    filenames = []
+    inset = None
+    for line in lyx_text.splitlines():
+        if inset is None:
+            match = _INSET_START.match(line)
+            if match and match.group(1) in ASSET_INSETS:
+                inset = match.group(1)
+            continue
+        if line.startswith("\\end_inset"):
+            inset = None
+            continue
+        match = _FILENAME.match(line)
+        if match:
+            filename = match.group(1)
+            if len(filename) > 1 and filename[0] == filename[-1] == '"':
+                filename = filename[1:-1]
+            if filename not in filenames:
+                filenames.append(filename)
+    return filenames
+
+
+def _reflink(source_path, destination_path):
+    """Creates destination_path as a copy-on-write clone of source_path. Returns False if unsupported."""
+    if sys.platform == "darwin":
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        clonefile = getattr(libc, "clonefile", None)
+        return bool(clonefile) and clonefile(os.fsencode(source_path), os.fsencode(destination_path), 0) == 0
+    if fcntl is None or not hasattr(fcntl, "ioctl"):
+        return False
+    try:
+        with open(source_path, 'rb') as source, open(destination_path, 'wb') as destination:
+            fcntl.ioctl(destination.fileno(), FICLONE, source.fileno())
+        return True
+    except OSError:
+        if os.path.exists(destination_path):
+            os.remove(destination_path)
+        return False
+
+
+def place_file(source_path, destination_path, hardlink=False):
+    """
+    Puts the content of source_path at destination_path atomically, without copying if possible.
+
+    A copy-on-write clone (reflink) is tried first, then a hardlink if allowed, then an
+    ordinary copy. Clones share storage but not changes; a hardlink is the same file as its
+    source.
+
+    Returns:
+        str: "reflink", "hardlink" or "copy".
+    """
+    directory = os.path.dirname(os.path.abspath(destination_path))
+    temporary_path = os.path.join(directory, f".tmp-{uuid.uuid4().hex}")
+    try:
+        method = None
+        if _reflink(source_path, temporary_path):
+            method = "reflink"
+        if method is None and hardlink:
+            try:
+                os.link(source_path, temporary_path)
+                method = "hardlink"
+            except OSError:
+                pass
+        if method is None:
+            shutil.copyfile(source_path, temporary_path)
+            method = "copy"
+        os.replace(temporary_path, destination_path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    return method
+
+
+class AssetStore:
+    """
+    A content-addressed directory of assets shared by every document converted into it.
+
+    Each asset is named after the hash of its content, so an image used by many documents is
+    stored once. The index records the size and modification time of every source file already
+    published, so unchanged files are neither hashed nor placed again on later runs.
+    """
+    INDEX_FILE = "index.json"
+
+    def __init__(self, directory, hardlinks=False, logger=None):
+        """
+        Args:
+            directory (str): The asset directory.
+            hardlinks (bool): Whether assets may be hardlinked to their sources. A hardlinked
+                              asset changes if its source is edited in place rather than replaced.
+            logger (Logger, optional): An instance of the Logger class for logging.
+        """
+        self.directory = directory
+        self.hardlinks = hardlinks
+        self.logger = logger
+
+    def _log(self, message, *args, level="info"):
+        """Helper method to log messages if a logger is available and enabled for the level."""
+        if self.logger and self.logger.is_enabled_for(level):
+            getattr(self.logger, level)(message, *args)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Serializes index access across threads and, where supported, across processes."""
+        with _index_lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, ".lock"), 'a') as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield self._load_index()
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.directory, self.INDEX_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def publish(self, source_paths):
+        """
+        Makes sure every source file has its asset in the store.
+
+        Args:
+            source_paths (list): Absolute paths of existing files.
+
+        Returns:
+            dict: The path of the asset for each source path.
+        """
+        stats = {path: os.stat(path) for path in source_paths}
+        with self._locked() as index:
+            known = {path: index.get(path) for path in source_paths}
+
+        assets = {}
+        updates = {}
+        for path, stat in stats.items():
+            entry = known[path]
+            if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                asset_path = os.path.join(self.directory, entry["name"])
+                if os.path.exists(asset_path):
+                    assets[path] = asset_path
+                    continue
+            name = hash_file(path)[:DIGEST_LENGTH] + os.path.splitext(path)[1].lower()
+            asset_path = os.path.join(self.directory, name)
+            if os.path.exists(asset_path):
+                self._log("%s is already stored as %s.", path, name)
+            else:
+                method = place_file(path, asset_path, self.hardlinks)
+                self._log("Stored %s as %s (%s).", path, name, method)
+            assets[path] = asset_path
+            updates[path] = {"name": name, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+        if updates:
+            with self._locked() as index:
+                index.update(updates)
+                atomic_write_text(os.path.join(self.directory, self.INDEX_FILE), json.dumps(index, indent=1))
+        return assets
+
+
+class AssetLinks(PostProcessStep):
+    """
+    Rewrites the links to a document's graphics so that they point into the asset directory.
+
+    LaTeX exports may write a graphic's path relative to the document, as an absolute path or
+    without its extension, so a link target matches a graphic in any of these forms, or by its
+    file name alone when that is unambiguous. Only text regions are rewritten. The step runs
+    after the parenthesis flip, so links it reversed are recognized and written the right way
+    round.
+    """
+    name = "asset_links"
+
+    def __init__(self, links, document_directory):
+        """
+        Args:
+            links (dict): The Markdown link of each graphic, keyed by its filename as written in
+                          the document.
+            document_directory (str): The directory of the document.
+        """
+        self.links = links
+        self.document_directory = document_directory
+        self._targets = {}
+        names = {}
+        for filename, link in links.items():
+            for name in (os.path.basename(filename), os.path.splitext(os.path.basename(filename))[0]):
+                names.setdefault(name, set()).add(link)
+        for name, targets in names.items():
+            if len(targets) == 1:
+                self._targets[name] = targets.pop()
+        for filename, link in links.items():
+            path = os.path.normpath(os.path.join(document_directory, filename))
+            for key in (filename, os.path.splitext(filename)[0], path, os.path.splitext(path)[0]):
+                self._targets[key] = link
+
+    def link_for(self, target):
+        """Returns the asset link for a link target, or None if it is not one of the graphics."""
+        target = unquote(target)
+        path = os.path.normpath(os.path.join(self.document_directory, target))
+        for key in (target, path, os.path.basename(path)):
+            if key in self._targets:
+                return self._targets[key]
+        return None
+
+    def _replace(self, match):
+        target = next(group for group in match.group("angled", "bare", "flipped_angled", "flipped", "quoted")
+                      if group)
+        link = self.link_for(target)
+        if link is None:
+            return match.group()
+        if match.group("src"):
+            return f'{match.group("src")}{link}'
+        destination = f"<{link}>" if " " in link else link
+        if match.group("prefix"):
+            return f'{match.group("prefix")}{destination}'
+        return f"]({destination})"
+
+    def transform(self, segment, kind):
+        if kind != TEXT or ("](" not in segment and "])" not in segment and "src=" not in segment):
+            return segment
+        return _LINK_TARGET.sub(self._replace, segment)
+
+    def describe(self):
+        return {"name": self.name, "links": sorted(self.links.items())}
+
+
+def collect_assets(lyx_file_path, output_directory, asset_directory=DEFAULT_ASSET_DIRECTORY,
+                   hardlinks=False, logger=None):
+    """
+    Publishes the graphics of a LyX document to its asset directory.
+
+    Args:
+        lyx_file_path (str): The document.
+        output_directory (str): Where its Markdown is written; links are relative to it.
+        asset_directory (str): The asset directory, relative to output_directory or absolute.
+        hardlinks (bool): Whether assets may be hardlinked to their sources.
+        logger (Logger, optional): An instance of the Logger class for logging.
+
+    Returns:
+        AssetLinks: The link rewriting step for the document's Markdown, or None if it has no
+                    graphics.
+    """
+    with open(lyx_file_path, 'rb') as f:
+        lyx_text = f.read().decode('utf-8', errors='surrogateescape')
+    filenames = find_graphics(lyx_text)
+    if not filenames:
+        return None
+
+    document_directory = os.path.dirname(os.path.abspath(lyx_file_path))
+    sources = {}
+    for filename in filenames:
+        path = os.path.normpath(os.path.join(document_directory, filename))
+        if os.path.isfile(path):
+            sources[filename] = path
+        elif logger:
+            logger.warning("Graphic %s referenced by %s not found, its link is left as is.", filename, lyx_file_path)
+    if not sources:
+        return None
+
+    store = AssetStore(os.path.join(output_directory, asset_directory), hardlinks, logger)
+    assets = store.publish(sorted(set(sources.values())))
+    links = {
+        filename: os.path.relpath(assets[path], output_directory).replace(os.sep, "/")
+        for filename, path in sources.items()
+    }
+    return AssetLinks(links, document_directory)
@@ -0,0 +1,311 @@
+import asyncio
+import os
+import signal
+import subprocess
+import time
+
+from .batch import BatchResult, BatchSummary
+from .lyx_converter import STAGE_ERRORS, _size
+from .pandoc_backend import SubprocessPandocBackend, options_to_args
+from .supervision import KILL_GRACE_PERIOD, ConversionTimeout
+from .workspace import Workspace
+
+
+class ProgressEvent:
+    """Reports that a conversion entered, finished or failed a stage."""
+    def __init__(self, lyx_file_path, stage, status, elapsed=0.0, detail=None):
+        """
+        Args:
+            lyx_file_path (str): The document being converted.
+            stage (str): "queued", "cache", "export", "pandoc", "postprocess" or "done".
+            status (str): "started", "finished", "failed", "timeout" or "cancelled".
+            elapsed (float): Seconds since the conversion started.
+            detail (str, optional): Extra information, such as an error message.
+        """
+        self.lyx_file_path = lyx_file_path
+        self.stage = stage
+        self.status = status
+        self.elapsed = elapsed
+        self.detail = detail
+
+    def __repr__(self):
+        return f"ProgressEvent({self.lyx_file_path!r}, {self.stage}, {self.status}, {self.elapsed:.2f}s)"
+
+
+async def _kill_process_group(process):
+    """Terminates a subprocess and everything it started, escalating to SIGKILL if needed."""
+    if process.returncode is not None:
+        return
+    use_group = hasattr(os, "killpg")
+    try:
+        if use_group:
+            os.killpg(process.pid, signal.SIGTERM)
+        else:
+            process.terminate()
+    except ProcessLookupError:
+        return
+    try:
+        await asyncio.wait_for(process.wait(), KILL_GRACE_PERIOD)
+    except asyncio.TimeoutError:
+        try:
+            if use_group:
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+
+class AsyncLyxConverter:
+    """
+    Runs LyxConverter conversions on an asyncio event loop.
+
+    LyX and Pandoc are started with asyncio.create_subprocess_exec in their own process groups.
+    They get the same size-based deadlines and retries as in the wrapped converter, at most
+    max_concurrency conversions run at once, and cancelling a conversion kills the whole
+    process group of the running stage, so a hung LyX never outlives the task that started it.
+    The other stages are shared with LyxConverter and run on worker threads; a cancelled
+    conversion stops waiting for them, but they run to completion.
+    """
+    def __init__(self, converter, max_concurrency=4, logger=None):
+        """
+        Initializes the async converter.
+
+        Args:
+            converter (LyxConverter): Provides the executables, cache, export backend,
+                                      post-processing steps, deadlines, retry policy and
+                                      quarantine.
+            max_concurrency (int): The maximum number of conversions running at once.
+            logger (Logger, optional): An instance of the Logger class for logging.
+        """
+        self.converter = converter
+        self.max_concurrency = max(1, max_concurrency)
+        self.logger = logger
+        self._semaphore = None
+        self._semaphore_loop = None
+
+    def _log(self, message, *args, level="info"):
+        """Helper method to log messages if a logger is available and enabled for the level."""
+        if self.logger and self.logger.is_enabled_for(level):
+            getattr(self.logger, level)(message, *args)
+
+    def _get_semaphore(self):
+        # Created lazily: before Python 3.10 a semaphore is bound to the loop it was created in.
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def convert(self, lyx_file_path, output_directory, on_progress=None, output_path=None):
+        """
+        Converts a LyX file to Markdown.
+
+        Args:
+            lyx_file_path (str): The absolute path to the input .lyx file.
+            output_directory (str): The directory to save the Markdown file in.
+            on_progress (callable, optional): Called with a ProgressEvent whenever a stage starts
+                                              or ends. Coroutine functions are awaited.
+            output_path (str, optional): The Markdown file to write, as in LyxConverter.convert.
+
+        Returns:
+            str: The path to the final Markdown file.
+
+        Raises:
+            ConversionTimeout: If a stage exceeds its timeout.
+            RuntimeError: If LyX or Pandoc fails.
+            asyncio.CancelledError: If the task is cancelled; running processes are killed first.
+        """
+        start = time.monotonic()
+
+        async def report(stage, status, detail=None):
+            if on_progress:
+                result = on_progress(ProgressEvent(lyx_file_path, stage, status, time.monotonic() - start, detail))
+                if asyncio.iscoroutine(result):
+                    await result
+
+        await report("queued", "started")
+        async with self._get_semaphore():
+            try:
+                # The same quarantine and metrics bookkeeping as LyxConverter.convert. The metrics
+                # follow the task, and the stages run on worker threads, through a context variable.
+                with self.converter.supervised(lyx_file_path):
+                    result = await self._convert(lyx_file_path, output_directory, output_path, report)
+            except ConversionTimeout as e:
+                await report(e.stage, "timeout", str(e))
+                raise
+            except asyncio.CancelledError:
+                self._log("Conversion of %s cancelled.", lyx_file_path, level="warning")
+                await asyncio.shield(report("done", "cancelled"))
+                raise
+            except Exception as e:
+                await report("done", "failed", str(e))
+                raise
+            await report("done", "finished", result)
+            return result
+
+    async def _convert(self, lyx_file_path, output_directory, output_path, report):
+        converter = self.converter
+        markdown_file_path, assets = await asyncio.to_thread(
+            converter.prepare, lyx_file_path, output_directory, output_path
+        )
+
+        cache_key = None
+        if converter.cache:
+            await report("cache", "started")
+            cache_key, hit = await asyncio.to_thread(converter.lookup_cache, lyx_file_path, markdown_file_path, assets)
+            await report("cache", "finished", "hit" if hit else "miss")
+            if hit:
+                return markdown_file_path
+
+        try:
+            await report("export", "started")
+            latex = await self._export(lyx_file_path)
+            await report("export", "finished")
+
+            await report("pandoc", "started")
+            markdown = await self._pandoc(latex, lyx_file_path)
+            await report("pandoc", "finished")
+        except STAGE_ERRORS as e:
+            raise converter.conversion_error(e)
+
+        # Post-processing works in memory on a thread, which could not be interrupted by a timeout.
+        await report("postprocess", "started")
+        await asyncio.to_thread(converter.finish, lyx_file_path, markdown, markdown_file_path, assets, cache_key)
+        await report("postprocess", "finished")
+        return markdown_file_path
+
+    async def _export(self, lyx_file_path):
+        converter = self.converter
+        if converter.export_backend == "native":
+            latex = await asyncio.to_thread(converter._export_native, lyx_file_path)
+            if latex is not None:
+                return latex
+
+        self._log("Exporting %s to LaTeX...", lyx_file_path)
+        with Workspace(lyx_file_path, converter.scratch_directory) as workspace:
+            timeout = converter._deadline("export", _size(workspace.lyx_path) or 0)
+            await self._attempt("export", lyx_file_path, lambda: self._run(
+                "export", lyx_file_path, [converter.lyx_executable, "--export", "latex", workspace.lyx_path], timeout
+            ))
+            if not os.path.exists(workspace.tex_path):
+                raise FileNotFoundError(f"Expected .tex file not found: {workspace.tex_path}")
+            return await asyncio.to_thread(converter._convert_encoding_to_utf8, workspace.tex_path)
+
+    async def _pandoc(self, latex, lyx_file_path):
+        converter = self.converter
+        backend = converter.pandoc_backend
+        timeout = converter._deadline("pandoc", len(latex))
+        if not isinstance(backend, SubprocessPandocBackend):
+            # Other backends (such as the pandoc server pool) are blocking clients, run on a worker
+            # thread. A thread cannot be cancelled, so the client itself is given the deadline.
+            async def request():
+                try:
+                    return await asyncio.to_thread(backend.convert, latex, converter.PANDOC_OPTIONS, timeout)
+                except subprocess.TimeoutExpired as e:
+                    raise ConversionTimeout("pandoc", e.timeout, lyx_file_path)
+            return await self._attempt("pandoc", lyx_file_path, request)
+        self._log("Converting LaTeX to Markdown using Pandoc (async subprocess)...")
+        try:
+            stdout = await self._attempt("pandoc", lyx_file_path, lambda: self._run(
+                "pandoc", lyx_file_path, [backend.pandoc_executable, *options_to_args(converter.PANDOC_OPTIONS)],
+                timeout, input_data=latex.encode('utf-8')
+            ))
+        except subprocess.CalledProcessError as e:
+            stderr = (e.stderr or b"").decode('utf-8', errors='replace')
+            self._log("Pandoc failed with exit code %s. Stderr: %s", e.returncode, stderr, level="error")
+            raise
+        return stdout.decode('utf-8', errors='replace')
+
+    async def _attempt(self, stage, lyx_file_path, function):
+        """Awaits function(), retrying it under the converter's retry policy if it times out or crashes."""
+        retry_policy = self.converter.retry_policy
+        if retry_policy:
+            return await retry_policy.call_async(function, f"{stage} stage of {lyx_file_path}", self.logger)
+        return await function()
+
+    async def _run(self, stage, lyx_file_path, args, timeout, input_data=None):
+        """
+        Runs a subprocess in its own process group and returns its stdout.
+
+        The whole group is killed if it runs past timeout seconds or the task is cancelled.
+        """
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=asyncio.subprocess.PIPE if input_data is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(input_data), timeout)
+        except asyncio.TimeoutError:
+            await asyncio.shield(_kill_process_group(process))
+            self._log("The %s stage of %s ran past its %ss deadline and was killed.",
+                      stage, lyx_file_path, timeout, level="warning")
+            raise ConversionTimeout(stage, timeout, lyx_file_path)
+        except BaseException:
+            # Cancelled or failed: never leave the process group behind.
+            await asyncio.shield(_kill_process_group(process))
+            raise
+        if process.returncode != 0:
+            if stage == "export":
+                self._log("LyX export failed with exit code %s. Stderr: %s",
+                          process.returncode, stderr.decode("utf-8", errors="replace"), level="error")
+            raise subprocess.CalledProcessError(process.returncode, args, output=stdout, stderr=stderr)
+        return stdout
+
+    async def convert_batch(self, jobs, on_result=None, on_progress=None):
+        """
+        Converts many files concurrently, bounded by max_concurrency.
+
+        A fixed set of max_concurrency workers takes the jobs from a bounded queue, so a large
+        batch never holds more than a few pending conversions in memory.
+
+        Args:
+            jobs (list): (lyx_file_path, output_directory) pairs, e.g. from BatchConverter.plan, or
+                         (lyx_file_path, output_directory, output_path) triples from read_manifest.
+            on_result (callable, optional): Called with each BatchResult as it completes.
+            on_progress (callable, optional): Passed to convert for every file.
+
+        Returns:
+            BatchSummary: The results and timings of the whole batch.
+        """
+        summary = BatchSummary()
+        start = time.perf_counter()
+
+        async def run(lyx_file_path, output_directory, requested_path=None):
+            job_start = time.perf_counter()
+            try:
+                output_path = await self.convert(lyx_file_path, output_directory, on_progress, requested_path)
+                result = BatchResult(lyx_file_path, output_path=output_path,
+                                     duration=time.perf_counter() - job_start)
+            except Exception as e:
+                result = BatchResult(lyx_file_path, error=str(e), duration=time.perf_counter() - job_start)
+            summary.add(result)
+            if on_result:
+                on_result(result)
+
+        pending = asyncio.Queue(maxsize=self.max_concurrency)
+
+        async def worker():
+            while True:
+                job = await pending.get()
+                if job is None:
+                    return
+                await run(*job)
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(self.max_concurrency)]
+        try:
+            for job in jobs:
+                await pending.put(job)
+            for _ in workers:
+                await pending.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+        summary.wall_time = time.perf_counter() - start
+        self._log(summary.format())
+        return summary
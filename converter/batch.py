@@ -0,0 +1,356 @@
+import csv
+import glob
+import io
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+def collect_lyx_files(source):
+    """
+    Expands a batch source into the .lyx files it refers to.
+
+    Args:
+        source (str): A single .lyx file, a directory (searched recursively) or a glob pattern.
+
+    Returns:
+        list: Tuples of (lyx_file_path, root_directory), sorted by path. The root directory is
+              used to mirror the input tree layout in the output directory.
+    """
+    root = source_root(source)
+    if os.path.isdir(source):
+        paths = glob.glob(os.path.join(root, "**", "*.lyx"), recursive=True)
+    elif glob.has_magic(source):
+        paths = [p for p in glob.glob(source, recursive=True) if os.path.isfile(p)]
+    else:
+        paths = [source]
+
+    return sorted((os.path.abspath(p), root) for p in paths)
+
+
+def source_root(source):
+    """Returns the directory whose layout is mirrored for a file, directory or glob source."""
+    if os.path.isdir(source):
+        return os.path.abspath(source)
+    if glob.has_magic(source):
+        return _glob_root(source)
+    return os.path.dirname(os.path.abspath(source))
+
+
+def output_directory_for(lyx_file_path, root, output_directory):
+    """
+    Returns where the Markdown for lyx_file_path is written.
+
+    The layout below root is mirrored inside output_directory. When output_directory is None,
+    the file is written next to its source.
+    """
+    if output_directory is None:
+        return os.path.dirname(lyx_file_path)
+    relative_dir = os.path.relpath(os.path.dirname(lyx_file_path), root)
+    return os.path.normpath(os.path.join(output_directory, relative_dir))
+
+
+def read_manifest(manifest, base_directory=None):
+    """
+    Reads a manifest that maps inputs to outputs into batch jobs.
+
+    A JSON manifest is either an object {"input": "output", ...} or a list of
+    {"input": ..., "output": ...} objects. A CSV manifest has an input and an optional output
+    column, with or without an "input,output" header. An input may be a file, directory or
+    glob pattern. An output ending in ".md" names the Markdown file of a single input; any other
+    output is a directory in which the input's layout is mirrored. A missing output writes next
+    to the input. Relative paths are resolved against base_directory.
+
+    Args:
+        manifest (str): The manifest text.
+        base_directory (str, optional): Defaults to the current directory.
+
+    Returns:
+        list: (lyx_file_path, output_directory, output_path) jobs; output_path is None unless
+              the manifest names the Markdown file.
+
+    Raises:
+        ValueError: If the manifest cannot be parsed or an entry has no input.
+    """
+    base_directory = base_directory or os.getcwd()
+    stripped = manifest.lstrip()
+    if stripped.startswith(("[", "{")):
+        try:
+            data = json.loads(manifest)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON manifest: {e}")
+        if isinstance(data, dict):
+            entries = list(data.items())
+        else:
+            entries = [(entry.get("input"), entry.get("output")) if isinstance(entry, dict) else (entry, None)
+                       for entry in data]
+    else:
+        rows = [row for row in csv.reader(io.StringIO(manifest)) if row and any(cell.strip() for cell in row)]
+        if rows and [cell.strip().lower() for cell in rows[0][:2]] in (["input", "output"], ["input"]):
+            rows = rows[1:]
+        entries = [(row[0].strip(), row[1].strip() if len(row) > 1 and row[1].strip() else None) for row in rows]
+
+    def resolve(path):
+        return os.path.join(base_directory, os.path.expanduser(path))
+
+    jobs = []
+    for index, (source, output) in enumerate(entries, 1):
+        if not source:
+            raise ValueError(f"Manifest entry {index} has no input.")
+        source = resolve(source)
+        output = resolve(output) if output else None
+        if output and output.endswith(".md"):
+            jobs.append((os.path.abspath(source), os.path.dirname(os.path.abspath(output)), os.path.abspath(output)))
+            continue
+        for lyx_file_path, root in collect_lyx_files(source):
+            jobs.append((lyx_file_path, output_directory_for(lyx_file_path, root, output), None))
+    return jobs
+
+
+def _glob_root(pattern):
+    """Returns the longest leading directory of a glob pattern that contains no wildcards."""
+    parts = []
+    for part in os.path.dirname(pattern).split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return os.path.abspath(os.sep.join(parts) or os.curdir)
+
+
+class BatchResult:
+    """The outcome of converting a single file as part of a batch."""
+    def __init__(self, lyx_file_path, output_path=None, error=None, duration=0.0):
+        """
+        Args:
+            lyx_file_path (str): The input .lyx file.
+            output_path (str, optional): The generated Markdown file, if the conversion succeeded,
+                                         or a dict of files per format for multi-format batches.
+            error (str, optional): The error message, if the conversion failed.
+            duration (float): Wall-clock seconds spent converting this file.
+        """
+        self.lyx_file_path = lyx_file_path
+        self.output_path = output_path
+        self.error = error
+        self.duration = duration
+
+    @property
+    def succeeded(self):
+        return self.error is None
+
+    def __repr__(self):
+        status = "ok" if self.succeeded else f"failed: {self.error}"
+        return f"BatchResult({self.lyx_file_path!r}, {status}, {self.duration:.2f}s)"
+
+
+class BatchSummary:
+    """Aggregates the results of a batch run."""
+    def __init__(self):
+        self.results = []
+        self.wall_time = 0.0
+
+    def add(self, result):
+        self.results.append(result)
+
+    @property
+    def succeeded(self):
+        return [r for r in self.results if r.succeeded]
+
+    @property
+    def failed(self):
+        return [r for r in self.results if not r.succeeded]
+
+    def format(self):
+        """Returns a human-readable multi-line summary of the batch."""
+        durations = [r.duration for r in self.results]
+        lines = [
+            f"Converted {len(self.succeeded)} of {len(self.results)} files "
+            f"({len(self.failed)} failed) in {self.wall_time:.2f}s."
+        ]
+        if durations:
+            lines.append(
+                f"Per-file time: mean {sum(durations) / len(durations):.2f}s, "
+                f"max {max(durations):.2f}s, total {sum(durations):.2f}s."
+            )
+        for result in self.failed:
+            lines.append(f"  FAILED {result.lyx_file_path}: {result.error}")
+        return "\n".join(lines)
+
+
+def _convert_job(converter, lyx_file_path, output_directory, requested_path=None, formats=None):
+    """Converts one file and captures any failure, so a bad file never aborts the batch."""
+    start = time.perf_counter()
+    try:
+        if formats:
+            # Every format is written to the output directory under its own name.
+            output_path = converter.convert(lyx_file_path=lyx_file_path, output_directory=output_directory,
+                                            formats=formats)
+        else:
+            # A Markdown file named in a manifest is written in place, never via the default name.
+            output_path = converter.convert(lyx_file_path=lyx_file_path, output_directory=output_directory,
+                                            output_path=requested_path)
+        return BatchResult(lyx_file_path, output_path=output_path, duration=time.perf_counter() - start)
+    except Exception as e:
+        return BatchResult(lyx_file_path, error=str(e), duration=time.perf_counter() - start)
+
+
+class BatchConverter:
+    """Converts many LyX files concurrently using a single configured LyxConverter."""
+    def __init__(self, converter, max_workers=None, use_processes=False, logger=None, formats=None):
+        """
+        Initializes the batch converter.
+
+        Args:
+            converter (LyxConverter): The converter used for every file. It must be picklable
+                                      when use_processes is True.
+            max_workers (int, optional): The maximum number of concurrent conversions.
+                                         Defaults to the number of CPUs.
+            use_processes (bool): Use a process pool instead of a thread pool. Threads are usually
+                                  sufficient because most of the time is spent in LyX and Pandoc.
+            logger (Logger, optional): An instance of the Logger class for logging.
+            formats (list, optional): Pandoc output formats every file is rendered to, from a
+                                      single export (see LyxConverter.convert).
+        """
+        self.converter = converter
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.use_processes = use_processes
+        self.logger = logger
+        self.formats = formats
+
+    def _log(self, message, *args, level="info"):
+        """Helper method to log messages if a logger is available and enabled for the level."""
+        if self.logger and self.logger.is_enabled_for(level):
+            getattr(self.logger, level)(message, *args)
+
+    def plan(self, sources, output_directory):
+        """
+        Resolves batch sources into (input, output directory) jobs.
+
+        The directory layout below each source root is mirrored inside output_directory. When
+        output_directory is None, each file is written next to its source.
+        Files matched by more than one source are only converted once.
+        """
+        jobs = []
+        seen = set()
+        for source in sources:
+            for lyx_file_path, root in collect_lyx_files(source):
+                if lyx_file_path in seen:
+                    continue
+                seen.add(lyx_file_path)
+                jobs.append((lyx_file_path, output_directory_for(lyx_file_path, root, output_directory)))
+        return jobs
+
+    def iter_convert(self, sources, output_directory):
+        """
+        Converts every file in the given sources, yielding results as they complete.
+
+        Args:
+            sources (list): Files, directories or glob patterns to convert.
+            output_directory (str): The root directory for the generated Markdown files, or None
+                                    to write each file next to its source.
+
+        Yields:
+            BatchResult: One result per input file, in completion order.
+        """
+        return self.iter_jobs(self.plan(sources, output_directory))
+
+    def iter_jobs(self, jobs, stop=None):
+        """
+        Runs planned jobs, yielding results as they complete.
+
+        At most max_workers * 2 jobs are submitted to the pool at any time, so very large
+        batches do not queue thousands of pending futures up front.
+
+        Args:
+            jobs (iterable): (lyx_file_path, output_directory) pairs, as returned by plan, or
+                             (lyx_file_path, output_directory, output_path) triples, as returned
+                             by read_manifest.
+            stop (callable, optional): Checked after each result. Once it returns True, jobs that
+                                       have not started are dropped and only the running ones
+                                       are waited for.
+
+        Yields:
+            BatchResult: One result per job, in completion order.
+        """
+        jobs = iter(jobs)
+        executor_class = ThreadPoolExecutor
+        if self.use_processes:
+            # Imported here because it pulls in multiprocessing, which thread pools do not need.
+            from concurrent.futures import ProcessPoolExecutor
+            executor_class = ProcessPoolExecutor
+        self._log("Starting batch conversion with %s %s.",
+                  self.max_workers, "processes" if self.use_processes else "threads")
+
+        executor_options = {}
+        if self.use_processes and hasattr(self.logger, "process_initializer"):
+            # Workers send their log records to this process instead of writing the log file themselves.
+            initializer, initargs = self.logger.process_initializer()
+            if initializer:
+                executor_options = {"initializer": initializer, "initargs": initargs}
+
+        with executor_class(max_workers=self.max_workers, **executor_options) as executor:
+            pending = {}
+
+            def submit_next():
+                job = next(jobs, None)
+                if job is None:
+                    return False
+                future = executor.submit(_convert_job, self.converter, *job, formats=self.formats)
+                pending[future] = job[0]
+                return True
+
+            while len(pending) < self.max_workers * 2 and submit_next():
+                pass
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    lyx_file_path = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # Only reached when the worker itself dies, e.g. a crashed child process.
+                        result = BatchResult(lyx_file_path, error=f"Worker failed: {e}")
+                    if result.succeeded:
+                        self._log("Converted %s in %.2fs", result.lyx_file_path, result.duration)
+                    else:
+                        self._log("Failed to convert %s: %s", result.lyx_file_path, result.error, level="error")
+                    yield result
+                    if stop is not None and stop():
+                        for future in [future for future in pending if future.cancel()]:
+                            del pending[future]
+                    else:
+                        submit_next()
+
+    def convert(self, sources, output_directory, on_result=None):
+        """
+        Converts every file in the given sources and returns a summary.
+
+        Args:
+            sources (list): Files, directories or glob patterns to convert.
+            output_directory (str): The root directory for the generated Markdown files, or None
+                                    to write each file next to its source.
+            on_result (callable, optional): Called with each BatchResult as it completes.
+
+        Returns:
+            BatchSummary: The results and timings of the whole batch.
+        """
+        return self.convert_jobs(self.plan(sources, output_directory), on_result)
+
+    def convert_jobs(self, jobs, on_result=None, stop=None):
+        """
+        Runs planned jobs (see iter_jobs) and returns a summary.
+
+        Returns:
+            BatchSummary: The results and timings of the whole batch, or of the jobs that ran
+                          before stop returned True.
+        """
+        summary = BatchSummary()
+        start = time.perf_counter()
+        for result in self.iter_jobs(jobs, stop):
+            summary.add(result)
+            if on_result:
+                on_result(result)
+        summary.wall_time = time.perf_counter() - start
+        self._log(summary.format())
+        return summary
@@ -0,0 +1,351 @@
+import atexit
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from .file_utils import atomic_copy_file, atomic_write_text
+
+try:
+    import fcntl
+except ImportError:  # Windows: cross-process locking is unavailable, threads are still serialized.
+    fcntl = None
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "lyxtomarkdown", "conversions")
+# Seconds between writes of the hit/miss counters by a long-running process, such as the daemon.
+STATS_FLUSH_INTERVAL = 30
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """Returns the SHA-256 hex digest of a file's contents, reading it in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def executable_fingerprint(path):
+    """
+    Identifies an executable without running it.
+
+    The resolved path, size and modification time change whenever the tool is upgraded or
+    replaced, so they stand in for its version when building cache keys.
+    """
+    try:
+        real_path = os.path.realpath(path)
+        stat = os.stat(real_path)
+        return f"{real_path}:{stat.st_size}:{stat.st_mtime_ns}"
+    except OSError:
+        return f"{path}:missing"
+
+
+class ConversionCache:
+    """
+    A size-bounded, content-addressed on-disk cache of converted Markdown files.
+
+    Lookups never take a lock: an entry is a file named after its key, and a hit only copies it
+    and touches its modification time, which is what eviction orders by. The index of entry
+    sizes and sources is only locked and rewritten when entries are stored or removed, and the
+    hit/miss counters are kept in memory and written to a separate small file from time to time.
+    """
+    INDEX_FILE = "index.json"
+    STATS_FILE = "stats.json"
+
+    def __init__(self, cache_dir=None, max_bytes=512 * 1024 * 1024, logger=None):
+        """
+        Initializes the cache.
+
+        Args:
+            cache_dir (str, optional): The directory holding cached files. Defaults to
+                                       ~/.cache/lyxtomarkdown/conversions.
+            max_bytes (int): The total size above which least recently used entries are evicted.
+            logger (Logger, optional): An instance of the Logger class for logging.
+        """
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._counter_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._last_flush = time.monotonic()
+        # Copies sent to worker processes flush after every lookup, since they are discarded
+        # after their job; the original flushes periodically and when the process exits.
+        self._flush_interval = STATS_FLUSH_INTERVAL
+        atexit.register(self.flush)
+
+    def __getstate__(self):
+        # Locks cannot be pickled; each worker process creates its own. Counts stay with the
+        # original, so they are not flushed twice.
+        state = self.__dict__.copy()
+        state.update(_lock=None, _counter_lock=None, _hits=0, _misses=0, _flush_interval=0)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._counter_lock = threading.Lock()
+
+    def _log(self, message, *args, level="info"):
+        """Helper method to log messages if a logger is available and enabled for the level."""
+        if self.logger and self.logger.is_enabled_for(level):
+            getattr(self.logger, level)(message, *args)
+
+    def make_key(self, lyx_file_path, toolchain, settings):
+        """
+        Builds the cache key for a conversion.
+
+        Args:
+            lyx_file_path (str): The input .lyx file; its bytes are hashed.
+            toolchain (dict): Identifies the LyX and Pandoc versions in use.
+            settings (dict): Every setting that affects the generated Markdown.
+
+        Returns:
+            str: A hex digest that changes whenever the input, toolchain or settings change.
+        """
+        return self._key(hash_file(lyx_file_path), toolchain, settings)
+
+    def make_text_key(self, text, toolchain, settings):
+        """Builds a cache key like make_key, for input held in memory rather than in a file."""
+        return self._key(hashlib.sha256(text.encode('utf-8')).hexdigest(), toolchain, settings)
+
+    def _key(self, content_digest, toolchain, settings):
+        digest = hashlib.sha256()
+        digest.update(content_digest.encode())
+        digest.update(json.dumps({"toolchain": toolchain, "settings": settings}, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.md")
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, self.INDEX_FILE)
+
+    def _stats_path(self):
+        return os.path.join(self.cache_dir, self.STATS_FILE)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Serializes index updates across threads and, where supported, across processes."""
+        with self._lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(os.path.join(self.cache_dir, ".lock"), 'a') as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_index(self):
+        index = {"entries": {}}
+        try:
+            with open(self._index_path(), 'r', encoding='utf-8') as f:
+                index.update(json.load(f))
+        except (OSError, json.JSONDecodeError):
+            pass
+        return index
+
+    def _save_index(self, index):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".index-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(index, f)
+            os.replace(tmp_path, self._index_path())
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _load_stats(self):
+        stats = {"hits": 0, "misses": 0}
+        try:
+            with open(self._stats_path(), 'r', encoding='utf-8') as f:
+                stats.update(json.load(f))
+        except (OSError, json.JSONDecodeError):
+            pass
+        return stats
+
+    def _count(self, hit):
+        """Counts a lookup in memory, flushing the counts when they are due."""
+        with self._counter_lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+            due = time.monotonic() - self._last_flush >= self._flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Adds the lookups counted in memory to the cache's statistics file."""
+        with self._counter_lock:
+            hits, misses = self._hits, self._misses
+            self._hits = self._misses = 0
+            self._last_flush = time.monotonic()
+        if not hits and not misses:
+            return
+        try:
+            with self._locked():
+                stats = self._load_stats()
+                stats["hits"] += hits
+                stats["misses"] += misses
+                atomic_write_text(self._stats_path(), json.dumps(stats))
+        except OSError as e:
+            self._log("Could not save cache statistics: %s", e, level="warning")
+
+    def _touch(self, entry_path):
+        """Marks an entry as recently used."""
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+
+    def get(self, key, destination_path):
+        """
+        Copies the cached Markdown for key to destination_path, if present.
+
+        The copy is renamed into place, so readers never observe a partially written file.
+
+        Returns:
+            bool: True on a cache hit.
+        """
+        entry_path = self._entry_path(key)
+        try:
+            atomic_copy_file(entry_path, destination_path)
+        except FileNotFoundError:
+            self._count(False)
+            return False
+        except OSError as e:
+            self._log("Could not restore cache entry %s: %s", key, e, level="warning")
+            self._count(False)
+            return False
+        self._touch(entry_path)
+        self._count(True)
+        return True
+
+    def put(self, key, markdown_file_path, source_path=None):
+        """
+        Stores a converted Markdown file under key and evicts old entries if over budget.
+
+        Args:
+            key (str): The key returned by make_key.
+            markdown_file_path (str): The converted file to store.
+            source_path (str, optional): The .lyx file it came from, used by invalidate.
+        """
+        entry_path = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        # Entries are content-addressed, so concurrent writers of one key write the same bytes.
+        atomic_copy_file(markdown_file_path, entry_path)
+        self._add_entry(key, entry_path, source_path)
+
+    def get_text(self, key):
+        """
+        Returns the cached text for key, or None on a miss.
+
+        Used for partial results, such as the Markdown of a single section.
+        """
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'r', encoding='utf-8', newline='') as f:
+                text = f.read()
+        except FileNotFoundError:
+            self._count(False)
+            return None
+        except OSError as e:
+            self._log("Could not read cache entry %s: %s", key, e, level="warning")
+            self._count(False)
+            return None
+        self._touch(entry_path)
+        self._count(True)
+        return text
+
+    def put_text(self, key, text, source_path=None):
+        """Stores text under key, like put, and evicts old entries if over budget."""
+        entry_path = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        atomic_write_text(entry_path, text)
+        self._add_entry(key, entry_path, source_path)
+
+    def _add_entry(self, key, entry_path, source_path):
+        """Records a stored entry in the index and evicts old entries if over budget."""
+        entry = {
+            "size": os.path.getsize(entry_path),
+            "last_used": time.time(),
+            "source": os.path.abspath(source_path) if source_path else None,
+        }
+        with self._locked():
+            index = self._load_index()
+            index["entries"][key] = entry
+            self._evict(index)
+            self._save_index(index)
+
+    def _last_used(self, key, entry):
+        """Returns when an entry was last used: its modification time, which every hit updates."""
+        try:
+            return os.stat(self._entry_path(key)).st_mtime
+        except OSError:
+            return entry["last_used"]
+
+    def _evict(self, index):
+        """Removes least recently used entries until the cache fits in max_bytes."""
+        total = sum(entry["size"] for entry in index["entries"].values())
+        if total <= self.max_bytes:
+            return
+        last_used = {key: self._last_used(key, entry) for key, entry in index["entries"].items()}
+        for key, entry in sorted(index["entries"].items(), key=lambda item: last_used[item[0]]):
+            if total <= self.max_bytes:
+                break
+            self._remove_entry(index, key)
+            total -= entry["size"]
+            self._log("Evicted cache entry %s (%s bytes)", key, entry["size"])
+
+    def _remove_entry(self, index, key):
+        index["entries"].pop(key, None)
+        try:
+            os.remove(self._entry_path(key))
+        except OSError:
+            pass
+
+    def invalidate(self, source_paths=None):
+        """
+        Removes cached conversions.
+
+        Args:
+            source_paths (list, optional): Only remove entries converted from these .lyx files.
+                                           If omitted, the whole cache is cleared.
+
+        Returns:
+            int: The number of entries removed.
+        """
+        with self._locked():
+            index = self._load_index()
+            if source_paths is None:
+                keys = list(index["entries"])
+            else:
+                wanted = {os.path.abspath(p) for p in source_paths}
+                keys = [k for k, e in index["entries"].items() if e.get("source") in wanted]
+            for key in keys:
+                self._remove_entry(index, key)
+            self._save_index(index)
+        self._log("Invalidated %s cache entries.", len(keys))
+        return len(keys)
+
+    def stats(self):
+        """Returns cumulative hit/miss counts and the current size of the cache."""
+        self.flush()
+        with self._locked():
+            index = self._load_index()
+            stats = self._load_stats()
+            return {
+                "hits": stats["hits"],
+                "misses": stats["misses"],
+                "entries": len(index["entries"]),
+                "size_bytes": sum(entry["size"] for entry in index["entries"].values()),
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,716 @@
+import collections
+import heapq
+import hmac
+import http.client
+import itertools
+import json
+import os
+import secrets
+import socket
+import socketserver
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from .batch import _convert_job
+from .lyx_converter import LyxConverter
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_SOCKET = os.path.join(os.path.expanduser("~"), ".cache", "lyxtomarkdown", "daemon.sock")
+# Holds the secret that TCP clients must send; readable only by the daemon's user.
+DEFAULT_TOKEN_FILE = os.path.join(os.path.expanduser("~"), ".cache", "lyxtomarkdown", "daemon.token")
+# Host headers accepted over TCP, besides the address the daemon is bound to. Anything else is a
+# browser that was pointed at the daemon by DNS rebinding.
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "[::1]")
+# Finished jobs kept for status queries; older ones are forgotten first.
+JOB_HISTORY = 1000
+# Longest a single request may block waiting for a job, in seconds.
+MAX_WAIT = 300
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+def parse_address(address):
+    """
+    Parses a daemon address.
+
+    Args:
+        address (str): "host:port" for localhost HTTP, or the path of a Unix socket (anything
+                       containing a path separator, or prefixed with "unix:").
+
+    Returns:
+        tuple: ("unix", socket_path) or ("tcp", host, port).
+
+    Raises:
+        ValueError: If the address is neither.
+    """
+    if address.startswith("unix:"):
+        return ("unix", os.path.abspath(address[len("unix:"):]))
+    if os.sep in address:
+        return ("unix", os.path.abspath(address))
+    host, _, port = address.rpartition(":")
+    if not port.isdigit():
+        raise ValueError(f"Invalid daemon address {address!r}; expected host:port or a socket path.")
+    return ("tcp", host or DEFAULT_HOST, int(port))
+
+
+def address_from_config(daemon_config):
+    """
+    Returns the address configured in the "daemon" section of config.json.
+
+    The owner-only Unix socket is used unless "socket" is set to "", which selects TCP.
+    """
+    if daemon_config["socket"]:
+        return ("unix", os.path.abspath(os.path.expanduser(daemon_config["socket"])))
+    return ("tcp", daemon_config["host"], daemon_config["port"])
+
+
+def load_token(token_file=None, create=False):
+    """
+    Reads the secret that authenticates TCP clients.
+
+    Args:
+        token_file (str, optional): Defaults to DEFAULT_TOKEN_FILE.
+        create (bool): Create the file with a new random token, readable only by the current
+                       user, if it does not exist. The daemon does; clients only read it.
+
+    Returns:
+        str: The token.
+
+    Raises:
+        OSError: If the file cannot be read (or created).
+        ValueError: If the file is empty.
+    """
+    token_file = os.path.expanduser(token_file or DEFAULT_TOKEN_FILE)
+    if create:
+        os.makedirs(os.path.dirname(os.path.abspath(token_file)), mode=0o700, exist_ok=True)
+        try:
+            fd = os.open(token_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(secrets.token_urlsafe(32) + "\n")
+    with open(token_file, 'r', encoding='utf-8') as f:
+        token = f.read().strip()
+    if not token:
+        raise ValueError(f"The daemon token file {token_file} is empty.")
+    return token
+
+
+class Job:
+    """A conversion submitted to the daemon."""
+    def __init__(self, lyx_file_path, output_directory, output_path=None, priority=0, formats=None):
+        """
+        Args:
+            lyx_file_path (str): The input .lyx file.
+            output_directory (str): Where the output is written.
+            output_path (str, optional): The Markdown file to write, if it has a different name.
+            priority (int): Jobs with a higher priority run first.
+            formats (list, optional): Pandoc output formats, as for LyxConverter.convert.
+        """
+        self.id = uuid.uuid4().hex[:12]
+        self.lyx_file_path = lyx_file_path
+        self.output_directory = output_directory
+        self.output_path = output_path
+        self.priority = priority
+        self.formats = formats
+        self.status = QUEUED
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.output = None
+        self.error = None
+        self.duration = None
+
+    @property
+    def key(self):
+        """Identifies jobs that would produce the same files."""
+        return (self.lyx_file_path, self.output_directory, self.output_path, tuple(self.formats or ()))
+
+    @property
+    def done(self):
+        return self.status in FINISHED_STATES
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "input": self.lyx_file_path,
+            "output_directory": self.output_directory,
+            "priority": self.priority,
+            "formats": self.formats,
+            "status": self.status,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+            "output": self.output,
+            "error": self.error,
+            "duration": None if self.duration is None else round(self.duration, 3),
+        }
+
+
+class ConversionDaemon:
+    """
+    Runs submitted conversions on a bounded pool of worker threads, highest priority first.
+
+    The daemon holds one converter for its whole life, so its Pandoc servers, conversion cache,
+    compiled post-processing rules and asset index stay warm between jobs. A job submitted while
+    an identical one is still queued is merged into it.
+    """
+    def __init__(self, converter, max_workers=None, formats=None, logger=None):
+        """
+        Args:
+            converter (LyxConverter): The converter used for every job, or an IncrementalConverter.
+            max_workers (int, optional): The number of jobs run at once. Defaults to the number
+                                         of CPUs.
+            formats (list, optional): Output formats for jobs that do not name their own.
+            logger (Logger, optional): An instance of the Logger class for logging.
+        """
+        self.converter = converter
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.formats = formats
+        self.logger = logger
+        self.started = time.time()
+        self._condition = threading.Condition()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._jobs = {}
+        self._queued = {}
+        self._history = collections.deque()
+        self._running = 0
+        self._counts = {DONE: 0, FAILED: 0, CANCELLED: 0}
+        self._closed = False
+        self._workers = []
+
+    def _log(self, message, *args, level="info"):
+        """Helper method to log messages if a logger is available and enabled for the level."""
+        if self.logger and self.logger.is_enabled_for(level):
+            getattr(self.logger, level)(message, *args)
+
+    def start(self):
+        """Starts the worker threads."""
+        for index in range(self.max_workers):
+            worker = threading.Thread(target=self._work, name=f"daemon-worker-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        self._log("Conversion daemon started with %s workers.", self.max_workers)
+
+    def submit(self, lyx_file_path, output_directory=None, output_path=None, priority=0, formats=None):
+        """
+        Queues a conversion.
+
+        Args:
+            lyx_file_path (str): Absolute path of the input .lyx file.
+            output_directory (str, optional): Absolute path of the output directory. Defaults to
+                                              the input's directory.
+            output_path (str, optional): Absolute path of the Markdown file, if it has a
+                                         different name.
+            priority (int): Jobs with a higher priority run first.
+            formats (list, optional): Output formats. Defaults to the daemon's formats.
+
+        Returns:
+            Job: The new job, or the queued job it was merged into.
+
+        Raises:
+            ValueError: If a path is relative, output_path is not a .md file or a format is not
+                        supported.
+            RuntimeError: If the daemon is shutting down.
+        """
+        for path in (lyx_file_path, output_directory, output_path):
+            if path is not None and not os.path.isabs(path):
+                raise ValueError(f"Paths sent to the daemon must be absolute: {path}")
+        if output_path is not None and not output_path.endswith(".md"):
+            # Clients may only name Markdown files, not overwrite arbitrary files of the daemon's user.
+            raise ValueError(f"The output path must be a .md file: {output_path}")
+        if output_directory is None:
+            output_directory = os.path.dirname(output_path or lyx_file_path)
+        formats = list(formats or self.formats or []) or None
+        if formats:
+            if not hasattr(self.converter, "output_paths_for"):
+                raise ValueError("This daemon converts incrementally and writes a single Markdown file.")
+            if output_path:
+                raise ValueError("Jobs with output formats are written to their output directory.")
+            LyxConverter.output_paths_for(lyx_file_path, output_directory, formats)
+
+        job = Job(lyx_file_path, output_directory, output_path, priority, formats)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The daemon is shutting down.")
+            queued = self._queued.get(job.key)
+            if queued is not None:
+                if priority > queued.priority:
+                    queued.priority = priority
+                    heapq.heappush(self._queue, (-priority, next(self._sequence), queued))
+                return queued
+            self._jobs[job.id] = job
+            self._queued[job.key] = job
+            heapq.heappush(self._queue, (-priority, next(self._sequence), job))
+            self._condition.notify()
+        self._log("Queued job %s for %s (priority %s).", job.id, lyx_file_path, priority)
+        return job
+
+    def _next_job(self):
+        """Waits for the highest priority queued job. Returns None once the daemon is closed."""
+        with self._condition:
+            while True:
+                while self._queue:
+                    negative_priority, _, job = heapq.heappop(self._queue)
+                    # Entries left behind by cancelled jobs and by jobs whose priority was raised.
+                    if job.status == QUEUED and -negative_priority == job.priority:
+                        del self._queued[job.key]
+                        job.status = RUNNING
+                        job.started = time.time()
+                        self._running += 1
+                        return job
+                if self._closed:
+                    return None
+                self._condition.wait()
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            result = _convert_job(self.converter, job.lyx_file_path, job.output_directory,
+                                  job.output_path, formats=job.formats)
+            if result.succeeded:
+                self._log("Job %s: converted %s in %.2fs", job.id, job.lyx_file_path, result.duration)
+            else:
+                self._log("Job %s: failed to convert %s: %s", job.id, job.lyx_file_path, result.error, level="error")
+            with self._condition:
+                self._running -= 1
+                job.output = result.output_path
+                job.error = result.error
+                job.duration = result.duration
+                self._finish(job, DONE if result.succeeded else FAILED)
+
+    def _finish(self, job, status):
+        """Records a finished job and forgets the oldest ones. Called with the condition held."""
+        job.status = status
+        job.finished = time.time()
+        self._counts[status] += 1
+        self._history.append(job.id)
+        while len(self._history) > JOB_HISTORY:
+            self._jobs.pop(self._history.popleft(), None)
+        self._condition.notify_all()
+
+    def job(self, job_id):
+        """Returns the job with the given id, or None if it is unknown or was forgotten."""
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        """Returns every known job, oldest first."""
+        with self._condition:
+            return sorted(self._jobs.values(), key=lambda job: job.submitted)
+
+    def wait(self, job_id, timeout=None):
+        """
+        Waits until a job has finished.
+
+        Returns:
+            Job: The job, finished unless the timeout expired first, or None if it is unknown.
+        """
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._condition.wait_for(lambda: job.done, timeout)
+            return job
+
+    def cancel(self, job_id):
+        """
+        Cancels a queued job. Jobs that are already running are left to finish.
+
+        Returns:
+            bool: Whether the job was cancelled.
+        """
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                return False
+            del self._queued[job.key]
+            self._finish(job, CANCELLED)
+        self._log("Cancelled job %s.", job_id)
+        return True
+
+    def status(self):
+        """Returns the queue depth, the number of running jobs and the job counts."""
+        with self._condition:
+            return {
+                "queued": len(self._queued),
+                "running": self._running,
+                "workers": self.max_workers,
+                "completed": self._counts[DONE],
+                "failed": self._counts[FAILED],
+                "cancelled": self._counts[CANCELLED],
+                "uptime": round(time.time() - self.started, 3),
+                "accepting": not self._closed,
+            }
+
+    def close(self, wait=True):
+        """Stops accepting jobs, cancels the queued ones and waits for the running ones."""
+        with self._condition:
+            self._closed = True
+            for job in list(self._queued.values()):
+                self._finish(job, CANCELLED)
+            self._queued.clear()
+            self._condition.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+        self._log("Conversion daemon stopped.")
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """The JSON job API. See serve for the endpoints."""
+    server_version = "lyxtomarkdown"
+    protocol_version = "HTTP/1.1"
+
+    def address_string(self):
+        # Unix socket clients have no address.
+        return self.client_address[0] if self.client_address else "local"
+
+    def log_message(self, format, *args):
+        self.server.conversion_daemon._log("%s " + format, self.address_string(), *args, level="debug")
+
+    def _send(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status, message):
+        self._send(status, {"error": message})
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        body = json.loads(self.rfile.read(length).decode("utf-8"))
+        if not isinstance(body, dict):
+            raise ValueError("The request body must be a JSON object.")
+        return body
+
+    def _authorize(self):
+        """
+        Rejects requests that may not come from a legitimate local client, sending the error.
+
+        Over TCP, a request must carry the daemon's token and a local Host header. Requests with
+        a body must be JSON, which browsers cannot send to another origin without a preflight.
+
+        Returns:
+            bool: Whether the request may be handled.
+        """
+        token = self.server.token
+        if token is not None:
+            host = (self.headers.get("Host") or "").lower()
+            name = host.rsplit(":", 1)[0] if not host.endswith("]") else host
+            if name not in LOCAL_HOSTS + (self.server.server_address[0],):
+                self._error(403, f"Requests for host {host!r} are not accepted.")
+                return False
+            supplied = self.headers.get("Authorization") or ""
+            if not hmac.compare_digest(supplied.encode("utf-8"), f"Bearer {token}".encode("utf-8")):
+                self._error(401, "Missing or wrong daemon token.")
+                return False
+        if self.command == "POST":
+            content_type = (self.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+            if content_type != "application/json":
+                self._error(415, "Requests must be sent as application/json.")
+                return False
+        return True
+
+    def _route(self):
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        return parts, query
+
+    @staticmethod
+    def _wait_seconds(value):
+        return min(max(float(value), 0.0), MAX_WAIT) if value not in (None, "") else None
+
+    def do_GET(self):
+        if not self._authorize():
+            return None
+        daemon = self.server.conversion_daemon
+        parts, query = self._route()
+        if parts == ["status"]:
+            return self._send(200, daemon.status())
+        if parts == ["jobs"]:
+            return self._send(200, {"jobs": [job.to_dict() for job in daemon.jobs()]})
+        if len(parts) == 2 and parts[0] == "jobs":
+            try:
+                wait = self._wait_seconds(query.get("wait"))
+            except ValueError:
+                return self._error(400, "wait must be a number of seconds.")
+            job = daemon.wait(parts[1], wait) if wait else daemon.job(parts[1])
+            if job is None:
+                return self._error(404, f"Unknown job {parts[1]}.")
+            return self._send(200, job.to_dict())
+        self._error(404, f"Unknown endpoint {self.path}.")
+
+    def do_POST(self):
+        if not self._authorize():
+            return None
+        daemon = self.server.conversion_daemon
+        parts, _ = self._route()
+        try:
+            body = self._read_body()
+        except ValueError as e:
+            return self._error(400, f"Invalid JSON: {e}")
+        if parts == ["shutdown"]:
+            self._send(202, {"status": "stopping"})
+            # shutdown() waits for serve_forever, so it cannot run on a request thread it serves.
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return None
+        if parts != ["jobs"]:
+            return self._error(404, f"Unknown endpoint {self.path}.")
+        if not body.get("input"):
+            return self._error(400, "A job needs an input.")
+        formats = body.get("formats")
+        if isinstance(formats, str):
+            formats = [f.strip() for f in formats.split(",") if f.strip()]
+        try:
+            job = daemon.submit(body["input"], body.get("output_directory"), body.get("output_path"),
+                                priority=int(body.get("priority") or 0), formats=formats)
+            wait = self._wait_seconds(body.get("wait"))
+        except (TypeError, ValueError) as e:
+            return self._error(400, str(e))
+        except RuntimeError as e:
+            return self._error(503, str(e))
+        if wait:
+            daemon.wait(job.id, wait)
+        self._send(200 if job.done else 202, job.to_dict())
+
+    def do_DELETE(self):
+        if not self._authorize():
+            return None
+        daemon = self.server.conversion_daemon
+        parts, _ = self._route()
+        if len(parts) != 2 or parts[0] != "jobs":
+            return self._error(404, f"Unknown endpoint {self.path}.")
+        job = daemon.job(parts[1])
+        if job is None:
+            return self._error(404, f"Unknown job {parts[1]}.")
+        if not daemon.cancel(job.id):
+            return self._error(409, f"Job {job.id} is {job.status} and can no longer be cancelled.")
+        self._send(200, job.to_dict())
+
+
+class _TCPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        # Only the owner may connect: the API converts any file the daemon's user can read.
+        old_umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(old_umask)
+
+
+def _remove_stale_socket(socket_path):
+    """Removes a socket left behind by a daemon that did not shut down cleanly."""
+    if not os.path.exists(socket_path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except ConnectionRefusedError:
+        os.remove(socket_path)
+        return
+    except OSError:
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"A daemon is already listening on {socket_path}.")
+
+
+def create_server(daemon, address, token=None):
+    """
+    Creates the HTTP server for a daemon.
+
+    Args:
+        daemon (ConversionDaemon): The daemon the requests are sent to.
+        address (tuple): ("tcp", host, port) or ("unix", socket_path), see parse_address.
+        token (str, optional): The secret TCP clients must send (see load_token). Required for
+                               TCP; a Unix socket is protected by its permissions instead.
+
+    Returns:
+        socketserver.BaseServer: The bound server; call serve_forever to handle requests.
+
+    Raises:
+        ValueError: If a TCP address is given without a token.
+    """
+    if address[0] == "unix":
+        os.makedirs(os.path.dirname(address[1]), mode=0o700, exist_ok=True)
+        _remove_stale_socket(address[1])
+        server = _UnixServer(address[1], _RequestHandler)
+        server.token = None
+    else:
+        if not token:
+            raise ValueError("A daemon listening on TCP requires a token.")
+        server = _TCPServer(address[1:], _RequestHandler)
+        server.token = token
+    server.conversion_daemon = daemon
+    return server
+
+
+def serve(daemon, address, on_ready=None, token=None):
+    """
+    Runs a daemon and its job API until POST /shutdown or Ctrl+C.
+
+    The API speaks JSON over HTTP, on an owner-only Unix socket or on localhost. Over TCP every
+    request must send "Authorization: Bearer <token>", and POST requests must be sent as
+    application/json:
+
+        POST   /jobs        {"input", "output_directory", "output_path", "priority", "formats",
+                             "wait"} queues a job; with "wait" (seconds) the reply is sent once
+                             the job has finished or the time is up.
+        GET    /jobs        Lists the known jobs.
+        GET    /jobs/<id>   Returns a job; ?wait=<seconds> waits for it to finish.
+        DELETE /jobs/<id>   Cancels a queued job.
+        GET    /status      Returns the queue depth, running jobs and job counts.
+        POST   /shutdown    Stops the daemon after the running jobs finish.
+
+    Args:
+        daemon (ConversionDaemon): The daemon, not yet started.
+        address (tuple): ("tcp", host, port) or ("unix", socket_path), see parse_address.
+        on_ready (callable, optional): Called with the address being served, e.g. to print it.
+        token (str, optional): The secret TCP clients must send, see create_server.
+    """
+    server = create_server(daemon, address, token)
+    if address[0] == "tcp":
+        address = ("tcp",) + server.server_address[:2]
+    daemon.start()
+    try:
+        if on_ready:
+            on_ready(address)
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        daemon.close()
+        if address[0] == "unix" and os.path.exists(address[1]):
+            os.remove(address[1])
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """An HTTP connection over a Unix socket."""
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class DaemonClient:
+    """Submits jobs to a running conversion daemon."""
+    def __init__(self, address, timeout=MAX_WAIT + 30, token=None):
+        """
+        Args:
+            address (tuple): ("tcp", host, port) or ("unix", socket_path), see parse_address.
+            timeout (float): Seconds to wait for a reply.
+            token (str, optional): The daemon's token, required over TCP (see load_token).
+        """
+        self.address = address
+        self.timeout = timeout
+        self.token = token
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            if self.address[0] == "unix":
+                connection = _UnixHTTPConnection(self.address[1], timeout=self.timeout)
+            else:
+                connection = http.client.HTTPConnection(self.address[1], self.address[2], timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def _request(self, method, path, body=None):
+        """
+        Sends a request over a kept-alive connection and returns the decoded reply.
+
+        Raises:
+            ConnectionError: If the daemon cannot be reached.
+            ValueError: If the daemon rejected the request.
+            RuntimeError: For any other error reply.
+        """
+        data = json.dumps(body if body is not None else {}).encode("utf-8") if method == "POST" else None
+        headers = {"Content-Type": "application/json"} if data else {}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        for attempt in (1, 2):
+            connection = self._connection()
+            try:
+                connection.request(method, path, body=data, headers=headers)
+                response = connection.getresponse()
+                reply = json.loads(response.read().decode("utf-8") or "{}")
+                break
+            except (http.client.HTTPException, OSError) as e:
+                connection.close()
+                self._local.connection = None
+                # The daemon may have closed an idle kept-alive connection; retry once on a new one.
+                if attempt == 2 or isinstance(e, (ConnectionRefusedError, FileNotFoundError)):
+                    raise ConnectionError(f"Could not reach the conversion daemon: {e}")
+        if response.status == 400:
+            raise ValueError(reply.get("error", "Bad request"))
+        if response.status in (401, 403):
+            raise ConnectionError(f"The conversion daemon refused the connection: {reply.get('error')}")
+        if response.status >= 400:
+            raise RuntimeError(reply.get("error", f"HTTP {response.status}"))
+        return reply
+
+    def submit(self, lyx_file_path, output_directory=None, output_path=None, priority=0, formats=None,
+               wait=None):
+        """Queues a job and returns it as a dict; see ConversionDaemon.submit."""
+        return self._request("POST", "/jobs", {
+            "input": os.path.abspath(lyx_file_path),
+            "output_directory": os.path.abspath(output_directory) if output_directory else None,
+            "output_path": os.path.abspath(output_path) if output_path else None,
+            "priority": priority,
+            "formats": formats,
+            "wait": wait,
+        })
+
+    def job(self, job_id, wait=None):
+        """Returns a job, waiting up to wait seconds for it to finish."""
+        return self._request("GET", f"/jobs/{job_id}" + (f"?wait={wait}" if wait else ""))
+
+    def wait(self, job_id):
+        """Returns a job once it has finished, however long that takes."""
+        while True:
+            job = self.job(job_id, wait=MAX_WAIT)
+            if job["status"] in FINISHED_STATES:
+                return job
+
+    def jobs(self):
+        return self._request("GET", "/jobs")["jobs"]
+
+    def cancel(self, job_id):
+        return self._request("DELETE", f"/jobs/{job_id}")
+
+    def status(self):
+        return self._request("GET", "/status")
+
+    def shutdown(self):
+        return self._request("POST", "/shutdown")
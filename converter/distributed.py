@@ -0,0 +1,420 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+from .batch import BatchResult, BatchSummary
+from .file_utils import atomic_write_text
+
+PLAN_FILE = "plan.json"
+SUMMARY_FILE = "summary.json"
+LEASE_DIRECTORY = "leases"
+RESULT_DIRECTORY = "results"
+# A worker renews its lease this many times per lease period, so a single slow write does not lose it.
+HEARTBEATS_PER_LEASE = 4
+
+
+def default_worker_id():
+    """Returns an identifier that is unique across the hosts sharing a work directory."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _shard_name(index):
+    return f"shard-{index:05d}"
+
+
+def _publish_exclusive(path, content):
+    """
+    Creates path with the given content unless it already exists.
+
+    The content is written to a temporary file and hard-linked into place. Linking fails if the
+    path exists, also over NFS, so exactly one of several concurrent writers succeeds and
+    readers never see a partially written file.
+
+    Returns:
+        bool: True if this call created the file.
+    """
+    temporary_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temporary_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    try:
+        os.link(temporary_path, path)
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        os.remove(temporary_path)
+
+
+def _read_json(path):
+    """Returns the parsed JSON file, or None if it does not exist (yet)."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def create_plan(work_directory, jobs, shard_size):
+    """
+    Splits the jobs of a batch into shards and publishes them in the work directory.
+
+    Every worker may call this with the same jobs; the first one publishes the plan and the
+    others adopt it.
+
+    Args:
+        work_directory (str): The directory shared by every worker, e.g. on NFS.
+        jobs (list): Batch jobs, as returned by BatchConverter.plan or read_manifest.
+        shard_size (int): The number of documents in each shard.
+
+    Returns:
+        dict: The plan in use, with its "shards" as lists of [input, output directory, output path].
+
+    Raises:
+        ValueError: If the work directory already holds the plan of a different batch.
+    """
+    os.makedirs(os.path.join(work_directory, LEASE_DIRECTORY), exist_ok=True)
+    os.makedirs(os.path.join(work_directory, RESULT_DIRECTORY), exist_ok=True)
+    # Absolute paths, so that workers started from other directories (or hosts) agree on them.
+    jobs = [[os.path.abspath(job[0]), os.path.abspath(job[1]),
+             os.path.abspath(job[2]) if len(job) > 2 and job[2] else None] for job in jobs]
+    plan = {
+        "created": time.time(),
+        "jobs": len(jobs),
+        "shard_size": shard_size,
+        "shards": [jobs[start:start + shard_size] for start in range(0, len(jobs), shard_size)],
+    }
+    plan_path = os.path.join(work_directory, PLAN_FILE)
+    if _publish_exclusive(plan_path, json.dumps(plan, indent=1, ensure_ascii=False)):
+        return plan
+    existing = load_plan(work_directory)
+    if [job for shard in existing["shards"] for job in shard] != jobs:
+        raise ValueError(f"{work_directory} already holds the plan of a different batch; use an empty "
+                         f"work directory for a new batch, or leave out the inputs to join this one.")
+    return existing
+
+
+def load_plan(work_directory):
+    """
+    Returns the plan published in a work directory.
+
+    Raises:
+        ValueError: If the directory holds no plan.
+    """
+    plan = _read_json(os.path.join(work_directory, PLAN_FILE))
+    if plan is None:
+        raise ValueError(f"{work_directory} holds no batch plan; start the first worker with the inputs.")
+    return plan
+
+
+class Lease:
+    """
+    A worker's claim on one shard, held as a lock file in the work directory.
+
+    The lease is created with O_EXCL, so only one worker can hold it, and stays valid while its
+    owner keeps touching it. A lease whose modification time is older than lease_seconds belongs
+    to a worker that died or stalled and may be reclaimed by another one; the hosts' clocks must
+    therefore be kept in sync (e.g. by NTP).
+    """
+    def __init__(self, path, shard, worker_id, token):
+        self.path = path
+        self.shard = shard
+        self.worker_id = worker_id
+        self.token = token
+
+    @classmethod
+    def acquire(cls, path, shard, worker_id):
+        """Creates the lease file. Returns the Lease, or None if another worker holds it."""
+        token = uuid.uuid4().hex
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            return None
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({"worker": worker_id, "token": token, "claimed": time.time()}, f)
+        return cls(path, shard, worker_id, token)
+
+    @staticmethod
+    def owner(path):
+        """Returns the contents of a lease file, or None if it is gone or still being written."""
+        try:
+            return _read_json(path)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def held(self):
+        """Returns whether the lease file is still this lease, i.e. it was not reclaimed."""
+        owner = self.owner(self.path)
+        return owner is not None and owner.get("token") == self.token
+
+    def renew(self):
+        """Sends a heartbeat. Returns False if the lease was lost to another worker."""
+        if not self.held():
+            return False
+        try:
+            now = time.time()
+            os.utime(self.path, (now, now))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def release(self):
+        """Removes the lease file if this lease still holds it."""
+        if self.held():
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class _Heartbeat(threading.Thread):
+    """Renews a lease in the background while its shard is being converted."""
+    def __init__(self, lease, interval, logger=None):
+        super().__init__(daemon=True, name=f"heartbeat-{lease.shard}")
+        self.lease = lease
+        self.interval = interval
+        self.logger = logger
+        self.lost = False
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            if not self.lease.renew():
+                self.lost = True
+                if self.logger:
+                    self.logger.warning("Lost the lease on %s; another worker reclaimed it.", self.lease.shard)
+                return
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class ShardWorker:
+    """
+    Converts the shards of a batch planned in a shared work directory.
+
+    Any number of workers, on one host or several, may run against the same directory. Each
+    claims an unfinished shard by creating its lease, converts the shard's documents with a
+    BatchConverter while a heartbeat keeps the lease alive, writes the shard's results to
+    results/<shard>.json and releases the lease. Leases of workers that stopped sending
+    heartbeats are reclaimed by renaming them away, so a shard is converted at least once even
+    if its worker dies. A worker that stalls past its lease finds out at its next heartbeat and
+    stops once the documents it is converting are done, leaving the shard to the worker that
+    reclaimed it; until then both may write the same outputs.
+    """
+    def __init__(self, batch, work_directory, worker_id=None, lease_seconds=120, poll_seconds=5, logger=None):
+        """
+        Args:
+            batch (BatchConverter): Converts the documents of each claimed shard.
+            work_directory (str): The directory shared by every worker.
+            worker_id (str, optional): Identifies this worker in leases and result manifests.
+                                       Defaults to the host name and process ID.
+            lease_seconds (float): How long a lease stays valid without a heartbeat.
+            poll_seconds (float): How often to look for work while every unfinished shard is
+                                  leased by another worker.
+            logger (Logger, optional): An instance of the Logger class for logging.
+        """
+        self.batch = batch
+        self.work_directory = work_directory
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.logger = logger
+
+    def _log(self, message, *args, level="info"):
+        """Helper method to log messages if a logger is available and enabled for the level."""
+        if self.logger and self.logger.is_enabled_for(level):
+            getattr(self.logger, level)(message, *args)
+
+    def _lease_path(self, shard):
+        return os.path.join(self.work_directory, LEASE_DIRECTORY, f"{shard}.lease")
+
+    def _result_path(self, shard):
+        return os.path.join(self.work_directory, RESULT_DIRECTORY, f"{shard}.json")
+
+    def _finished(self):
+        """Returns the names of the shards whose results have been written."""
+        return {name[:-len(".json")] for name in os.listdir(os.path.join(self.work_directory, RESULT_DIRECTORY))
+                if name.endswith(".json")}
+
+    def _reclaim(self, path, shard):
+        """
+        Takes over the lease of a worker that stopped sending heartbeats.
+
+        The expired lease is renamed to a name unique to this worker. Only one worker's rename
+        can succeed; it then checks that it moved the lease it found expired, and not a fresh
+        one that another worker created in the meantime, before claiming the shard.
+
+        Returns:
+            Lease: The new lease, or None if the lease is still alive or another worker won.
+        """
+        try:
+            expired_for = time.time() - os.stat(path).st_mtime - self.lease_seconds
+        except FileNotFoundError:
+            return Lease.acquire(path, shard, self.worker_id)
+        if expired_for < 0:
+            return None
+        # A lease without contents was left by a worker that died while creating it.
+        previous = Lease.owner(path) or {}
+        stale_path = f"{path}.{uuid.uuid4().hex}.stale"
+        try:
+            os.rename(path, stale_path)
+        except FileNotFoundError:
+            return None
+        moved = Lease.owner(stale_path)
+        if (moved or {}).get("token") != previous.get("token"):
+            # Another worker reclaimed the lease first; put its fresh lease back.
+            try:
+                os.link(stale_path, path)
+            except FileExistsError:
+                pass
+            os.remove(stale_path)
+            return None
+        os.remove(stale_path)
+        self._log("Reclaimed %s from %s, whose lease expired %.0fs ago.",
+                  shard, previous.get("worker", "a worker"), expired_for, level="warning")
+        return Lease.acquire(path, shard, self.worker_id)
+
+    def claim(self, plan):
+        """
+        Claims the first unfinished shard that no live worker holds.
+
+        Returns:
+            tuple: (lease, pending) where lease is None if nothing could be claimed and pending
+                   is the number of shards without results.
+        """
+        finished = self._finished()
+        pending = [_shard_name(index) for index in range(len(plan["shards"]))
+                   if _shard_name(index) not in finished]
+        for shard in pending:
+            path = self._lease_path(shard)
+            lease = Lease.acquire(path, shard, self.worker_id) or self._reclaim(path, shard)
+            if lease is None:
+                continue
+            if os.path.exists(self._result_path(shard)):
+                # Finished by its previous owner between the listing and the claim.
+                lease.release()
+                continue
+            return lease, len(pending)
+        return None, len(pending)
+
+    def _convert_shard(self, lease, jobs, on_result):
+        """Converts the jobs of a claimed shard and writes its result manifest."""
+        heartbeat = _Heartbeat(lease, self.lease_seconds / HEARTBEATS_PER_LEASE, self.logger)
+        heartbeat.start()
+        started = time.time()
+        try:
+            summary = self.batch.convert_jobs([tuple(job) for job in jobs], on_result=on_result,
+                                              stop=lambda: heartbeat.lost)
+        finally:
+            heartbeat.stop()
+        if heartbeat.lost:
+            self._log("Stopped converting %s after %s documents; the worker that reclaimed it finishes it.",
+                      lease.shard, len(summary.results), level="warning")
+            return summary
+        manifest = {
+            "shard": lease.shard,
+            "worker": self.worker_id,
+            "started": started,
+            "finished": time.time(),
+            "wall_time": summary.wall_time,
+            "results": [
+                {"input": r.lyx_file_path, "output": r.output_path, "error": r.error, "duration": r.duration}
+                for r in summary.results
+            ],
+        }
+        atomic_write_text(self._result_path(lease.shard), json.dumps(manifest, indent=1, ensure_ascii=False))
+        lease.release()
+        return summary
+
+    def run(self, on_result=None):
+        """
+        Converts shards until every shard of the plan has results.
+
+        While the remaining shards are all leased by other workers, the worker waits and
+        reclaims the leases of any that stop sending heartbeats.
+
+        Args:
+            on_result (callable, optional): Called with each BatchResult this worker produces.
+
+        Returns:
+            BatchSummary: The results of the documents this worker converted.
+        """
+        plan = load_plan(self.work_directory)
+        summary = BatchSummary()
+        start = time.perf_counter()
+        self._log("Worker %s joined the batch in %s (%s documents in %s shards).",
+                  self.worker_id, self.work_directory, plan["jobs"], len(plan["shards"]))
+        while True:
+            lease, pending = self.claim(plan)
+            if lease is None:
+                if not pending:
+                    break
+                time.sleep(self.poll_seconds)
+                continue
+            self._log("Worker %s claimed %s (%s shards left).", self.worker_id, lease.shard, pending)
+            jobs = plan["shards"][int(lease.shard.split("-")[1])]
+            try:
+                shard_summary = self._convert_shard(lease, jobs, on_result)
+            except BaseException:
+                # Let another worker take the shard over at once instead of after the lease expires.
+                lease.release()
+                raise
+            for result in shard_summary.results:
+                summary.add(result)
+        summary.wall_time = time.perf_counter() - start
+        return summary
+
+
+def merge_results(work_directory):
+    """
+    Aggregates the result manifests of every shard into one summary.
+
+    The merged results are also written to summary.json in the work directory.
+
+    Args:
+        work_directory (str): The directory shared by the workers.
+
+    Returns:
+        tuple: (summary, missing) where summary is a BatchSummary whose wall_time spans the
+               first shard's start to the last shard's end, and missing lists the shards that
+               have no results yet.
+
+    Raises:
+        ValueError: If the directory holds no plan.
+    """
+    plan = load_plan(work_directory)
+    summary = BatchSummary()
+    missing = []
+    workers = set()
+    started, finished = [], []
+    for index in range(len(plan["shards"])):
+        manifest = _read_json(os.path.join(work_directory, RESULT_DIRECTORY, f"{_shard_name(index)}.json"))
+        if manifest is None:
+            missing.append(_shard_name(index))
+            continue
+        workers.add(manifest["worker"])
+        started.append(manifest["started"])
+        finished.append(manifest["finished"])
+        for entry in manifest["results"]:
+            summary.add(BatchResult(entry["input"], output_path=entry["output"], error=entry["error"],
+                                    duration=entry["duration"]))
+    if started:
+        summary.wall_time = max(finished) - min(started)
+    atomic_write_text(os.path.join(work_directory, SUMMARY_FILE), json.dumps({
+        "jobs": plan["jobs"],
+        "shards": len(plan["shards"]),
+        "missing_shards": missing,
+        "workers": sorted(workers),
+        "converted": len(summary.succeeded),
+        "failed": len(summary.failed),
+        "wall_time": summary.wall_time,
+        "results": [
+            {"input": r.lyx_file_path, "output": r.output_path, "error": r.error, "duration": r.duration}
+            for r in summary.results
+        ],
+    }, indent=1, ensure_ascii=False))
+    return summary, missing
@@ -1,4 +1,7 @@
 import os
+import shutil
+import stat
+import tempfile
 
 def cleanup_files(*file_paths, logger=None):
     """Deletes any files that exist in the file_paths list."""
@@ -6,8 +9,55 @@ def cleanup_files(*file_paths, logger=None):
         if os.path.exists(path):
             try:
                 if logger:
-                    logger.info(f"Removing intermediate file: {path}")
+                    logger.info("Removing intermediate file: %s", path)
                 os.remove(path)
             except OSError as e:
                 if logger:
-                    logger.error(f"Error removing file {path}: {e}")
+                    logger.error("Error removing file %s: %s", path, e)
+
+def _replace_atomically(tmp_path, path):
+    """Renames a finished temporary file over path, keeping the permissions of any file it replaces."""
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        mode = 0o644  # mkstemp creates files readable by the owner only
+    os.chmod(tmp_path, mode)
+    os.replace(tmp_path, path)
+
+def _temporary_sibling(path):
+    directory = os.path.dirname(os.path.abspath(path))
+    return tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.splitext(path)[1])
+
+def atomic_write_text(path, content, encoding='utf-8'):
+    """
+    Writes content to path atomically.
+
+    The data is written to a temporary file in the same directory and then renamed over the
+    destination, so readers see either the old file or the complete new one.
+    """
+    atomic_write_chunks(path, [content], encoding=encoding)
+
+def atomic_write_chunks(path, chunks, encoding='utf-8'):
+    """Writes an iterable of text chunks to path atomically, in the same way as atomic_write_text."""
+    fd, tmp_path = _temporary_sibling(path)
+    try:
+        with os.fdopen(fd, 'w', encoding=encoding) as f:
+            for chunk in chunks:
+                f.write(chunk)
+        _replace_atomically(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def atomic_copy_file(source_path, path):
+    """Copies source_path to path atomically, in the same way as atomic_write_text."""
+    fd, tmp_path = _temporary_sibling(path)
+    os.close(fd)
+    try:
+        shutil.copyfile(source_path, tmp_path)
+        _replace_atomically(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
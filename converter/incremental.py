@@ -0,0 +1,279 @@
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import ConversionCache
+from .lyx_converter import STAGE_ERRORS
+from .workspace import scratch_root, set_origin
+
+# Sectioning layouts a document may be split at, from the outermost level inwards.
+SPLIT_LEVELS = (("Part", "Part*"), ("Chapter", "Chapter*"), ("Section", "Section*"))
+HEADING_LAYOUTS = {
+    "Part", "Part*", "Chapter", "Chapter*", "Section", "Section*", "Subsection", "Subsection*",
+    "Subsubsection", "Subsubsection*", "Paragraph", "Paragraph*", "Subparagraph", "Subparagraph*",
+}
+
+# Content whose Markdown depends on the rest of the document. Pandoc numbers footnotes and
+# resolves references, citations and macros across the whole input, so a document using any of
+# these is always converted in one piece.
+NON_LOCAL_CONTENT = {
+    "footnotes": re.compile(r'^\\begin_inset Foot\b', flags=re.MULTILINE),
+    "cross-references": re.compile(
+        r'^LatexCommand (?:ref|eqref|pageref|vref|vpageref|formatted|nameref|prettyref)\b', flags=re.MULTILINE
+    ),
+    "citations": re.compile(r'^\\begin_inset CommandInset (?:citation|bibtex|bibitem)\b', flags=re.MULTILINE),
+    "child documents": re.compile(r'^\\begin_inset CommandInset include\b', flags=re.MULTILINE),
+    "generated lists": re.compile(
+        r'^\\begin_inset (?:CommandInset (?:toc|nomencl_print|index_print)|FloatList)\b', flags=re.MULTILINE
+    ),
+    "macro definitions": re.compile(
+        r'^\\begin_inset FormulaMacro\b|\\(?:re)?newcommand\b|\\def\b|\\let\b|\\(?:set|addto)counter\b',
+        flags=re.MULTILINE
+    ),
+}
+
+
+class IncrementalResult:
+    """The outcome of an incremental conversion."""
+    def __init__(self, output_path, chunks=1, reused=0, fallback_reason=None):
+        """
+        Args:
+            output_path (str): The generated Markdown file.
+            chunks (int): The number of pieces the document was split into.
+            reused (int): How many of them were restored from the cache.
+            fallback_reason (str, optional): Why the document was converted in one piece.
+        """
+        self.output_path = output_path
+        self.chunks = chunks
+        self.reused = reused
+        self.fallback_reason = fallback_reason
+
+    def __repr__(self):
+        if self.fallback_reason:
+            return f"IncrementalResult({self.output_path!r}, full conversion: {self.fallback_reason})"
+        return f"IncrementalResult({self.output_path!r}, reused {self.reused} of {self.chunks} chunks)"
+
+
+class LyxDocumentSplitter:
+    """Splits the body of a .lyx document into top-level chunks that share its header."""
+    def __init__(self, lyx_text):
+        lines = lyx_text.splitlines(keepends=True)
+        try:
+            body_start = next(i for i, line in enumerate(lines) if line.rstrip("\n") == "\\begin_body") + 1
+            body_end = max(i for i, line in enumerate(lines) if line.rstrip("\n") == "\\end_body")
+        except (StopIteration, ValueError):
+            raise ValueError("Not a LyX document: \\begin_body/\\end_body not found")
+        self.header = lines[:body_start]
+        self.body = lines[body_start:body_end]
+        self.trailer = lines[body_end:]
+
+    def non_local_content(self):
+        """Returns the names of the features that prevent converting the chunks independently."""
+        body = "".join(self.body)
+        found = [name for name, pattern in NON_LOCAL_CONTENT.items() if pattern.search(body)]
+        if self._has_duplicate_headings():
+            # Pandoc disambiguates identical heading identifiers with -1, -2... suffixes.
+            found.append("duplicate headings")
+        return found
+
+    def _top_level_layouts(self):
+        """Yields (line index, layout name) for every layout that is not nested in another construct."""
+        depth = 0
+        for index, line in enumerate(self.body):
+            if line.startswith("\\begin_layout "):
+                if depth == 0:
+                    yield index, line[len("\\begin_layout "):].strip()
+                depth += 1
+            elif line.startswith(("\\begin_inset", "\\begin_deeper")):
+                depth += 1
+            elif line.startswith(("\\end_layout", "\\end_inset", "\\end_deeper")):
+                depth -= 1
+
+    def _has_duplicate_headings(self):
+        seen = set()
+        for index, layout in self._top_level_layouts():
+            if layout not in HEADING_LAYOUTS:
+                continue
+            text_lines = []
+            for line in self.body[index + 1:]:
+                if line.startswith("\\end_layout"):
+                    break
+                if not line.startswith("\\"):
+                    text_lines.append(line)
+            heading = "".join(ch for ch in "".join(text_lines).lower() if ch.isalnum())
+            if heading in seen:
+                return True
+            seen.add(heading)
+        return False
+
+    def split(self):
+        """
+        Splits the body at the outermost sectioning level the document uses.
+
+        Returns:
+            list: The body lines of each chunk. Anything before the first heading (title, abstract,
+                  introduction) forms the first chunk.
+        """
+        layouts = list(self._top_level_layouts())
+        names = {name for _, name in layouts}
+        level = next((level for level in SPLIT_LEVELS if names.intersection(level)), None)
+        if level is None:
+            return [self.body]
+        starts = [index for index, name in layouts if name in level]
+        if starts[0] != 0 and "".join(self.body[:starts[0]]).strip():
+            starts.insert(0, 0)
+        else:
+            starts[0] = 0
+        bounds = starts + [len(self.body)]
+        return [self.body[start:end] for start, end in zip(bounds, bounds[1:])]
+
+    def chunk_document(self, chunk, origin):
+        """
+        Builds a standalone .lyx document from one chunk.
+
+        Args:
+            chunk (list): Body lines returned by split.
+            origin (str): The directory of the original document. Chunk documents are written
+                          elsewhere, so LyX needs it to resolve relative paths such as graphics.
+        """
+        return set_origin("".join(self.header), origin) + "".join(chunk + self.trailer)
+
+
+class IncrementalConverter:
+    """
+    Converts large documents section by section, reusing the Markdown of unchanged sections.
+
+    The document is split at its outermost Part, Chapter or Section headings. Each chunk becomes a
+    standalone document with the original header and preamble, and its Pandoc output is cached
+    under the hash of that document. Only changed chunks are converted again; the pieces are then
+    joined the way Pandoc joins blocks and post-processed as a whole, so the result matches a full
+    conversion. Documents whose output depends on content in other chunks (footnotes, references,
+    citations, ...) are converted in one piece by the wrapped LyxConverter.
+    """
+    def __init__(self, converter, cache=None, max_workers=None, logger=None):
+        """
+        Initializes the incremental converter.
+
+        Args:
+            converter (LyxConverter): Converts every chunk, and whole documents on fallback.
+            cache (ConversionCache, optional): Stores the Markdown of every chunk. Defaults to the
+                                               converter's cache, or a cache in the default location.
+            max_workers (int, optional): The maximum number of chunks converted concurrently.
+            logger (Logger, optional): An instance of the Logger class for logging.
+        """
+        self.converter = converter
+        self.cache = cache or converter.cache or ConversionCache(logger=logger)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.logger = logger
+
+    def _log(self, message, *args, level="info"):
+        """Helper method to log messages if a logger is available and enabled for the level."""
+        if self.logger and self.logger.is_enabled_for(level):
+            getattr(self.logger, level)(message, *args)
+
+    def convert(self, lyx_file_path, output_directory, output_path=None):
+        """
+        Converts a document incrementally. Accepts the same arguments as LyxConverter.convert,
+        except formats.
+
+        Returns:
+            str: The path to the final Markdown file.
+        """
+        return self.convert_incremental(lyx_file_path, output_directory, output_path).output_path
+
+    def convert_incremental(self, lyx_file_path, output_directory, output_path=None):
+        """
+        Converts a document, reusing cached chunks where possible.
+
+        output_path names the Markdown file, as in LyxConverter.convert. Like LyxConverter.convert,
+        a quarantined document is skipped and the conversion is recorded in the metrics and the
+        quarantine.
+
+        Returns:
+            IncrementalResult: The output path and how many chunks were reused.
+        """
+        with self.converter.supervised(lyx_file_path):
+            return self._convert_incremental(lyx_file_path, output_directory, output_path)
+
+    def _convert_incremental(self, lyx_file_path, output_directory, output_path):
+        if not os.path.exists(lyx_file_path):
+            raise FileNotFoundError(f"LyX file not found: {lyx_file_path}")
+        with open(lyx_file_path, 'r', encoding='utf-8', errors='surrogateescape', newline='') as f:
+            lyx_text = f.read()
+
+        try:
+            splitter = LyxDocumentSplitter(lyx_text)
+        except ValueError as e:
+            return self._convert_whole(lyx_file_path, output_directory, output_path, str(e))
+        non_local = splitter.non_local_content()
+        if non_local:
+            return self._convert_whole(lyx_file_path, output_directory, output_path, ", ".join(non_local))
+        chunks = splitter.split()
+        if len(chunks) < 2:
+            return self._convert_whole(lyx_file_path, output_directory, output_path, "no sections to split at")
+
+        converter = self.converter
+        markdown_file_path, assets = converter.prepare(lyx_file_path, output_directory, output_path)
+        origin = os.path.dirname(os.path.abspath(lyx_file_path))
+        documents = [splitter.chunk_document(chunk, origin) for chunk in chunks]
+        with converter.metrics.stage("cache", lyx_file_path) as stage:
+            toolchain, settings = converter.cache_key_parts()
+            settings = {**settings, "postprocess": None, "incremental_chunk": True}
+            keys = [self.cache.make_text_key(document, toolchain, settings) for document in documents]
+            markdown = [self.cache.get_text(key) for key in keys]
+            missing = [i for i, text in enumerate(markdown) if text is None]
+            stage.detail = f"{len(chunks) - len(missing)} of {len(chunks)} chunks hit"
+        self._log("Incremental conversion of %s: %s of %s chunks unchanged.",
+                  lyx_file_path, len(chunks) - len(missing), len(chunks))
+
+        if missing:
+            try:
+                converted = self._convert_chunks([documents[i] for i in missing], lyx_file_path)
+            except STAGE_ERRORS as e:
+                raise converter.conversion_error(e)
+            for i, text in zip(missing, converted):
+                markdown[i] = text
+                try:
+                    self.cache.put_text(keys[i], text, source_path=lyx_file_path)
+                except OSError as e:
+                    self._log("Could not store chunk in cache: %s", e, level="warning")
+
+        converter.finish(lyx_file_path, join_markdown(markdown), markdown_file_path, assets)
+        return IncrementalResult(markdown_file_path, chunks=len(chunks), reused=len(chunks) - len(missing))
+
+    def _convert_whole(self, lyx_file_path, output_directory, output_path, reason):
+        self._log("Converting %s in one piece: %s.", lyx_file_path, reason)
+        output_path = self.converter._convert(lyx_file_path, output_directory, output_path)
+        return IncrementalResult(output_path, fallback_reason=reason)
+
+    def _convert_chunks(self, documents, lyx_file_path):
+        """Converts chunk documents concurrently in a scratch directory, returning their Markdown."""
+        converter = self.converter
+        scratch = tempfile.mkdtemp(prefix="lyxtomarkdown-chunks-", dir=scratch_root(converter.scratch_directory))
+        base_name = os.path.splitext(os.path.basename(lyx_file_path))[0]
+        conversion = converter.metrics.current_conversion()
+
+        def export(path):
+            # The chunks' stages belong to the conversion of the whole document.
+            with converter.metrics.joined(conversion):
+                return converter.export_markdown(path)
+
+        try:
+            paths = []
+            for index, document in enumerate(documents):
+                path = os.path.join(scratch, f"{base_name}.{index:04d}.lyx")
+                with open(path, 'w', encoding='utf-8', errors='surrogateescape', newline='') as f:
+                    f.write(document)
+                paths.append(path)
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(paths))) as executor:
+                return list(executor.map(export, paths))
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+
+def join_markdown(pieces):
+    """Joins the Markdown of consecutive chunks with the blank line Pandoc puts between blocks."""
+    blocks = [piece if piece.endswith("\n") else piece + "\n" for piece in pieces if piece.strip()]
+    return "\n".join(blocks)
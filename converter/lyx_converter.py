@@ -1,12 +1,56 @@
+import contextlib
 import os
+import re
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
-from .file_utils import cleanup_files
-from .postprocess import remove_stray_character_from_md, flip_parentheses_outside_math
+from .assets import collect_assets
+from .cache import executable_fingerprint
+from .lyx_reader import LyxReader, UnsupportedLyxContent
+from .metrics import MetricsRecorder
+from .pandoc_backend import PandocError, SubprocessPandocBackend
+from .postprocess import PostProcessor
+from .rules import build_postprocessor
+from .supervision import ConversionTimeout, run_process
+from .transcode import transcode_file
+from .workspace import Workspace
+
+# Pandoc writers that produce Markdown, which the post-processing rules are written for.
+MARKDOWN_FORMATS = ("markdown", "gfm", "commonmark", "commonmark_x", "markdown_strict", "markdown_phpextra",
+                    "markdown_mmd")
+# Text formats that can be rendered alongside Markdown, with their file extensions. Binary formats
+# such as docx need an output file and are not supported.
+FORMAT_EXTENSIONS = {
+    "html": ".html", "html4": ".html", "html5": ".html", "latex": ".tex", "rst": ".rst", "org": ".org",
+    "asciidoc": ".adoc", "asciidoctor": ".adoc", "mediawiki": ".wiki", "dokuwiki": ".txt", "plain": ".txt",
+    "docbook": ".xml", "jats": ".xml", "typst": ".typ", "json": ".json",
+}
+
+# What the export and Pandoc stages raise when a document cannot be converted.
+STAGE_ERRORS = (ConversionTimeout, subprocess.CalledProcessError, PandocError, FileNotFoundError)
+
+def format_base(output_format):
+    """Returns a Pandoc output format without its extensions, e.g. "gfm" for "gfm-raw_html"."""
+    return re.split(r'[+-]', output_format, maxsplit=1)[0]
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
 
 class LyxConverter:
     """Handles the full conversion process from a LyX file to Markdown."""
-    def __init__(self, lyx_executable, pandoc_executable, logger=None):
+    PANDOC_OPTIONS = {"from": "latex", "to": "markdown", "wrap": "none"}
+    STRAY_CHARACTER = "Ł"
+    # The encoding of LyX's LaTeX export when the file declares none (Hebrew documents).
+    DEFAULT_SOURCE_ENCODING = "cp1255"
+    EXPORT_BACKENDS = ("lyx", "native")
+
+    def __init__(self, lyx_executable, pandoc_executable, logger=None, cache=None, postprocessor=None,
+                 export_backend="lyx", pandoc_backend=None, metrics=None, scratch_directory=None,
+                 asset_directory=None, hardlink_assets=False, format_postprocessors=None, toolchain=None,
+                 deadlines=None, retry_policy=None, quarantine=None):
         """
         Initializes the converter with paths to required executables.
 
@@ -14,90 +58,527 @@ class LyxConverter:
             lyx_executable (str): The path to the LyX executable.
             pandoc_executable (str): The path to the Pandoc executable.
             logger (Logger, optional): An instance of the Logger class for logging.
+            cache (ConversionCache, optional): Reuses earlier results for unchanged documents.
+            postprocessor (PostProcessor, optional): The fix-ups applied to Pandoc's output.
+                                                     Defaults to the default rules, which remove
+                                                     stray characters and flip parentheses
+                                                     outside math.
+            export_backend (str): "lyx" exports LaTeX with the LyX executable. "native" uses the
+                                  built-in LyxReader and falls back to LyX for documents it
+                                  cannot handle.
+            pandoc_backend (optional): Runs Pandoc, e.g. a PandocServerBackend. Defaults to one
+                                       Pandoc subprocess per conversion.
+            metrics (MetricsRecorder, optional): Records the time, CPU and bytes of every stage.
+            scratch_directory (str, optional): Where the per-job workspaces for the LyX export
+                                               are created. Defaults to /dev/shm when available,
+                                               else the system temporary directory.
+            asset_directory (str, optional): Where the graphics of converted documents are
+                                             stored, relative to the output directory or
+                                             absolute. The Markdown links are rewritten to
+                                             point there. Graphics are left alone when unset.
+            hardlink_assets (bool): Whether stored graphics may be hardlinks to their sources
+                                    rather than copies, where they cannot be reflinked.
+            format_postprocessors (dict, optional): The PostProcessor for each output format of
+                                                    convert(formats=...). Markdown formats
+                                                    default to postprocessor, other formats
+                                                    are not post-processed.
+            toolchain (Toolchain, optional): The probed versions of LyX and Pandoc, used in
+                                             cache keys and recorded in the metrics. Cache
+                                             keys fall back to the executables' fingerprints.
+            deadlines (Deadlines, optional): How long the LyX export and Pandoc may run for an
+                                             input of a given size before their whole process
+                                             tree is killed. Unbounded when unset.
+            retry_policy (RetryPolicy, optional): Retries stages that time out or crash.
+            quarantine (Quarantine, optional): Skips documents that failed repeatedly until
+                                               they change, and records new failures.
         """
+        if export_backend not in self.EXPORT_BACKENDS:
+            raise ValueError(f"Unknown export backend: {export_backend}")
         self.lyx_executable = lyx_executable
         self.pandoc_executable = pandoc_executable
         self.logger = logger
+        self.cache = cache
+        self.postprocessor = postprocessor or build_postprocessor()
+        self.export_backend = export_backend
+        self.pandoc_backend = pandoc_backend or SubprocessPandocBackend(pandoc_executable)
+        self.metrics = metrics or MetricsRecorder()
+        self.scratch_directory = scratch_directory
+        self.asset_directory = asset_directory
+        self.hardlink_assets = hardlink_assets
+        self.format_postprocessors = dict(format_postprocessors or {})
+        self.toolchain = toolchain
+        self.deadlines = deadlines
+        self.retry_policy = retry_policy
+        self.quarantine = quarantine
+
+    def _log(self, message, *args, level="info"):
+        """Helper method to log messages if a logger is available and enabled for the level."""
+        if self.logger and self.logger.is_enabled_for(level):
+            getattr(self.logger, level)(message, *args)
+
+    def cache_key_parts(self, assets=None):
+        """
+        Returns the toolchain identity and settings that affect the generated Markdown.
+
+        Everything returned here is part of the cache key, so changing any of it
+        invalidates earlier cached conversions.
 
-    def _log(self, message, level="info"):
-        """Helper method to log messages if a logger is available."""
-        if self.logger:
-            getattr(self.logger, level)(message)
+        Args:
+            assets (AssetLinks, optional): The document's asset links, which change whenever
+                                           one of its graphics does.
+        """
+        if self.toolchain:
+            toolchain = self.toolchain.identity()
+        else:
+            toolchain = {
+                "lyx": executable_fingerprint(self.lyx_executable),
+                "pandoc": executable_fingerprint(self.pandoc_executable),
+            }
+        settings = {
+            "export_backend": self.export_backend,
+            "pandoc_options": self.PANDOC_OPTIONS,
+            "transcoding": {"default_encoding": self.DEFAULT_SOURCE_ENCODING, "undecodable": "replace",
+                            "encoding_switches": True},
+            "postprocess": self.postprocessor.describe(),
+        }
+        if assets:
+            settings["assets"] = assets.describe()
+        return toolchain, settings
 
-    def convert(self, lyx_file_path, output_directory):
+    def convert(self, lyx_file_path, output_directory, formats=None, output_path=None):
         """
         Executes the full conversion process.
 
         Args:
             lyx_file_path (str): The absolute path to the input .lyx file.
-            output_directory (str): The directory to save the output and intermediate files.
+            output_directory (str): The directory to save the Markdown file in.
+            formats (list, optional): Pandoc output formats, e.g. ["gfm", "commonmark", "html"].
+                                      The document is exported and parsed once, and every
+                                      format is rendered from the same Pandoc AST.
+            output_path (str, optional): The Markdown file to write, e.g. one named in a manifest.
+                                         Defaults to the document's name in output_directory.
+                                         Cannot be combined with formats.
 
         Returns:
-            str: The path to the final Markdown file.
+            str: The path to the final Markdown file. With formats, a dict of the path of the
+                 file written for each format (see output_paths_for).
         """
-        self._log(f"Starting conversion for {lyx_file_path}")
+        if formats is not None and output_path:
+            raise ValueError("An output path cannot be combined with several output formats.")
+        with self.supervised(lyx_file_path):
+            if formats is not None:
+                return self._convert_formats(lyx_file_path, output_directory, list(formats))
+            return self._convert(lyx_file_path, output_directory, output_path)
+
+    @contextlib.contextmanager
+    def supervised(self, lyx_file_path):
+        """
+        Wraps one conversion of lyx_file_path: skips it if it is quarantined, groups the stages
+        recorded in the block into one conversion in the metrics, and reports the outcome to
+        the quarantine.
+
+        Raises:
+            QuarantinedDocument: If the document is quarantined.
+        """
+        if self.quarantine:
+            self.quarantine.check(lyx_file_path)
+        with self.metrics.conversion(lyx_file_path) as conversion:
+            if conversion is not None and self.toolchain:
+                conversion.toolchain = self.toolchain.versions()
+            try:
+                yield conversion
+            except RuntimeError as e:
+                if self.quarantine:
+                    self.quarantine.record_failure(lyx_file_path, e)
+                raise
+        if self.quarantine:
+            self.quarantine.record_success(lyx_file_path)
+
+    def _convert(self, lyx_file_path, output_directory, output_path=None):
+        markdown_file_path, assets = self.prepare(lyx_file_path, output_directory, output_path)
+        cache_key, hit = self.lookup_cache(lyx_file_path, markdown_file_path, assets)
+        if hit:
+            return markdown_file_path
+        try:
+            markdown = self.export_markdown(lyx_file_path)
+        except STAGE_ERRORS as e:
+            raise self.conversion_error(e)
+        return self.finish(lyx_file_path, markdown, markdown_file_path, assets, cache_key)
+
+    # The stages of a Markdown conversion other than the export and Pandoc. AsyncLyxConverter
+    # runs the same stages around its own asynchronous export and Pandoc.
+
+    def prepare(self, lyx_file_path, output_directory, output_path=None):
+        """
+        Checks the input, creates the output directory and publishes the document's graphics.
+
+        Returns:
+            tuple: (markdown_file_path, assets) where assets is the AssetLinks step for write_markdown.
+
+        Raises:
+            FileNotFoundError: If lyx_file_path does not exist.
+        """
+        self._log("Starting conversion for %s", lyx_file_path)
         if not os.path.exists(lyx_file_path):
-            self._log(f"Input file not found: {lyx_file_path}", "error")
+            self._log("Input file not found: %s", lyx_file_path, level="error")
             raise FileNotFoundError(f"LyX file not found: {lyx_file_path}")
 
         if not os.path.exists(output_directory):
-            self._log(f"Output directory {output_directory} not found, creating it.")
-            os.makedirs(output_directory)
+            self._log("Output directory %s not found, creating it.", output_directory)
+            os.makedirs(output_directory, exist_ok=True)
+
+        markdown_file_path = output_path or self.markdown_path_for(lyx_file_path, output_directory)
+        with self.metrics.stage("assets", lyx_file_path):
+            assets = self.publish_assets(lyx_file_path, output_directory)
+        return markdown_file_path, assets
+
+    def lookup_cache(self, lyx_file_path, markdown_file_path, assets=None):
+        """
+        Restores markdown_file_path from the cache if an earlier conversion can be reused.
+
+        Returns:
+            tuple: (cache_key, hit); (None, False) without a cache.
+        """
+        if not self.cache:
+            return None, False
+        with self.metrics.stage("cache", lyx_file_path) as stage:
+            cache_key = self.cache.make_key(lyx_file_path, *self.cache_key_parts(assets))
+            hit = self.cache.get(cache_key, markdown_file_path)
+            stage.detail = "hit" if hit else "miss"
+        if hit:
+            self._log("Cache hit, restored %s without converting.", markdown_file_path)
+        return cache_key, hit
+
+    def conversion_error(self, error):
+        """
+        Returns the exception to raise for one of STAGE_ERRORS: timeouts as they are, other
+        failures of LyX or Pandoc as a RuntimeError.
+        """
+        if isinstance(error, ConversionTimeout):
+            self._log("%s", error, level="error")
+            return error
+        self._log("Conversion failed: %s", error, level="error")
+        return RuntimeError(f"Conversion failed: {error}")
+
+    def finish(self, lyx_file_path, markdown, markdown_file_path, assets=None, cache_key=None):
+        """
+        Post-processes and writes Pandoc's Markdown, then stores the result in the cache under
+        cache_key, if given.
+
+        Returns:
+            str: markdown_file_path.
+        """
+        self._log("Post-processing file...")
+        metrics = self.metrics
+        with metrics.stage("postprocess", lyx_file_path,
+                           bytes_in=len(markdown.encode('utf-8')) if metrics.enabled else None) as stage:
+            processed = self.write_markdown(markdown, markdown_file_path, assets)
+            stage.bytes_out = len(processed.encode('utf-8')) if metrics.enabled else None
+
+        if self.cache and cache_key:
+            try:
+                self.cache.put(cache_key, markdown_file_path, source_path=lyx_file_path)
+            except OSError as e:
+                self._log("Could not store conversion in cache: %s", e, level="warning")
+
+        self._log("Successfully converted to %s", markdown_file_path)
+        return markdown_file_path
+
+    def _convert_formats(self, lyx_file_path, output_directory, formats):
+        self._log("Starting conversion for %s to %s", lyx_file_path, ", ".join(formats))
+        output_paths = self.output_paths_for(lyx_file_path, output_directory, formats)
+        if not os.path.exists(lyx_file_path):
+            self._log("Input file not found: %s", lyx_file_path, level="error")
+            raise FileNotFoundError(f"LyX file not found: {lyx_file_path}")
+        os.makedirs(output_directory, exist_ok=True)
+
+        with self.metrics.stage("assets", lyx_file_path):
+            assets = self.publish_assets(lyx_file_path, output_directory)
+
+        cache_keys = {}
+        pending = list(formats)
+        if self.cache:
+            with self.metrics.stage("cache", lyx_file_path) as stage:
+                toolchain, settings = self.cache_key_parts(assets)
+                for output_format in formats:
+                    cache_keys[output_format] = self.cache.make_key(lyx_file_path, toolchain, {
+                        **settings,
+                        "pandoc_options": self._render_options(output_format),
+                        "postprocess": self.postprocessor_for(output_format).describe(),
+                    })
+                pending = [f for f in formats if not self.cache.get(cache_keys[f], output_paths[f])]
+                stage.detail = f"{len(formats) - len(pending)} of {len(formats)} hit"
+            if not pending:
+                self._log("Cache hit, restored every format of %s without converting.", lyx_file_path)
+                return output_paths
+
+        metrics = self.metrics
+        try:
+            latex = self.export_latex(lyx_file_path)
+            if len(pending) == 1:
+                source, source_format = latex, "latex"
+            else:
+                # Parse once; every format is then rendered from the same AST.
+                with metrics.stage("pandoc", lyx_file_path,
+                                   bytes_in=len(latex.encode('utf-8')) if metrics.enabled else None) as stage:
+                    stage.detail = f"{self.pandoc_backend.name} json"
+                    source = self._run_pandoc(latex, {"from": "latex", "to": "json"}, lyx_file_path)
+                    stage.bytes_out = len(source.encode('utf-8')) if metrics.enabled else None
+                source_format = "json"
+
+            def render(output_format):
+                options = {**self._render_options(output_format), "from": source_format}
+                text = self._run_pandoc(source, options, lyx_file_path)
+                self.write_markdown(text, output_paths[output_format], assets,
+                                    self.postprocessor_for(output_format))
+
+            self._log("Rendering %s using Pandoc (%s)...", ", ".join(pending), self.pandoc_backend.name)
+            with metrics.stage("render", lyx_file_path) as stage:
+                stage.detail = ",".join(pending)
+                with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+                    list(executor.map(render, pending))
+        except STAGE_ERRORS as e:
+            raise self.conversion_error(e)
+
+        if self.cache:
+            for output_format in pending:
+                try:
+                    self.cache.put(cache_keys[output_format], output_paths[output_format], source_path=lyx_file_path)
+                except OSError as e:
+                    self._log("Could not store conversion in cache: %s", e, level="warning")
+
+        self._log("Successfully converted to %s", ", ".join(output_paths.values()))
+        return output_paths
 
+    def _render_options(self, output_format):
+        """Returns the Pandoc options that render a document in output_format."""
+        return {**self.PANDOC_OPTIONS, "to": output_format}
+
+    def postprocessor_for(self, output_format):
+        """Returns the PostProcessor applied to output_format."""
+        if output_format in self.format_postprocessors:
+            return self.format_postprocessors[output_format]
+        if format_base(output_format) in MARKDOWN_FORMATS:
+            return self.postprocessor
+        return PostProcessor()
+
+    def publish_assets(self, lyx_file_path, output_directory):
+        """
+        Stores the graphics referenced by a document in the asset directory.
+
+        Returns:
+            AssetLinks: The step rewriting the document's links to its graphics, or None if
+                        assets are disabled or the document has no graphics.
+        """
+        if not self.asset_directory:
+            return None
+        return collect_assets(lyx_file_path, output_directory, self.asset_directory,
+                              self.hardlink_assets, self.logger)
+
+    def write_markdown(self, markdown, markdown_file_path, assets=None, postprocessor=None):
+        """
+        Post-processes markdown, rewriting links to assets, and writes it atomically in one pass.
+
+        postprocessor defaults to the converter's; pass postprocessor_for(format) for other formats.
+        """
+        postprocessor = postprocessor or self.postprocessor
+        if assets:
+            postprocessor = PostProcessor(postprocessor.steps + [assets])
+        return postprocessor.write(markdown, markdown_file_path)
+
+    @classmethod
+    def output_paths_for(cls, lyx_file_path, output_directory, formats):
+        """
+        Returns the path of the file generated for each format.
+
+        Markdown formats are written to .md files and others to their usual extension. When
+        several formats share an extension, the format is added to the name, e.g. doc.gfm.md and
+        doc.commonmark.md.
+
+        Raises:
+            ValueError: If a format is not a text format that can be rendered.
+        """
+        extensions = {}
+        for output_format in formats:
+            base = format_base(output_format)
+            if base in MARKDOWN_FORMATS:
+                extensions[output_format] = ".md"
+            elif base in FORMAT_EXTENSIONS:
+                extensions[output_format] = FORMAT_EXTENSIONS[base]
+            else:
+                raise ValueError(f"Unsupported output format: {output_format}")
         base_name = os.path.splitext(os.path.basename(lyx_file_path))[0]
-        cp1255_tex_path = os.path.join(output_directory, f"{base_name}.tex")
-        utf8_tex_path = os.path.join(output_directory, f"{base_name}_utf8.tex")
-        markdown_file_path = os.path.join(output_directory, f"{base_name}.md")
+        used = list(extensions.values())
+        return {
+            output_format: os.path.join(
+                output_directory,
+                f"{base_name}{extension}" if used.count(extension) == 1
+                else f"{base_name}.{re.sub(r'[^A-Za-z0-9_]+', '_', output_format)}{extension}"
+            )
+            for output_format, extension in extensions.items()
+        }
+
+    @staticmethod
+    def markdown_path_for(lyx_file_path, output_directory):
+        """Returns the path of the Markdown file generated for lyx_file_path."""
+        base_name = os.path.splitext(os.path.basename(lyx_file_path))[0]
+        return os.path.join(output_directory, f"{base_name}.md")
+
+    def export_markdown(self, lyx_file_path):
+        """
+        Converts a LyX file to Markdown text, without post-processing or caching.
+
+        Returns:
+            str: Pandoc's Markdown output.
+
+        Raises:
+            subprocess.CalledProcessError: If LyX or Pandoc fails.
+            PandocError: If the Pandoc server rejects the document.
+            FileNotFoundError: If LyX did not produce the expected .tex file.
+        """
+        latex = self.export_latex(lyx_file_path)
+        metrics = self.metrics
+        with metrics.stage("pandoc", lyx_file_path,
+                           bytes_in=len(latex.encode('utf-8')) if metrics.enabled else None) as stage:
+            stage.detail = self.pandoc_backend.name
+            markdown = self._convert_tex_to_markdown(latex, lyx_file_path)
+            if isinstance(self.pandoc_backend, SubprocessPandocBackend):
+                stage.exit_status = 0
+            stage.bytes_out = len(markdown.encode('utf-8')) if metrics.enabled else None
+        return markdown
+
+    def export_latex(self, lyx_file_path):
+        """
+        Exports a LyX file to LaTeX text, decoded from the export's encoding.
+
+        Raises:
+            subprocess.CalledProcessError: If LyX fails.
+            FileNotFoundError: If LyX did not produce the expected .tex file.
+        """
+        metrics = self.metrics
+        if self.export_backend == "native":
+            with metrics.stage("native_export", lyx_file_path, bytes_in=_size(lyx_file_path)) as stage:
+                latex = self._export_native(lyx_file_path)
+                stage.detail = "fallback" if latex is None else None
+            if latex is not None:
+                return latex
+        # LyX writes its export next to the document it exports, so it exports a copy in a
+        # private workspace: concurrent jobs never share a path and the source tree is untouched.
+        with Workspace(lyx_file_path, self.scratch_directory) as workspace:
+            with metrics.stage("export", lyx_file_path, bytes_in=_size(lyx_file_path)) as stage:
+                self._attempt("export", lyx_file_path, lambda: self._export_to_tex(workspace.lyx_path))
+                stage.exit_status = 0
+                stage.bytes_out = _size(workspace.tex_path)
+            with metrics.stage("transcoding", lyx_file_path, bytes_in=_size(workspace.tex_path)) as stage:
+                transcoded = self._transcode(workspace.tex_path)
+                stage.detail = f"{transcoded.encoding} ({transcoded.source})"
+                stage.bytes_out = len(transcoded.text.encode('utf-8')) if metrics.enabled else None
+        return transcoded.text
 
+    def _export_native(self, lyx_path):
+        """
+        Exports lyx_path to LaTeX using the built-in reader.
+
+        Returns:
+            str: The LaTeX document, or None if the document uses content the reader does not
+                 support, in which case the caller falls back to the LyX export.
+        """
+        self._log("Exporting %s to LaTeX with the native reader...", lyx_path)
         try:
-            self._export_to_tex(lyx_file_path, cp1255_tex_path)
-            self._convert_encoding_to_utf8(cp1255_tex_path, utf8_tex_path)
-            self._convert_tex_to_markdown(utf8_tex_path, markdown_file_path)
+            return LyxReader().read(lyx_path)
+        except UnsupportedLyxContent as e:
+            self._log("Native export not possible, falling back to LyX. Unsupported: %s",
+                      ', '.join(e.features), level="warning")
+        except UnicodeDecodeError:
+            self._log("Native export not possible, falling back to LyX. The file is not UTF-8.", level="warning")
+        return None
 
-            self._log("Post-processing file...")
-            remove_stray_character_from_md(markdown_file_path, logger=self.logger)
-            flip_parentheses_outside_math(markdown_file_path, logger=self.logger)
+    def _deadline(self, stage, size_bytes):
+        """Returns the seconds a stage may run for an input of size_bytes, or None if unbounded."""
+        return self.deadlines.for_stage(stage, size_bytes) if self.deadlines else None
 
-            self._log(f"Successfully converted to {markdown_file_path}")
-            return markdown_file_path
-        except (subprocess.CalledProcessError, FileNotFoundError) as e:
-            self._log(f"Conversion failed: {e}", "error")
-            raise RuntimeError(f"Conversion failed: {e}")
-        finally:
-            self._log("Cleaning up intermediate files.")
-            cleanup_files(cp1255_tex_path, utf8_tex_path, logger=self.logger)
-
-    def _export_to_tex(self, lyx_path, tex_output_path):
-        self._log(f"Exporting {lyx_path} to LaTeX...")
-        result = subprocess.run(
-            [self.lyx_executable, "--export", "latex", lyx_path],
-            capture_output=True, text=True
-        )
+    def _attempt(self, stage, lyx_file_path, function):
+        """
+        Runs one stage of a conversion, retrying it under the retry policy if it times out or
+        crashes.
+
+        Raises:
+            ConversionTimeout: If the last attempt ran past its deadline.
+        """
+        def run():
+            try:
+                return function()
+            except subprocess.TimeoutExpired as e:
+                self._log("The %s stage of %s ran past its %ss deadline and was killed.",
+                          stage, lyx_file_path, e.timeout, level="warning")
+                raise ConversionTimeout(stage, e.timeout, lyx_file_path)
+
+        if self.retry_policy:
+            return self.retry_policy.call(run, f"{stage} stage of {lyx_file_path}", self.logger)
+        return run()
+
+    def _export_to_tex(self, lyx_path):
+        """
+        Runs the LyX LaTeX export, which writes the .tex file next to lyx_path.
+
+        Raises:
+            subprocess.TimeoutExpired: If LyX runs past its deadline; it is killed with every
+                                       process it started.
+        """
+        self._log("Exporting %s to LaTeX...", lyx_path)
+        result = run_process([self.lyx_executable, "--export", "latex", lyx_path],
+                             timeout=self._deadline("export", _size(lyx_path) or 0))
+        stdout = result.stdout.decode('utf-8', errors='replace')
+        stderr = result.stderr.decode("utf-8", errors="replace")
         if result.returncode != 0:
-            self._log(f"LyX export failed with exit code {result.returncode}. Stderr: {result.stderr}", "error")
-            raise subprocess.CalledProcessError(
-                result.returncode, result.args, output=result.stdout, stderr=result.stderr
-            )
-        
-        original_tex_path = os.path.splitext(lyx_path)[0] + ".tex"
-        if os.path.abspath(original_tex_path) != os.path.abspath(tex_output_path):
-            self._log(f"Moving {original_tex_path} to {tex_output_path}")
-            if os.path.exists(original_tex_path):
-                os.rename(original_tex_path, tex_output_path)
-            else:
-                raise FileNotFoundError(f"Expected .tex file not found: {original_tex_path}")
-
-    def _convert_encoding_to_utf8(self, cp1255_path, utf8_path):
-        self._log(f"Converting {cp1255_path} from CP1255 to UTF-8...")
-        with open(cp1255_path, 'r', encoding='cp1255', errors='ignore') as f:
-            content = f.read()
-        content = content.replace("Ł$", "$").replace("Ł", "")
-        with open(utf8_path, 'w', encoding='utf-8') as f:
-            f.write(content)
-
-    def _convert_tex_to_markdown(self, tex_path, md_path):
-        self._log(f"Converting {tex_path} to Markdown using Pandoc...")
-        subprocess.run(
-            [self.pandoc_executable, tex_path, "--from=latex", "--to=markdown", "--wrap=none", "-o", md_path],
-            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-        )
+            self._log("LyX export failed with exit code %s. Stderr: %s", result.returncode, stderr, level="error")
+            raise subprocess.CalledProcessError(result.returncode, result.args, output=stdout, stderr=stderr)
+
+        tex_path = os.path.splitext(lyx_path)[0] + ".tex"
+        if not os.path.exists(tex_path):
+            raise FileNotFoundError(f"Expected .tex file not found: {tex_path}")
+
+    def _transcode(self, tex_path):
+        """
+        Reads the LaTeX export in the encoding it declares (CP1255 if none) and returns a
+        TranscodeResult. Stray 'Ł' artifacts are removed unless the export is already UTF-8.
+        """
+        result = transcode_file(tex_path, default_encoding=self.DEFAULT_SOURCE_ENCODING,
+                                remove=self.STRAY_CHARACTER)
+        if result.transcoded:
+            self._log("Converted %s from %s (%s) to UTF-8.", tex_path, result.encoding, result.source)
+        else:
+            self._log("%s is already UTF-8, no transcoding needed.", tex_path)
+        if result.source == "ambiguous":
+            self._log("%s declares several encodings (%s) but never switches between them; decoded all of it as %s.",
+                      tex_path, ', '.join(result.declared), result.encoding, level="warning")
+        elif len(result.declared) > 1:
+            self._log("%s declares several encodings (%s); followed %s \\inputencoding switches.",
+                      tex_path, ', '.join(result.declared), result.switches)
+        if result.undecodable_bytes:
+            self._log("%s bytes of %s are not valid %s and were replaced with U+FFFD.",
+                      result.undecodable_bytes, tex_path, result.encoding, level="warning")
+        return result
+
+    def _convert_encoding_to_utf8(self, tex_path):
+        """Reads the LaTeX export and returns it as text, without the stray 'Ł' artifacts."""
+        return self._transcode(tex_path).text
+
+    def _convert_tex_to_markdown(self, latex, lyx_file_path=None):
+        """Converts LaTeX to Markdown with the configured Pandoc backend, entirely in memory."""
+        self._log("Converting LaTeX to Markdown using Pandoc (%s)...", self.pandoc_backend.name)
+        return self._run_pandoc(latex, self.PANDOC_OPTIONS, lyx_file_path)
+
+    def _run_pandoc(self, text, options, lyx_file_path=None):
+        """Runs the Pandoc backend within its deadline, logging its error before re-raising it."""
+        timeout = self._deadline("pandoc", len(text))
+        try:
+            return self._attempt("pandoc", lyx_file_path or "the document",
+                                 lambda: self.pandoc_backend.convert(text, options, timeout=timeout))
+        except subprocess.CalledProcessError as e:
+            stderr = (e.stderr or b"").decode('utf-8', errors='replace')
+            self._log("Pandoc failed with exit code %s. Stderr: %s", e.returncode, stderr, level="error")
+            raise
+        except PandocError as e:
+            self._log("Pandoc failed: %s", e, level="error")
+            raise
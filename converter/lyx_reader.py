@@ -0,0 +1,445 @@
+import os
+from collections import Counter
+
+# LyX 2.0 and later store documents as UTF-8 with the inset syntax handled here.
+MIN_LYX_FORMAT = 413
+
+RTL_LANGUAGES = {"hebrew", "arabic_arabi", "arabic_arabtex", "farsi"}
+
+# LyX mirrors these characters in right-to-left text when exporting LaTeX without a bidi
+# package (see Paragraph::getUChar in the LyX sources). The native reader does the same so its
+# output matches the LyX export and the existing post-processing.
+RTL_MIRROR = str.maketrans("()[]{}<>", ")(][}{><")
+
+LATEX_ESCAPES = str.maketrans({
+    "#": r"\#",
+    "$": r"\$",
+    "%": r"\%",
+    "&": r"\&",
+    "_": r"\_",
+    "{": r"\{",
+    "}": r"\}",
+    "~": r"\textasciitilde{}",
+    "^": r"\textasciicircum{}",
+})
+
+SECTION_LAYOUTS = {
+    "Part": "part",
+    "Chapter": "chapter",
+    "Section": "section",
+    "Subsection": "subsection",
+    "Subsubsection": "subsubsection",
+    "Paragraph": "paragraph",
+    "Subparagraph": "subparagraph",
+}
+PARAGRAPH_LAYOUTS = {"Standard", "Plain Layout"}
+TITLE_LAYOUTS = {"Title": "title", "Author": "author", "Date": "date"}
+LIST_LAYOUTS = {"Itemize": "itemize", "Enumerate": "enumerate"}
+ENVIRONMENT_LAYOUTS = {"Quote": "quote", "Quotation": "quotation", "Verse": "verse", "Abstract": "abstract"}
+
+FONT_COMMANDS = {
+    ("series", "bold"): r"\textbf",
+    ("shape", "italic"): r"\textit",
+    ("shape", "slanted"): r"\textsl",
+    ("shape", "smallcaps"): r"\textsc",
+    ("family", "typewriter"): r"\texttt",
+    ("family", "sans"): r"\textsf",
+    ("emph", "on"): r"\emph",
+    ("noun", "on"): r"\textsc",
+    ("bar", "under"): r"\underline",
+    ("strikeout", "on"): r"\sout",
+}
+FONT_ATTRIBUTES = {"series", "shape", "family", "emph", "noun", "bar", "strikeout"}
+IGNORED_FONT_ATTRIBUTES = {"size", "color", "numeric", "uuline", "uwave", "xout", "nospellcheck"}
+PARAGRAPH_PARAMETERS = {
+    "\\align", "\\noindent", "\\paragraph_spacing", "\\labelwidthstring", "\\leftindent",
+    "\\start_of_appendix", "\\added_space_top", "\\added_space_bottom", "\\indent",
+}
+
+QUOTE_MARKS = {("l", "d"): "``", ("r", "d"): "''", ("l", "s"): "`", ("r", "s"): "'"}
+REFERENCE_COMMANDS = {"ref", "eqref", "pageref", "vref", "vpageref", "formatted", "nameref"}
+
+
+class UnsupportedLyxContent(Exception):
+    """Raised when a document uses layouts or insets the native reader cannot export."""
+    def __init__(self, features):
+        self.features = sorted(features)
+        super().__init__(f"Unsupported LyX content: {', '.join(self.features)}")
+
+
+class _Paragraph:
+    """A parsed layout: its LaTeX content and any nested (deeper) paragraphs."""
+    def __init__(self, layout, content):
+        self.layout = layout
+        self.content = content
+        self.children = []
+
+
+class LyxReader:
+    """
+    Renders .lyx files as LaTeX without starting the LyX application.
+
+    The reader covers the layouts and insets that lecture notes typically use. Anything else is
+    reported through UnsupportedLyxContent so the caller can fall back to `lyx --export latex`.
+    """
+    def __init__(self):
+        self._lines = []
+        self._pos = 0
+        self._unsupported = set()
+        self._language = "english"
+
+    def read(self, lyx_file_path):
+        """
+        Converts a .lyx file to a complete LaTeX document.
+
+        Args:
+            lyx_file_path (str): The path to the .lyx file.
+
+        Returns:
+            str: The LaTeX document.
+
+        Raises:
+            UnsupportedLyxContent: If the document needs features only LyX can export. The
+                                   exception lists every such feature, not just the first.
+        """
+        with open(lyx_file_path, 'r', encoding='utf-8') as f:
+            return self.read_string(f.read())
+
+    def read_string(self, lyx_text):
+        """Converts the contents of a .lyx file to a complete LaTeX document."""
+        self._lines = lyx_text.splitlines()
+        self._pos = 0
+        self._unsupported = set()
+        self._language = "english"
+
+        preamble = self._parse_header()
+        if not self._skip_to("\\begin_body"):
+            self._unsupported.add("structure:missing_body")
+            raise UnsupportedLyxContent(self._unsupported)
+
+        blocks = self._parse_blocks(end_token="\\end_body")
+        body = self._render_blocks(blocks)
+        if self._unsupported:
+            raise UnsupportedLyxContent(self._unsupported)
+
+        parts = ["\\documentclass{article}", "\\usepackage[utf8]{inputenc}"]
+        if preamble:
+            parts.append(preamble)
+        parts.extend(["\\begin{document}", body, "\\end{document}", ""])
+        return "\n".join(parts)
+
+    # --- Header ---
+
+    def _parse_header(self):
+        """Reads the document settings the reader needs and returns the user preamble."""
+        preamble = []
+        while self._pos < len(self._lines):
+            line = self._lines[self._pos]
+            self._pos += 1
+            fields = line.split()
+            key = fields[0] if fields else ""
+            if key in ("\\lyxformat", "\\language") and len(fields) != 2:
+                # A malformed header is left to LyX, which reports it properly.
+                raise UnsupportedLyxContent([f"header:{key[1:]}"])
+            if key == "\\lyxformat":
+                fmt = fields[1]
+                if not (fmt.isascii() and fmt.isdigit()) or int(fmt) < MIN_LYX_FORMAT:
+                    self._unsupported.add(f"lyxformat:{fmt}")
+            elif key == "\\language":
+                self._language = fields[1]
+            elif line == "\\begin_preamble":
+                while self._pos < len(self._lines) and self._lines[self._pos] != "\\end_preamble":
+                    preamble.append(self._lines[self._pos])
+                    self._pos += 1
+            elif line == "\\end_header":
+                break
+        return "\n".join(preamble)
+
+    def _skip_to(self, token):
+        while self._pos < len(self._lines):
+            line = self._lines[self._pos]
+            self._pos += 1
+            if line == token:
+                return True
+        return False
+
+    # --- Body ---
+
+    def _parse_blocks(self, end_token):
+        """Parses layouts until end_token, attaching \\begin_deeper groups to their parent."""
+        blocks = []
+        while self._pos < len(self._lines):
+            line = self._lines[self._pos]
+            self._pos += 1
+            if line == end_token:
+                break
+            if line.startswith("\\begin_layout "):
+                blocks.append(self._parse_layout(line[len("\\begin_layout "):]))
+            elif line == "\\begin_deeper":
+                children = self._parse_blocks(end_token="\\end_deeper")
+                if blocks:
+                    blocks[-1].children.extend(children)
+                else:
+                    blocks.extend(children)
+            elif line.strip():
+                self._unsupported.add(f"token:{line.split()[0]}")
+        return blocks
+
+    def _parse_layout(self, layout):
+        """Parses the inline content of a layout up to its \\end_layout."""
+        state = _FontState(self._language)
+        out = []
+        while self._pos < len(self._lines):
+            line = self._lines[self._pos]
+            self._pos += 1
+            if line == "\\end_layout":
+                break
+            if not line.startswith("\\"):
+                out.append(state.text(line))
+                continue
+
+            token, _, argument = line.partition(" ")
+            if token == "\\begin_inset":
+                out.append(state.close_all())
+                out.append(self._parse_inset(argument, state))
+                out.append(state.reopen())
+            elif token == "\\backslash":
+                out.append(r"\textbackslash{}")
+            elif token == "\\lang":
+                state.language = argument
+            elif token[1:] in FONT_ATTRIBUTES:
+                out.append(state.set(token[1:], argument))
+            elif token[1:] in IGNORED_FONT_ATTRIBUTES or token in PARAGRAPH_PARAMETERS:
+                continue
+            elif token == "\\lyxline":
+                out.append("\\noindent\\rule{\\linewidth}{0.5pt}")
+            else:
+                self._unsupported.add(f"token:{token}")
+        out.append(state.close_all())
+        return _Paragraph(layout, "".join(out))
+
+    def _collect_inset_lines(self):
+        """Returns the raw lines of an inset up to its matching \\end_inset."""
+        depth = 1
+        lines = []
+        while self._pos < len(self._lines):
+            line = self._lines[self._pos]
+            self._pos += 1
+            if line.startswith("\\begin_inset"):
+                depth += 1
+            elif line == "\\end_inset":
+                depth -= 1
+                if depth == 0:
+                    break
+            lines.append(line)
+        return lines
+
+    def _parse_nested_text(self):
+        """Parses the layouts inside an inset (footnotes, greyed-out notes) up to \\end_inset."""
+        blocks = self._parse_blocks(end_token="\\end_inset")
+        return self._render_blocks(blocks)
+
+    def _parse_inset(self, argument, state):
+        kind, _, rest = argument.partition(" ")
+
+        if kind == "Formula":
+            lines = self._collect_inset_lines()
+            return "\n".join([rest] + lines).strip()
+
+        if kind == "Quotes":
+            style = rest.strip()
+            mark = QUOTE_MARKS.get((style[1:2], style[2:3])) if len(style) == 3 else None
+            self._collect_inset_lines()
+            if mark is None:
+                self._unsupported.add(f"inset:Quotes {style}")
+                return ""
+            return mark
+
+        if kind == "Newline":
+            self._collect_inset_lines()
+            return "\\\\\n" if rest.strip() == "newline" else "\\linebreak{}\n"
+
+        if kind == "space":
+            self._collect_inset_lines()
+            command = rest.strip()
+            if command.startswith("\\hspace"):
+                # Custom lengths are stored on a separate \length line that only LyX resolves.
+                self._unsupported.add(f"inset:space {command}")
+                return ""
+            return " " if command in ("", "\\space{}") else command
+
+        if kind == "ERT":
+            return self._raw_inset_text(self._collect_inset_lines())
+
+        if kind == "Note":
+            if rest.strip() == "Greyedout":
+                self._skip_inset_parameters()
+                return self._parse_nested_text()
+            # Notes and comments never appear in the exported document.
+            self._collect_inset_lines()
+            return ""
+
+        if kind == "Foot":
+            self._skip_inset_parameters()
+            return f"\\footnote{{{self._parse_nested_text()}}}"
+
+        if kind == "CommandInset":
+            return self._command_inset(rest.strip(), self._collect_inset_lines())
+
+        self._unsupported.add(f"inset:{kind}")
+        self._collect_inset_lines()
+        return ""
+
+    def _skip_inset_parameters(self):
+        """Skips inset parameter lines such as 'status open' that precede the inset's layouts."""
+        while self._pos < len(self._lines):
+            line = self._lines[self._pos]
+            if line.startswith("\\begin_layout ") or line == "\\end_inset":
+                return
+            self._pos += 1
+
+    def _raw_inset_text(self, lines):
+        """Reassembles the literal text of an ERT inset, one line per Plain Layout paragraph."""
+        paragraphs = []
+        current = None
+        for line in lines:
+            if line.startswith("\\begin_layout"):
+                current = []
+            elif line == "\\end_layout":
+                paragraphs.append("".join(current or []))
+                current = None
+            elif current is not None:
+                if line == "\\backslash":
+                    current.append("\\")
+                elif line.startswith("\\") and line.split()[0][1:] in FONT_ATTRIBUTES | IGNORED_FONT_ATTRIBUTES:
+                    continue
+                elif line.startswith("\\lang "):
+                    continue
+                else:
+                    current.append(line)
+        return "\n".join(paragraphs)
+
+    def _command_inset(self, command_type, lines):
+        params = {}
+        for line in lines:
+            key, _, value = line.partition(" ")
+            params[key] = value.strip().strip('"')
+        command = params.get("LatexCommand", "")
+
+        if command_type == "label":
+            return f"\\label{{{params.get('name', '')}}}"
+        if command_type == "ref" and command in REFERENCE_COMMANDS:
+            latex_command = "ref" if command in ("formatted", "vref") else command
+            return f"\\{latex_command}{{{params.get('reference', '')}}}"
+        if command_type == "href":
+            target = params.get("target", "")
+            name = params.get("name", "") or target
+            return f"\\href{{{target}}}{{{name.translate(LATEX_ESCAPES)}}}"
+
+        self._unsupported.add(f"inset:CommandInset {command_type}")
+        return ""
+
+    # --- Rendering ---
+
+    def _render_blocks(self, blocks):
+        """Renders parsed paragraphs, grouping consecutive list items into environments."""
+        out = []
+        i = 0
+        while i < len(blocks):
+            block = blocks[i]
+            layout = block.layout.rstrip("*")
+
+            if layout in LIST_LAYOUTS:
+                environment = LIST_LAYOUTS[layout]
+                items = []
+                while i < len(blocks) and blocks[i].layout == block.layout:
+                    item = f"\\item {blocks[i].content}"
+                    if blocks[i].children:
+                        item += "\n" + self._render_blocks(blocks[i].children)
+                    items.append(item)
+                    i += 1
+                out.append(f"\\begin{{{environment}}}\n" + "\n".join(items) + f"\n\\end{{{environment}}}")
+                continue
+
+            out.append(self._render_paragraph(block, layout))
+            if block.children:
+                out.append(self._render_blocks(block.children))
+            i += 1
+
+            if layout in TITLE_LAYOUTS and (i == len(blocks) or blocks[i].layout not in TITLE_LAYOUTS):
+                out.append("\\maketitle")
+        return "\n\n".join(part for part in out if part)
+
+    def _render_paragraph(self, block, layout):
+        if layout in PARAGRAPH_LAYOUTS:
+            return block.content
+        if layout in SECTION_LAYOUTS:
+            star = "*" if block.layout.endswith("*") else ""
+            return f"\\{SECTION_LAYOUTS[layout]}{star}{{{block.content}}}"
+        if layout in TITLE_LAYOUTS:
+            return f"\\{TITLE_LAYOUTS[layout]}{{{block.content}}}"
+        if layout in ENVIRONMENT_LAYOUTS:
+            environment = ENVIRONMENT_LAYOUTS[layout]
+            return f"\\begin{{{environment}}}\n{block.content}\n\\end{{{environment}}}"
+        self._unsupported.add(f"layout:{block.layout}")
+        return ""
+
+
+class _FontState:
+    """Tracks character attributes within a paragraph and emits the matching LaTeX groups."""
+    def __init__(self, language):
+        self.language = language
+        self.attributes = {}
+        self.open_commands = []
+
+    def text(self, line):
+        if self.language in RTL_LANGUAGES:
+            line = line.translate(RTL_MIRROR)
+        return line.translate(LATEX_ESCAPES)
+
+    def set(self, attribute, value):
+        """Changes one attribute, closing and reopening groups so they always nest correctly."""
+        if value in ("default", "off", "inherit", "no"):
+            self.attributes.pop(attribute, None)
+        else:
+            self.attributes[attribute] = value
+        return self.close_all() + self.reopen()
+
+    def close_all(self):
+        closing = "}" * len(self.open_commands)
+        self.open_commands = []
+        return closing
+
+    def reopen(self):
+        self.open_commands = [
+            FONT_COMMANDS[(attribute, value)]
+            for attribute, value in sorted(self.attributes.items())
+            if (attribute, value) in FONT_COMMANDS
+        ]
+        return "".join(f"{command}{{" for command in self.open_commands)
+
+
+def scan_coverage(lyx_file_paths):
+    """
+    Measures how much of a corpus the native reader can export on its own.
+
+    Args:
+        lyx_file_paths (list): The .lyx files to check.
+
+    Returns:
+        tuple: (number of fully supported files, Counter mapping each unsupported feature to the
+               number of files that use it, dict mapping file paths to read errors).
+    """
+    supported = 0
+    features = Counter()
+    errors = {}
+    reader = LyxReader()
+    for path in lyx_file_paths:
+        try:
+            reader.read(path)
+            supported += 1
+        except UnsupportedLyxContent as e:
+            features.update(e.features)
+        except (OSError, UnicodeDecodeError) as e:
+            errors[os.path.abspath(path)] = str(e)
+    return supported, features, errors
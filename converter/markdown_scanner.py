@@ -0,0 +1,194 @@
+import re
+
+TEXT = "text"
+MATH = "math"
+CODE = "code"
+
+# Everything that can change the scanner's state while it is in ordinary text. Escapes are
+# matched as pairs, so "\$" stays text and "\\$" still opens math.
+_FENCE_OPEN = r'(?P<fence>^ {0,3}(?:`{3,}[^`\n]*|~{3,}[^\n]*)(?:\n|\Z))'
+_TOKEN = r'(?P<token>\\[(\[]|\\[\s\S]|\$\$|\$|`+)'
+_TEXT_EVENTS = re.compile(f'{_FENCE_OPEN}|{_TOKEN}', flags=re.MULTILINE)
+# Blank lines only matter while some opener has failed in the current paragraph.
+_TEXT_EVENTS_WITH_BLANKS = re.compile(f'{_FENCE_OPEN}|(?P<blank>^[ \\t]*\\n)|{_TOKEN}', flags=re.MULTILINE)
+_FENCE_CLOSE = re.compile(r'^ {0,3}(`{3,}|~{3,})[ \t]*(?:\n|\Z)', flags=re.MULTILINE)
+_BLANK_LINE = re.compile(r'^[ \t]*\n', flags=re.MULTILINE)
+_MATH_CLOSERS = {
+    "$": (re.compile(r'\\[\s\S]|\$'), "$"),
+    "$$": (re.compile(r'\\[\s\S]|\$\$'), "$$"),
+    "\\(": (re.compile(r'\\\)|\\[\s\S]'), "\\)"),
+    "\\[": (re.compile(r'\\\]|\\[\s\S]'), "\\]"),
+}
+_BACKTICKS = re.compile(r'`+')
+
+
+class MarkdownScanner:
+    """
+    Splits Markdown into text, math and code regions in a single pass.
+
+    Input is fed in chunks of any size and regions are emitted as soon as they are known, so a
+    document never has to be held in memory as a whole. Recognized regions:
+
+    - math: $...$, $$...$$, \\(...\\) and \\[...\\] (escaped dollars such as \\$ are text)
+    - code: fenced code blocks (``` or ~~~) and inline code spans
+
+    Like Pandoc, math and code spans cannot cross a blank line, and an opener without a closer
+    in its paragraph is literal text. Each paragraph remembers which openers already failed, so
+    unmatched delimiters are never searched for twice and the scan stays linear.
+    """
+    def __init__(self):
+        self._buffer = ""
+        self._partial = ""
+        self._pending = None  # [key, opener start, opener end, resume offset] inside math/code
+        self._fence = None  # (fence character, fence length) inside a fenced code block
+        self._failed = set()
+        self._paragraph_end = None  # cached offset of the next blank line while a span is pending
+        self._regions = []
+
+    def feed(self, chunk):
+        """
+        Scans the next chunk of the document.
+
+        Returns:
+            list: (kind, text) regions completed so far. Consecutive regions may share a kind.
+        """
+        data = self._partial + chunk
+        end = data.rfind("\n") + 1
+        self._partial = data[end:]
+        if end:
+            # Only whole lines are scanned, so line-based constructs never straddle a chunk.
+            self._buffer += data[:end]
+            self._scan(final=False)
+        return self._take_regions()
+
+    def close(self):
+        """Scans any remaining input and returns the final regions."""
+        self._buffer += self._partial
+        self._partial = ""
+        self._scan(final=True)
+        return self._take_regions()
+
+    def _take_regions(self):
+        regions = self._regions
+        self._regions = []
+        return regions
+
+    def _emit(self, kind, text):
+        if text:
+            self._regions.append((kind, text))
+
+    def _scan(self, final):
+        buffer = self._buffer
+        pos = 0
+        while pos < len(buffer) or self._pending is not None:
+            if self._fence is not None:
+                pos = self._scan_fence(buffer, pos)
+                continue
+
+            if self._pending is not None:
+                new_pos = self._scan_pending(buffer, final)
+                if new_pos is None:
+                    # The closer may still arrive in a later chunk; keep the paragraph.
+                    self._buffer = buffer[self._pending[1]:]
+                    self._pending[2] -= self._pending[1]
+                    self._pending[3] = len(self._buffer)
+                    self._pending[1] = 0
+                    self._paragraph_end = None
+                    return
+                pos = new_pos
+                continue
+
+            events = _TEXT_EVENTS_WITH_BLANKS if self._failed else _TEXT_EVENTS
+            match = events.search(buffer, pos)
+            if not match:
+                self._emit(TEXT, buffer[pos:])
+                pos = len(buffer)
+                break
+            self._emit(TEXT, buffer[pos:match.start()])
+
+            if match.lastgroup == "fence":
+                fence = match.group().lstrip(" ")
+                length = len(fence) - len(fence.lstrip(fence[0]))
+                self._fence = (fence[0], length)
+                self._emit(CODE, match.group())
+            elif match.lastgroup == "blank":
+                self._failed.clear()
+                self._emit(TEXT, match.group())
+            else:
+                token = match.group()
+                key = ("`", len(token)) if token[0] == "`" else token
+                if (token[0] == "\\" and token not in _MATH_CLOSERS) or key in self._failed:
+                    self._emit(TEXT, token)
+                else:
+                    self._pending = [key, match.start(), match.end(), match.end()]
+            pos = match.end()
+        self._buffer = ""
+        self._paragraph_end = None
+
+    def _scan_fence(self, buffer, pos):
+        """Emits fenced code up to and including the closing fence, or to the end of the buffer."""
+        char, length = self._fence
+        for match in _FENCE_CLOSE.finditer(buffer, pos):
+            fence = match.group(1)
+            if fence[0] == char and len(fence) >= length:
+                self._emit(CODE, buffer[pos:match.end()])
+                self._fence = None
+                return match.end()
+        self._emit(CODE, buffer[pos:])
+        return len(buffer)
+
+    def _scan_pending(self, buffer, final):
+        """
+        Looks for the closer of the pending math or code span.
+
+        Returns:
+            int: The offset to continue scanning from, or None if more input is needed.
+        """
+        key, start, opener_end, resume = self._pending
+        if self._paragraph_end is None or self._paragraph_end < resume:
+            boundary = _BLANK_LINE.search(buffer, resume)
+            self._paragraph_end = boundary.start() if boundary else len(buffer)
+        end = self._find_closer(key, buffer, resume, self._paragraph_end)
+
+        if end is not None:
+            self._emit(CODE if isinstance(key, tuple) else MATH, buffer[start:end])
+            self._pending = None
+            return end
+        if self._paragraph_end == len(buffer) and not final:
+            return None
+
+        # The paragraph ended without a closer: the opener is literal text.
+        self._failed.add(key)
+        self._emit(TEXT, buffer[start:opener_end])
+        self._pending = None
+        return opener_end
+
+    def _find_closer(self, key, buffer, pos, limit):
+        if isinstance(key, tuple):
+            for match in _BACKTICKS.finditer(buffer, pos, limit):
+                if match.end() - match.start() == key[1]:
+                    return match.end()
+            return None
+        pattern, closer = _MATH_CLOSERS[key]
+        for match in pattern.finditer(buffer, pos, limit):
+            if match.group() == closer:
+                return match.end()
+        return None
+
+
+def scan_regions(chunks):
+    """
+    Scans an iterable of text chunks.
+
+    Yields:
+        tuple: (kind, text) regions, where kind is TEXT, MATH or CODE.
+    """
+    scanner = MarkdownScanner()
+    for chunk in chunks:
+        yield from scanner.feed(chunk)
+    yield from scanner.close()
+
+
+def read_chunks(stream, chunk_size=64 * 1024):
+    """Yields fixed-size chunks from a text stream."""
+    return iter(lambda: stream.read(chunk_size), "")
@@ -0,0 +1,411 @@
+import contextlib
+import contextvars
+import json
+import os
+import subprocess
+import threading
+import time
+
+from .file_utils import atomic_write_text
+
+try:
+    import resource
+except ImportError:  # Windows: CPU time of child processes is unavailable.
+    resource = None
+
+# Upper bounds, in seconds, of the Prometheus latency histogram buckets.
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _children_cpu_time():
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class StageMetrics:
+    """Measurements of one stage of one conversion."""
+    def __init__(self, stage, lyx_file_path, bytes_in=None):
+        self.stage = stage
+        self.lyx_file_path = lyx_file_path
+        self.bytes_in = bytes_in
+        self.bytes_out = None
+        self.exit_status = None  # Set for stages that run LyX or Pandoc.
+        self.wall_time = 0.0
+        self.cpu_time = 0.0  # CPU time of this thread.
+        self.child_cpu_time = 0.0  # CPU time of finished subprocesses; approximate when conversions overlap.
+        self.error = None
+        self.detail = None
+
+    @property
+    def succeeded(self):
+        return self.error is None
+
+    def to_dict(self):
+        return {
+            "stage": self.stage,
+            "file": self.lyx_file_path,
+            "wall_time": round(self.wall_time, 6),
+            "cpu_time": round(self.cpu_time, 6),
+            "child_cpu_time": round(self.child_cpu_time, 6),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "exit_status": self.exit_status,
+            "detail": self.detail,
+            "error": self.error,
+        }
+
+
+class ConversionMetrics:
+    """Measurements of a whole conversion, made up of its stages."""
+    def __init__(self, lyx_file_path):
+        self.lyx_file_path = lyx_file_path
+        self.stages = []
+        self.wall_time = 0.0
+        self.error = None
+        # The LyX and Pandoc versions that produced the output, when known.
+        self.toolchain = None
+
+    @property
+    def succeeded(self):
+        return self.error is None
+
+    def to_dict(self):
+        return {
+            "file": self.lyx_file_path,
+            "wall_time": round(self.wall_time, 6),
+            "succeeded": self.succeeded,
+            "error": self.error,
+            "toolchain": self.toolchain,
+            "stages": [stage.to_dict() for stage in self.stages],
+        }
+
+
+class MetricsHook:
+    """
+    Receives measurements from a MetricsRecorder.
+
+    Hooks are called from the thread that runs the conversion, so implementations must be
+    thread-safe.
+    """
+    def on_stage(self, stage):
+        """Called with a StageMetrics when a stage ends."""
+
+    def on_conversion(self, conversion):
+        """Called with a ConversionMetrics when a conversion ends."""
+
+    def close(self):
+        """Flushes any buffered output."""
+
+
+class MetricsRecorder:
+    """Times conversion stages and passes the measurements to its hooks."""
+    def __init__(self, hooks=None):
+        """
+        Args:
+            hooks (list, optional): MetricsHook instances. Without hooks nothing is measured.
+        """
+        self.hooks = list(hooks or [])
+        # The conversion being recorded. Every thread, and every asyncio task, has its own, and
+        # asyncio.to_thread passes a task's conversion on to the thread it starts.
+        self._conversion = contextvars.ContextVar("conversion", default=None)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_conversion"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._conversion = contextvars.ContextVar("conversion", default=None)
+
+    @property
+    def enabled(self):
+        return bool(self.hooks)
+
+    @contextlib.contextmanager
+    def conversion(self, lyx_file_path):
+        """Groups the stages recorded on this thread (or asyncio task) until the block ends into one conversion."""
+        if not self.enabled:
+            yield None
+            return
+        conversion = ConversionMetrics(lyx_file_path)
+        token = self._conversion.set(conversion)
+        start = time.perf_counter()
+        try:
+            yield conversion
+        except BaseException as e:
+            conversion.error = str(e) or type(e).__name__
+            raise
+        finally:
+            conversion.wall_time = time.perf_counter() - start
+            self._conversion.reset(token)
+            for hook in self.hooks:
+                hook.on_conversion(conversion)
+
+    def current_conversion(self):
+        """Returns the conversion that stages recorded on this thread belong to, or None."""
+        return self._conversion.get() if self.enabled else None
+
+    @contextlib.contextmanager
+    def joined(self, conversion):
+        """Adds the stages recorded on this thread in the block to a conversion begun on another thread."""
+        token = self._conversion.set(conversion)
+        try:
+            yield
+        finally:
+            self._conversion.reset(token)
+
+    @contextlib.contextmanager
+    def stage(self, name, lyx_file_path, bytes_in=None):
+        """
+        Measures one stage. The yielded StageMetrics can be filled in with bytes_out,
+        exit_status and detail; a CalledProcessError sets exit_status automatically.
+        """
+        stage = StageMetrics(name, lyx_file_path, bytes_in)
+        if not self.enabled:
+            yield stage
+            return
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        children_start = _children_cpu_time()
+        try:
+            yield stage
+        except subprocess.CalledProcessError as e:
+            stage.exit_status = e.returncode
+            stage.error = str(e)
+            raise
+        except BaseException as e:
+            stage.error = str(e) or type(e).__name__
+            raise
+        finally:
+            stage.wall_time = time.perf_counter() - wall_start
+            stage.cpu_time = time.thread_time() - cpu_start
+            stage.child_cpu_time = max(0.0, _children_cpu_time() - children_start)
+            conversion = self._conversion.get()
+            if conversion is not None:
+                conversion.stages.append(stage)
+            for hook in self.hooks:
+                hook.on_stage(stage)
+
+    def close(self):
+        for hook in self.hooks:
+            hook.close()
+
+
+class JsonLinesExporter(MetricsHook):
+    """
+    Appends one JSON object per finished conversion to a file.
+
+    Each line is written with a single append, so several processes can share the file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def on_conversion(self, conversion):
+        line = json.dumps({"timestamp": time.time(), **conversion.to_dict()}, ensure_ascii=False) + "\n"
+        with self._lock:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+
+class PrometheusTextfileExporter(MetricsHook):
+    """
+    Aggregates stage latencies into histograms in the Prometheus text format.
+
+    The file is meant for the node_exporter textfile collector. It is rewritten atomically at most
+    every flush_interval seconds and when the exporter is closed. Aggregates live in this process,
+    so use one exporter per process (i.e. threads, not --processes).
+    """
+    PREFIX = "lyxtomarkdown"
+
+    def __init__(self, path, flush_interval=5.0, buckets=LATENCY_BUCKETS):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._stage_latency = {}
+        self._stage_cpu = {}
+        self._stage_bytes = {}
+        self._stage_failures = {}
+        self._conversion_latency = _Histogram(buckets)
+        self._conversions = {"succeeded": 0, "failed": 0}
+        self._last_flush = 0.0
+
+    def __getstate__(self):
+        raise TypeError("PrometheusTextfileExporter aggregates in one process; use threads instead.")
+
+    def on_stage(self, stage):
+        with self._lock:
+            self._stage_latency.setdefault(stage.stage, _Histogram(self.buckets)).observe(stage.wall_time)
+            cpu = self._stage_cpu.setdefault(stage.stage, [0.0, 0.0])
+            cpu[0] += stage.cpu_time
+            cpu[1] += stage.child_cpu_time
+            transferred = self._stage_bytes.setdefault(stage.stage, [0, 0])
+            transferred[0] += stage.bytes_in or 0
+            transferred[1] += stage.bytes_out or 0
+            if not stage.succeeded:
+                self._stage_failures[stage.stage] = self._stage_failures.get(stage.stage, 0) + 1
+
+    def on_conversion(self, conversion):
+        with self._lock:
+            self._conversion_latency.observe(conversion.wall_time)
+            self._conversions["succeeded" if conversion.succeeded else "failed"] += 1
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush_locked()
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        atomic_write_text(self.path, self.render())
+
+    def _render_histogram(self, lines, name, histogram, labels=""):
+        separator = "," if labels else ""
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {histogram.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {histogram.sum:.6f}")
+        lines.append(f"{name}_count{suffix} {histogram.count}")
+
+    def render(self):
+        """Returns the current metrics in the Prometheus text exposition format."""
+        p = self.PREFIX
+        lines = [
+            f"# HELP {p}_stage_duration_seconds Wall-clock time of each conversion stage.",
+            f"# TYPE {p}_stage_duration_seconds histogram",
+        ]
+        for stage, histogram in sorted(self._stage_latency.items()):
+            self._render_histogram(lines, f"{p}_stage_duration_seconds", histogram, f'stage="{stage}"')
+
+        lines += [
+            f"# HELP {p}_stage_cpu_seconds_total CPU time of each stage, in this process and in LyX/Pandoc.",
+            f"# TYPE {p}_stage_cpu_seconds_total counter",
+        ]
+        for stage, (own, children) in sorted(self._stage_cpu.items()):
+            lines.append(f'{p}_stage_cpu_seconds_total{{stage="{stage}",process="self"}} {own:.6f}')
+            lines.append(f'{p}_stage_cpu_seconds_total{{stage="{stage}",process="children"}} {children:.6f}')
+
+        lines += [
+            f"# HELP {p}_stage_bytes_total Bytes read and written by each stage.",
+            f"# TYPE {p}_stage_bytes_total counter",
+        ]
+        for stage, (bytes_in, bytes_out) in sorted(self._stage_bytes.items()):
+            lines.append(f'{p}_stage_bytes_total{{stage="{stage}",direction="in"}} {bytes_in}')
+            lines.append(f'{p}_stage_bytes_total{{stage="{stage}",direction="out"}} {bytes_out}')
+
+        lines += [
+            f"# HELP {p}_stage_failures_total Stages that raised an error.",
+            f"# TYPE {p}_stage_failures_total counter",
+        ]
+        for stage, failures in sorted(self._stage_failures.items()):
+            lines.append(f'{p}_stage_failures_total{{stage="{stage}"}} {failures}')
+
+        lines += [
+            f"# HELP {p}_conversion_duration_seconds Wall-clock time of whole conversions.",
+            f"# TYPE {p}_conversion_duration_seconds histogram",
+        ]
+        self._render_histogram(lines, f"{p}_conversion_duration_seconds", self._conversion_latency)
+
+        lines += [
+            f"# HELP {p}_conversions_total Finished conversions by outcome.",
+            f"# TYPE {p}_conversions_total counter",
+        ]
+        for status, count in sorted(self._conversions.items()):
+            lines.append(f'{p}_conversions_total{{status="{status}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+class StageSummary(MetricsHook):
+    """Collects stage latencies in memory and formats per-stage percentiles for a batch report."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencies = {}
+
+    def __getstate__(self):
+        raise TypeError("StageSummary aggregates in one process; use threads instead.")
+
+    def on_stage(self, stage):
+        with self._lock:
+            self._latencies.setdefault(stage.stage, []).append(stage.wall_time)
+
+    def format(self):
+        """Returns a table of count, total, median, 95th percentile and maximum time per stage."""
+        lines = [f"{'stage':<14} {'count':>6} {'total s':>9} {'p50 s':>8} {'p95 s':>8} {'max s':>8}"]
+        with self._lock:
+            for stage, values in self._latencies.items():
+                ordered = sorted(values)
+
+                def percentile(fraction):
+                    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+                lines.append(f"{stage:<14} {len(ordered):>6} {sum(ordered):>9.2f} {percentile(0.5):>8.3f} "
+                             f"{percentile(0.95):>8.3f} {ordered[-1]:>8.3f}")
+        return "\n".join(lines)
+
+
+def profile_conversion(converter, lyx_file_path, output_directory, profile_path, top=25):
+    """
+    Converts a single file under cProfile and tracemalloc.
+
+    Writes the cProfile statistics to profile_path (readable with pstats or snakeviz) and a text
+    report of the top functions and allocation sites to profile_path + ".txt".
+
+    Returns:
+        str: The path to the final Markdown file.
+    """
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    try:
+        profiler.enable()
+        try:
+            return converter.convert(lyx_file_path=lyx_file_path, output_directory=output_directory)
+        finally:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        profiler.dump_stats(profile_path)
+        with open(profile_path + ".txt", 'w', encoding='utf-8') as report:
+            report.write(f"Profile of {lyx_file_path}\n\n")
+            stats = pstats.Stats(profiler, stream=report)
+            stats.sort_stats("cumulative").print_stats(top)
+            report.write(f"\nPeak traced memory: {peak / 1024 / 1024:.2f} MB\n")
+            report.write(f"Top {top} allocation sites:\n")
+            for statistic in snapshot.statistics("lineno")[:top]:
+                report.write(f"  {statistic}\n")
@@ -0,0 +1,339 @@
+import itertools
+import json
+import os
+import shutil
+import socket
+import subprocess
+import threading
+import time
+
+from .supervision import run_process
+
+
+class PandocError(Exception):
+    """Raised when Pandoc rejects a document."""
+
+
+def options_to_args(options):
+    """Turns {"from": "latex", "wrap": "none"} into ["--from=latex", "--wrap=none"]."""
+    return [f"--{key}={value}" for key, value in options.items()]
+
+
+class SubprocessPandocBackend:
+    """Runs a fresh Pandoc process for every conversion, piping the text through stdin/stdout."""
+    name = "subprocess"
+
+    def __init__(self, pandoc_executable):
+        self.pandoc_executable = pandoc_executable
+
+    def convert(self, text, options, timeout=None):
+        """
+        Converts text with Pandoc.
+
+        Args:
+            text (str): The input document.
+            options (dict): Pandoc options such as {"from": "latex", "to": "markdown"}.
+            timeout (float, optional): Seconds Pandoc may run before it is killed.
+
+        Returns:
+            str: Pandoc's output.
+
+        Raises:
+            subprocess.CalledProcessError: If Pandoc exits with an error.
+            subprocess.TimeoutExpired: If Pandoc ran past the timeout.
+        """
+        result = run_process([self.pandoc_executable, *options_to_args(options)],
+                             input_data=text.encode('utf-8'), timeout=timeout)
+        if result.returncode != 0:
+            raise subprocess.CalledProcessError(
+                result.returncode, result.args, output=result.stdout, stderr=result.stderr
+            )
+        return result.stdout.decode('utf-8', errors='replace')
+
+    def close(self):
+        pass
+
+
+class _ServerWorker:
+    """One supervised `pandoc server` process listening on a localhost port."""
+    def __init__(self, command):
+        self.command = command
+        self.process = None
+        self.port = None
+        # Held while the process is started or stopped, so that only one thread restarts it.
+        self.lock = threading.Lock()
+
+    def start(self, host, startup_timeout):
+        # The new process and port are published only once the server answers, so that other
+        # threads never send requests to a server that is still starting.
+        port = _free_port(host)
+        try:
+            process = subprocess.Popen(
+                [*self.command, "--port", str(port), "--timeout", str(PandocServerBackend.REQUEST_TIMEOUT)],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+        except OSError:
+            return False
+
+        deadline = time.monotonic() + startup_timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                return False
+            if _responsive(host, port):
+                self.process, self.port = process, port
+                return True
+            time.sleep(0.05)
+        _stop_process(process)
+        return False
+
+    def responsive(self, host, timeout=1):
+        """Returns whether the server answers a version request within timeout seconds."""
+        return _responsive(host, self.port, timeout)
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self):
+        if self.process:
+            _stop_process(self.process)
+        self.process = None
+
+
+def _stop_process(process):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def _responsive(host, port, timeout=1):
+    import http.client  # Only needed by the server backend; keeps CLI startup fast.
+
+    connection = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        connection.request("GET", "/version")
+        return connection.getresponse().status == 200
+    except (OSError, http.client.HTTPException):
+        return False
+    finally:
+        connection.close()
+
+def _free_port(host):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+class PandocServerBackend:
+    """
+    Sends conversions to long-lived `pandoc server` processes over HTTP.
+
+    Keeping the servers running amortizes Pandoc's startup cost across a whole batch. Each thread
+    reuses a keep-alive connection per server, requests are spread round-robin over the servers,
+    a server that dies is restarted, and if no server can be reached the conversion falls back to
+    a one-shot Pandoc subprocess.
+    """
+    name = "server"
+    REQUEST_TIMEOUT = 300
+
+    def __init__(self, pandoc_executable, workers=1, host="127.0.0.1", startup_timeout=10, logger=None,
+                 server_command=None):
+        """
+        Initializes the backend. Servers are started lazily on the first conversion.
+
+        Args:
+            pandoc_executable (str): The path to the Pandoc executable.
+            workers (int): The number of server processes to run.
+            host (str): The interface the servers listen on.
+            startup_timeout (float): Seconds to wait for a server to accept requests.
+            logger (Logger, optional): An instance of the Logger class for logging.
+            server_command (list, optional): The command that starts a server, as found by the
+                                             toolchain probe. Defaults to pandoc-server next to
+                                             the executable or on PATH, else `pandoc server`.
+        """
+        self.pandoc_executable = pandoc_executable
+        self.server_command = server_command
+        self.host = host
+        self.startup_timeout = startup_timeout
+        self.logger = logger
+        self.fallback = SubprocessPandocBackend(pandoc_executable)
+        self._workers = [_ServerWorker(self._server_command()) for _ in range(max(1, workers))]
+        self._next_worker = itertools.cycle(self._workers)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._started = False
+        self._available = True
+
+    def __getstate__(self):
+        raise TypeError("PandocServerBackend cannot be shared with worker processes; use threads instead.")
+
+    def _log(self, message, *args, level="info"):
+        """Helper method to log messages if a logger is available and enabled for the level."""
+        if self.logger and self.logger.is_enabled_for(level):
+            getattr(self.logger, level)(message, *args)
+
+    def _server_command(self):
+        """Prefers a standalone pandoc-server binary, otherwise uses the `pandoc server` subcommand."""
+        if self.server_command:
+            return list(self.server_command)
+        sibling = os.path.join(os.path.dirname(self.pandoc_executable), "pandoc-server")
+        standalone = sibling if os.path.exists(sibling) else shutil.which("pandoc-server")
+        return [standalone] if standalone else [self.pandoc_executable, "server"]
+
+    def start(self):
+        """Starts every server. Returns False if none could be started."""
+        with self._lock:
+            self._start_locked()
+            return self._available
+
+    def _start_locked(self):
+        if self._started:
+            return
+        self._started = True
+        for worker in self._workers:
+            if worker.start(self.host, self.startup_timeout):
+                self._log("Started pandoc server on port %s.", worker.port)
+        if not any(worker.alive() for worker in self._workers):
+            self._available = False
+            self._log("Pandoc server unavailable, falling back to one Pandoc process per file.", level="warning")
+
+    def _pick_worker(self):
+        """
+        Returns the next server, restarting it if it died. A restart holds only that server's
+        lock, so other threads pass over it to the live servers instead of waiting.
+        """
+        with self._lock:
+            self._start_locked()
+            if not self._available:
+                return None
+            candidates = [next(self._next_worker) for _ in self._workers]
+        for worker in candidates:
+            if worker.alive() or self._restart(worker, blocking=False):
+                return worker
+        # Every server is dead or being restarted by another thread: wait for the restarts.
+        for worker in candidates:
+            if self._restart(worker):
+                return worker
+        with self._lock:
+            self._available = False
+        self._log("No pandoc server could be restarted, falling back to one Pandoc process per file.",
+                  level="warning")
+        return None
+
+    def _restart(self, worker, blocking=True):
+        """
+        Restarts a dead server and returns whether it is running. Without blocking, returns False
+        at once if another thread is restarting it.
+        """
+        if not worker.lock.acquire(blocking):
+            return False
+        try:
+            if worker.alive():
+                # Another thread restarted it while this one waited for the lock.
+                return True
+            self._log("Pandoc server on port %s died, restarting it.", worker.port, level="warning")
+            return worker.start(self.host, self.startup_timeout)
+        finally:
+            worker.lock.release()
+
+    def _stop_if_unresponsive(self, worker):
+        """
+        Stops a server that timed out on a request if it no longer answers at all. A server that
+        is merely busy with a slow document keeps running, along with the other requests it serves.
+        """
+        port = worker.port
+        if worker.responsive(self.host):
+            return
+        with worker.lock:
+            if worker.port == port:
+                self._log("Pandoc server on port %s stopped responding, restarting it.", port, level="warning")
+                worker.stop()
+
+    def _connection(self, worker):
+        import http.client
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        connection = connections.get(worker.port)
+        if connection is None:
+            connection = http.client.HTTPConnection(self.host, worker.port, timeout=self.REQUEST_TIMEOUT)
+            connections[worker.port] = connection
+        return connection
+
+    def _drop_connection(self, worker):
+        connection = getattr(self._local, "connections", {}).pop(worker.port, None)
+        if connection:
+            connection.close()
+
+    def _post(self, worker, text, options, timeout=None):
+        body = json.dumps({"text": text, **options}).encode('utf-8')
+        connection = self._connection(worker)
+        connection.timeout = timeout or self.REQUEST_TIMEOUT
+        if connection.sock:
+            connection.sock.settimeout(connection.timeout)
+        connection.request("POST", "/", body=body, headers={
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+        })
+        response = connection.getresponse()
+        payload = response.read().decode('utf-8', errors='replace')
+        if response.status != 200:
+            raise PandocError(f"pandoc server returned HTTP {response.status}: {payload}")
+        result = json.loads(payload)
+        if result.get("error"):
+            raise PandocError(result["error"])
+        return result["output"]
+
+    def convert(self, text, options, timeout=None):
+        """
+        Converts text on one of the servers, retrying once on a restarted server if needed.
+
+        Args:
+            text (str): The input document.
+            options (dict): Pandoc options such as {"from": "latex", "to": "markdown"}.
+            timeout (float, optional): Seconds to wait for the reply. If the server then no
+                                       longer answers at all, it is killed and restarted on the
+                                       next request.
+
+        Returns:
+            str: Pandoc's output.
+
+        Raises:
+            PandocError: If Pandoc rejects the document.
+            subprocess.TimeoutExpired: If the server did not answer within the timeout.
+        """
+        import http.client
+
+        for _ in range(2):
+            worker = self._pick_worker()
+            if worker is None:
+                break
+            try:
+                return self._post(worker, text, options, timeout)
+            except socket.timeout:
+                self._drop_connection(worker)
+                self._stop_if_unresponsive(worker)
+                raise subprocess.TimeoutExpired(worker.command, timeout or self.REQUEST_TIMEOUT)
+            except (OSError, http.client.HTTPException) as e:
+                self._drop_connection(worker)
+                self._log("Request to pandoc server on port %s failed: %s", worker.port, e, level="warning")
+        return self.fallback.convert(text, options, timeout=timeout)
+
+    def close(self):
+        """Stops every server."""
+        with self._lock:
+            for worker in self._workers:
+                with worker.lock:
+                    worker.stop()
+            self._started = False
+            self._available = True
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,7 +1,211 @@
+import hashlib
 import os
-import re
 
-MATH_PATTERN = re.compile(r'(\$[^$]*?\$|\$\$.*?\$\$)', flags=re.DOTALL)
+from .file_utils import atomic_write_text, atomic_write_chunks
+from .markdown_scanner import CODE, MATH, TEXT, MarkdownScanner, read_chunks
+
+
+class PostProcessStep:
+    """
+    A single Markdown fix-up applied by a PostProcessor.
+
+    Character-level steps provide translation tables (see str.translate) for text, math and
+    code regions, which the PostProcessor merges so that consecutive steps cost a single pass
+    over each region. Anything more complex overrides transform instead.
+    """
+    name = "step"
+
+    def text_table(self):
+        """Returns the translation table applied to ordinary text, or None."""
+        return None
+
+    def math_table(self):
+        """Returns the translation table applied inside math, or None."""
+        return None
+
+    def code_table(self):
+        """Returns the translation table applied inside code blocks and spans, or None."""
+        return None
+
+    def transform(self, segment, kind):
+        """
+        Transforms one region of the document. Only called for steps without tables.
+
+        A region may arrive in several pieces when the input is processed in chunks, so
+        transformations must work piece by piece.
+        """
+        return segment
+
+    def describe(self):
+        """Returns the step's settings, used for cache keys."""
+        return {"name": self.name}
+
+
+class RemoveCharacter(PostProcessStep):
+    """Removes every occurrence of a character, in every kind of region."""
+    name = "remove_character"
+
+    def __init__(self, char_to_remove="Ł"):
+        self.char_to_remove = char_to_remove
+
+    def text_table(self):
+        return {ord(self.char_to_remove): None}
+
+    def math_table(self):
+        return {ord(self.char_to_remove): None}
+
+    def code_table(self):
+        return {ord(self.char_to_remove): None}
+
+    def describe(self):
+        return {"name": self.name, "char": self.char_to_remove}
+
+
+class FlipParentheses(PostProcessStep):
+    """Swaps '(' and ')' outside math and code, correcting their direction in right-to-left text."""
+    name = "flip_parentheses"
+
+    def text_table(self):
+        return {ord('('): ')', ord(')'): '('}
+
+
+def _compose_tables(first, second):
+    """Returns a translation table equivalent to translating with first and then with second."""
+    composed = {}
+    for key, value in first.items():
+        if isinstance(value, int):
+            value = chr(value)
+        composed[key] = value.translate(second) if value is not None else None
+    for key, value in second.items():
+        composed.setdefault(key, value)
+    return composed
+
+
+def _table_function(table):
+    """
+    Returns a function applying a translation table, or None for an empty table.
+
+    str.translate looks up every character, which is slow on non-ASCII text such as Hebrew. Small
+    tables are applied with str.replace instead, routing each key through a private-use
+    placeholder so that swaps like '(' <-> ')' stay correct.
+    """
+    if not table:
+        return None
+    if len(table) > 8:
+        return lambda segment: segment.translate(table)
+    pairs = [(chr(key), chr(value) if isinstance(value, int) else (value or "")) for key, value in table.items()]
+    placeholders = [chr(0xE000 + index) for index in range(len(pairs))]
+
+    def apply(segment):
+        if any(placeholder in segment for placeholder in placeholders):
+            return segment.translate(table)
+        for (key, _), placeholder in zip(pairs, placeholders):
+            segment = segment.replace(key, placeholder)
+        for (_, value), placeholder in zip(pairs, placeholders):
+            segment = segment.replace(placeholder, value)
+        return segment
+    return apply
+
+
+class PostProcessor:
+    """
+    Applies a sequence of post-processing steps to Markdown in a single traversal.
+
+    MarkdownScanner classifies the document into text, math and code regions in one pass; every
+    step is then applied to each region before moving on, and the result is written once.
+    Input can be processed in chunks, so large documents never need to be held in memory.
+    """
+    def __init__(self, steps=None):
+        """
+        Args:
+            steps (list, optional): PostProcessStep instances, applied in order.
+        """
+        self.steps = list(steps or [])
+
+    def add_step(self, step):
+        """Appends a step and returns the processor, so calls can be chained."""
+        self.steps.append(step)
+        return self
+
+    def describe(self):
+        """Returns the settings of every step, used for cache keys."""
+        return [step.describe() for step in self.steps]
+
+    def _stages(self):
+        """Groups consecutive table-based steps into merged {kind: function} stages."""
+        stages = []
+        for step in self.steps:
+            tables = {TEXT: step.text_table(), MATH: step.math_table(), CODE: step.code_table()}
+            if all(table is None for table in tables.values()):
+                stages.append(step)
+                continue
+            if stages and isinstance(stages[-1], dict):
+                stages[-1] = {kind: _compose_tables(stages[-1][kind], tables[kind] or {}) for kind in tables}
+            else:
+                stages.append({kind: table or {} for kind, table in tables.items()})
+        return [
+            {kind: _table_function(table) for kind, table in stage.items()} if isinstance(stage, dict) else stage
+            for stage in stages
+        ]
+
+    def process_chunks(self, chunks):
+        """
+        Applies every step to a document given as an iterable of text chunks.
+
+        Yields:
+            str: Processed output, in order.
+        """
+        stages = self._stages()
+        scanner = MarkdownScanner()
+
+        def apply(regions):
+            for kind, segment in regions:
+                for stage in stages:
+                    if isinstance(stage, dict):
+                        if stage[kind]:
+                            segment = stage[kind](segment)
+                    else:
+                        segment = stage.transform(segment, kind)
+                yield segment
+
+        for chunk in chunks:
+            yield from apply(scanner.feed(chunk))
+        yield from apply(scanner.close())
+
+    def process(self, content):
+        """Returns content with every step applied."""
+        return ''.join(self.process_chunks([content]))
+
+    def process_stream(self, stream):
+        """Processes a text stream (such as Pandoc's output) chunk by chunk and returns the result."""
+        return ''.join(self.process_chunks(read_chunks(stream)))
+
+    def write(self, content, md_file):
+        """Processes content and writes the result to md_file atomically."""
+        new_content = self.process(content)
+        atomic_write_text(md_file, new_content)
+        return new_content
+
+    def process_file(self, md_file, output_file=None):
+        """
+        Streams md_file through every step and writes the result once, atomically.
+
+        Returns:
+            bool: True if any step changed the content.
+        """
+        input_digest = hashlib.sha1()
+        output_digest = hashlib.sha1()
+
+        def record(chunks, digest):
+            for chunk in chunks:
+                digest.update(chunk.encode('utf-8'))
+                yield chunk
+
+        with open(md_file, 'r', encoding='utf-8', errors='replace') as f:
+            chunks = record(read_chunks(f), input_digest)
+            atomic_write_chunks(output_file or md_file, record(self.process_chunks(chunks), output_digest))
+        return input_digest.digest() != output_digest.digest()
+
 
 def remove_stray_character_from_md(md_file, char_to_remove="Ł", logger=None):
     """
@@ -11,43 +215,25 @@ def remove_stray_character_from_md(md_file, char_to_remove="Ł", logger=None):
         return
 
     if logger:
-        logger.info(f"Removing stray character '{char_to_remove}' from {md_file}")
+        logger.info("Removing stray character '%s' from %s", char_to_remove, md_file)
 
-    with open(md_file, 'r', encoding='utf-8', errors='replace') as f:
-        content = f.read()
+    changed = PostProcessor([RemoveCharacter(char_to_remove)]).process_file(md_file)
 
-    new_content = content.replace(char_to_remove, "")
-
-    if content != new_content and logger:
+    if changed and logger:
         logger.info("Stray characters found and removed.")
 
-    with open(md_file, 'w', encoding='utf-8') as f:
-        f.write(new_content)
-
 def flip_parentheses_outside_math(md_file, logger=None):
     """
-    Reads the final Markdown file, splits it into math vs. non-math segments,
-    flips parentheses only in the non-math segments, and overwrites the file.
+    Streams the final Markdown file, flips parentheses outside math and code regions,
+    and overwrites the file.
     """
     if not os.path.exists(md_file):
         return
-    
-    if logger:
-        logger.info(f"Flipping parentheses in {md_file}")
-
-    with open(md_file, 'r', encoding='utf-8', errors='replace') as f:
-        content = f.read()
 
-    segments = MATH_PATTERN.split(content)
-
-    def flip_parens(s):
-        return s.replace('(', '§').replace(')', '(').replace('§', ')')
+    if logger:
+        logger.info("Flipping parentheses in %s", md_file)
 
-    new_segments = [flip_parens(seg) if not MATH_PATTERN.fullmatch(seg) else seg for seg in segments]
-    new_content = ''.join(new_segments)
+    changed = PostProcessor([FlipParentheses()]).process_file(md_file)
 
-    if content != new_content and logger:
+    if changed and logger:
         logger.info("Parentheses flipped successfully.")
-
-    with open(md_file, 'w', encoding='utf-8') as f:
-        f.write(new_content)
@@ -0,0 +1,447 @@
+import importlib
+import re
+import threading
+import time
+
+from .markdown_scanner import CODE, MATH, TEXT
+from .postprocess import PostProcessor, PostProcessStep, _table_function
+
+RULE_KINDS = ("literal", "translate", "regex")
+REGIONS = (TEXT, MATH, CODE)
+# Rules enabled when the configuration names none.
+DEFAULT_RULES = ("remove_stray_character", "flip_parentheses")
+
+# Backreferences change meaning once a pattern is embedded in the combined alternation, and
+# named groups may clash with another rule's, so such rules keep a regular expression of their
+# own, searched alongside the alternation.
+_SEPARATE_PASS = re.compile(r'\\[1-9]|\(\?P[<=]')
+_FLAGS = {"IGNORECASE": "i", "MULTILINE": "m", "DOTALL": "s", "VERBOSE": "x"}
+
+
+class Rule:
+    """
+    A single find-and-replace rule applied by a RuleSet.
+
+    literal: replaces every occurrence of a string. translate: maps each character of pattern
+    to the character at the same position of replacement, or deletes them all if replacement
+    is empty, like str.maketrans. regex: replaces the matches of a regular expression;
+    replacement may use group references such as \\1.
+
+    The replacement may also be a function of the re.Match, for rules defined in Python.
+    Patterns see one region of the document at a time and should not span lines.
+    """
+    def __init__(self, name, pattern, replacement="", kind="literal", regions=(TEXT,), flags=()):
+        """
+        Args:
+            name (str): Identifies the rule in statistics and in the configuration.
+            pattern (str): The string, characters or regular expression to find.
+            replacement (str or callable): What each match is replaced with.
+            kind (str): "literal", "translate" or "regex".
+            regions (iterable): The regions the rule applies in: "text", "math" and/or "code".
+            flags (iterable): Regular expression flags by name, e.g. "IGNORECASE", "MULTILINE".
+
+        Raises:
+            ValueError: If the rule is invalid.
+        """
+        self.name = name
+        self.pattern = pattern
+        self.replacement = replacement
+        self.kind = kind
+        self.regions = tuple(regions)
+        self.flags = tuple(flags)
+        if kind not in RULE_KINDS:
+            raise ValueError(f"Rule {name}: unknown type {kind!r}, expected one of {', '.join(RULE_KINDS)}.")
+        if not pattern:
+            raise ValueError(f"Rule {name}: the pattern is empty.")
+        unknown = [region for region in self.regions if region not in REGIONS]
+        if unknown or not self.regions:
+            raise ValueError(f"Rule {name}: regions must be some of {', '.join(REGIONS)}.")
+        unknown = [flag for flag in self.flags if flag not in _FLAGS]
+        if unknown:
+            raise ValueError(f"Rule {name}: unknown flags {', '.join(unknown)}.")
+        if kind == "translate":
+            if not isinstance(replacement, str) or (replacement and len(replacement) != len(pattern)):
+                raise ValueError(f"Rule {name}: a translate replacement must be empty or as long as the pattern.")
+        if kind == "regex":
+            try:
+                regex = re.compile(self.expression())
+            except re.error as e:
+                raise ValueError(f"Rule {name}: invalid regular expression: {e}")
+            if regex.match(""):
+                raise ValueError(f"Rule {name}: the regular expression matches the empty string.")
+
+    @classmethod
+    def from_dict(cls, definition):
+        """
+        Builds a rule from its configuration entry.
+
+        Example:
+            {"name": "nbsp", "type": "literal", "find": "\\u00a0", "replace": " ", "regions": ["text"]}
+        """
+        try:
+            return cls(
+                definition["name"], definition["find"], definition.get("replace", ""),
+                kind=definition.get("type", "literal"), regions=definition.get("regions", [TEXT]),
+                flags=definition.get("flags", [])
+            )
+        except KeyError as e:
+            raise ValueError(f"Rule {definition.get('name', definition)} has no {e.args[0]!r} entry.")
+
+    def expression(self):
+        """Returns the rule as a regular expression with its flags inlined."""
+        pattern = self.pattern if self.kind == "regex" else re.escape(self.pattern)
+        flags = "".join(_FLAGS[flag] for flag in self.flags)
+        return f"(?{flags}:{pattern})" if flags else pattern
+
+    def table(self):
+        """Returns the rule as a translation table, or None if it cannot be expressed as one."""
+        if self.kind == "translate":
+            if not self.replacement:
+                return {ord(char): None for char in self.pattern}
+            return str.maketrans(self.pattern, self.replacement)
+        if self.kind == "literal" and len(self.pattern) == 1 and isinstance(self.replacement, str):
+            return {ord(self.pattern): self.replacement or None}
+        return None
+
+    def describe(self):
+        """Returns the rule's settings, used for cache keys."""
+        replacement = self.replacement
+        if callable(replacement):
+            replacement = f"{replacement.__module__}.{replacement.__qualname__}"
+        return {"name": self.name, "type": self.kind, "find": self.pattern, "replace": replacement,
+                "regions": list(self.regions), "flags": list(self.flags)}
+
+
+# Rules that can be enabled by name. Plugins add theirs with register_rule.
+_REGISTRY = {}
+
+
+def register_rule(rule):
+    """Makes a rule available by name to the "enabled" list of the configuration."""
+    _REGISTRY[rule.name] = rule
+    return rule
+
+
+register_rule(Rule("remove_stray_character", "Ł", "", regions=REGIONS))
+register_rule(Rule("flip_parentheses", "()", ")(", kind="translate"))
+register_rule(Rule("remove_bidi_marks", "\u200e\u200f\u202a\u202b\u202c\u202d\u202e\u2066\u2067\u2068\u2069",
+                   kind="translate"))
+register_rule(Rule("ascii_hebrew_punctuation", "\u05be\u05f3\u05f4", "-'\"", kind="translate"))
+register_rule(Rule("strip_heading_attributes", r"^(#{1,6}[ \t].*?)[ \t]+\{[^{}\n]*\}[ \t]*$", r"\1",
+                   kind="regex", flags=["MULTILINE"]))
+
+
+def registered_rules():
+    """Returns the names of the rules that can be enabled by name."""
+    return sorted(_REGISTRY)
+
+
+class _RegionMatcher:
+    """The rules of one kind of region, compiled into a translation table and one alternation."""
+    def __init__(self, rules):
+        table = {}
+        self.table_rules = []
+        literals = {}
+        expressions = []
+        self.groups = {}
+        self.separate = []
+        # The rank of each regular expression rule in the order the rules were given.
+        self.ranks = {}
+        for rule in rules:
+            rule_table = rule.table()
+            if rule_table is not None:
+                owned = [chr(key) for key in rule_table if key not in table]
+                table.update((ord(char), rule_table[ord(char)]) for char in owned)
+                self.table_rules.append((rule, owned))
+            elif rule.kind == "literal":
+                literals.setdefault(rule.pattern, rule)
+            elif _SEPARATE_PASS.search(rule.pattern):
+                self.ranks[rule.name] = len(self.ranks)
+                self.separate.append((rule, re.compile(rule.expression())))
+            else:
+                self.ranks[rule.name] = len(self.ranks)
+                group = f"_r{len(expressions)}"
+                self.groups[group] = (rule, re.compile(rule.expression()))
+                expressions.append(f"(?P<{group}>{rule.expression()})")
+        self.table = table
+        self.translate = _table_function(table)
+        self.literals = literals
+        if literals:
+            # Longest first, so that a literal never shadows a longer one starting at the same place.
+            alternatives = "|".join(re.escape(literal) for literal in sorted(literals, key=len, reverse=True))
+            expressions.insert(0, f"(?P<_literal>{alternatives})")
+        self.pattern = re.compile("|".join(expressions)) if expressions else None
+
+    def rule_for(self, match):
+        """Returns the rule behind a match of the combined alternation."""
+        if match.lastgroup == "_literal":
+            return self.literals[match.group()]
+        return self.groups[match.lastgroup][0]
+
+    def substitute(self, segment, replace, replace_separate):
+        """
+        Applies the alternation and the separate rules to segment as if they formed one
+        alternation: the leftmost match wins, and of matches at the same position, a literal,
+        then the regular expression given first. Like re.sub, the scan continues after each
+        match, so replacements are never matched again.
+
+        Args:
+            replace (callable): Returns the replacement for a match of the alternation.
+            replace_separate (callable): Returns the replacement for (rule, match) of a separate rule.
+        """
+        scanners = [(self.pattern, None)] if self.pattern is not None else []
+        scanners += [(regex, rule) for rule, regex in self.separate]
+        # The next match of each scanner at or after the position, or False once it has none.
+        upcoming = [None] * len(scanners)
+        pieces = []
+        position = 0
+        while position <= len(segment):
+            best = best_key = None
+            for index, (regex, rule) in enumerate(scanners):
+                match = upcoming[index]
+                if match is None or (match is not False and match.start() < position):
+                    match = upcoming[index] = regex.search(segment, position) or False
+                if match is False:
+                    continue
+                match_rule = rule or self.rule_for(match)
+                key = (match.start(), self.ranks.get(match_rule.name, -1))
+                if best_key is None or key < best_key:
+                    best, best_key = (match, rule), key
+            if best is None:
+                break
+            match, rule = best
+            pieces.append(segment[position:match.start()])
+            pieces.append(replace(match) if rule is None else replace_separate(rule, match))
+            position = match.end()
+            if match.end() == match.start():
+                # After an empty match the next character is kept, so the scan moves on.
+                pieces.append(segment[position:position + 1])
+                position += 1
+        pieces.append(segment[position:])
+        return "".join(pieces)
+
+
+class RuleSet(PostProcessStep):
+    """
+    Applies any number of rules to each region in a single traversal.
+
+    Rules are compiled once, per kind of region. Single-character rules are merged into one
+    translation table, applied first. All other literal rules and regular expressions are
+    combined into one alternation and applied together by a single re.sub: at each position the
+    first rule that matches wins, literals (longest first) before regular expressions in the
+    order they were given. Replacements are not scanned again, so rules never feed each other.
+    Regular expressions with backreferences or named groups cannot join the alternation; they
+    are searched on their own in the same scan, with the same precedence.
+
+    Hit counts and replacement time are recorded per rule, along with the time spent in the
+    shared passes; see stats.
+    """
+    name = "rules"
+
+    def __init__(self, rules):
+        """
+        Args:
+            rules (list): Rule instances.
+
+        Raises:
+            ValueError: If two rules have the same name.
+        """
+        self.rules = list(rules)
+        names = [rule.name for rule in self.rules]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"Duplicate rule names: {', '.join(duplicates)}.")
+        self._compile()
+        self.reset_stats()
+
+    def __getstate__(self):
+        # Compiled tables hold closures and the lock cannot be pickled; workers rebuild them.
+        return {"rules": self.rules}
+
+    def __setstate__(self, state):
+        self.rules = state["rules"]
+        self._compile()
+        self.reset_stats()
+
+    def _compile(self):
+        self._matchers = {}
+        for region in REGIONS:
+            rules = [rule for rule in self.rules if region in rule.regions]
+            if rules:
+                self._matchers[region] = _RegionMatcher(rules)
+        self._lock = threading.Lock()
+
+    def reset_stats(self):
+        """Clears the statistics."""
+        # Every thread counts into its own dictionaries, so transform needs no lock.
+        with self._lock:
+            self._local = threading.local()
+            self._thread_stats = []
+
+    def _counters(self):
+        try:
+            return self._local.counters
+        except AttributeError:
+            counters = ({rule.name: 0 for rule in self.rules}, {rule.name: 0.0 for rule in self.rules},
+                        {"translation table": 0.0, "combined matcher": 0.0})
+            with self._lock:
+                self._thread_stats.append(counters)
+            self._local.counters = counters
+            return counters
+
+    def transform(self, segment, kind):
+        matcher = self._matchers.get(kind)
+        if matcher is None or not segment:
+            return segment
+        hits, seconds, passes = self._counters()
+        perf_counter = time.perf_counter
+
+        if matcher.translate:
+            start = perf_counter()
+            translated = matcher.translate(segment)
+            if translated != segment:
+                for rule, chars in matcher.table_rules:
+                    for char in chars:
+                        hits[rule.name] += segment.count(char)
+            segment = translated
+            passes["translation table"] += perf_counter() - start
+
+        if matcher.pattern is not None or matcher.separate:
+            replace_seconds = 0.0
+
+            def replace(match):
+                nonlocal replace_seconds
+                replace_start = perf_counter()
+                group = match.lastgroup
+                if group == "_literal":
+                    rule = matcher.literals[match.group()]
+                    result = rule.replacement(match) if callable(rule.replacement) else rule.replacement
+                else:
+                    rule, regex = matcher.groups[group]
+                    own_match = regex.match(match.string, match.start())
+                    result = rule.replacement(own_match) if callable(rule.replacement) \
+                        else own_match.expand(rule.replacement)
+                elapsed = perf_counter() - replace_start
+                hits[rule.name] += 1
+                seconds[rule.name] += elapsed
+                replace_seconds += elapsed
+                return result
+
+            def replace_separate(rule, match):
+                nonlocal replace_seconds
+                replace_start = perf_counter()
+                result = rule.replacement(match) if callable(rule.replacement) else match.expand(rule.replacement)
+                elapsed = perf_counter() - replace_start
+                hits[rule.name] += 1
+                seconds[rule.name] += elapsed
+                replace_seconds += elapsed
+                return result
+
+            start = perf_counter()
+            if matcher.separate:
+                segment = matcher.substitute(segment, replace, replace_separate)
+            else:
+                segment = matcher.pattern.sub(replace, segment)
+            passes["combined matcher"] += perf_counter() - start - replace_seconds
+        return segment
+
+    def stats(self):
+        """
+        Returns what the rules did since the set was created or reset_stats was called.
+
+        Returns:
+            dict: {"rules": {name: {"hits": int, "seconds": float}}, "passes": {name: seconds}}.
+                  A rule's seconds are spent building its replacements; the shared table and
+                  matcher passes are reported separately under "passes".
+        """
+        rules = {rule.name: {"hits": 0, "seconds": 0.0} for rule in self.rules}
+        passes = {"translation table": 0.0, "combined matcher": 0.0}
+        with self._lock:
+            thread_stats = list(self._thread_stats)
+        for hits, seconds, pass_seconds in thread_stats:
+            for name in rules:
+                rules[name]["hits"] += hits[name]
+                rules[name]["seconds"] += seconds[name]
+            for name in passes:
+                passes[name] += pass_seconds[name]
+        return {"rules": rules, "passes": passes}
+
+    def format_stats(self):
+        """Returns the statistics as a table."""
+        stats = self.stats()
+        width = max([len(name) for name in stats["rules"]] + [len(name) for name in stats["passes"]] + [4])
+        lines = [f"{'rule':<{width}} {'hits':>10} {'time':>10}"]
+        for name, rule in stats["rules"].items():
+            lines.append(f"{name:<{width}} {rule['hits']:>10} {rule['seconds'] * 1000:>8.1f}ms")
+        for name, seconds in stats["passes"].items():
+            lines.append(f"{name:<{width}} {'':>10} {seconds * 1000:>8.1f}ms")
+        return "\n".join(lines)
+
+    def describe(self):
+        return {"name": self.name, "rules": [rule.describe() for rule in self.rules]}
+
+
+def load_plugin(spec):
+    """
+    Imports a rule plugin.
+
+    Args:
+        spec (str): "module" imports the module, which may call register_rule. "module:name"
+                    also returns the rules the attribute holds: a Rule, a dict in the
+                    configuration format, a list of those, or a function returning one.
+
+    Returns:
+        list: The Rule instances named by spec, if any.
+
+    Raises:
+        ValueError: If the module or attribute cannot be loaded.
+    """
+    module_name, _, attribute = spec.partition(":")
+    try:
+        module = importlib.import_module(module_name)
+    except ImportError as e:
+        raise ValueError(f"Cannot import rule plugin {module_name}: {e}")
+    if not attribute:
+        return []
+    try:
+        value = getattr(module, attribute)
+    except AttributeError:
+        raise ValueError(f"Rule plugin {module_name} has no attribute {attribute}.")
+    if callable(value) and not isinstance(value, Rule):
+        value = value()
+    if isinstance(value, (Rule, dict)):
+        value = [value]
+    return [rule if isinstance(rule, Rule) else Rule.from_dict(rule) for rule in value]
+
+
+def build_rule_set(config=None):
+    """
+    Builds the rule set described by the "postprocess" section of the configuration.
+
+    Args:
+        config (dict, optional): With "plugins" (imported first), "enabled" (names of built-in or
+                                 registered rules, applied first) and "rules" (rule
+                                 definitions). Defaults to the built-in default rules.
+
+    Returns:
+        RuleSet: The compiled rules.
+
+    Raises:
+        ValueError: If a rule, plugin or rule name is invalid.
+    """
+    config = config or {}
+    plugin_rules = []
+    for spec in config.get("plugins", []):
+        plugin_rules.extend(load_plugin(spec))
+    rules = []
+    for name in config.get("enabled", DEFAULT_RULES):
+        if name not in _REGISTRY:
+            raise ValueError(f"Unknown rule {name}. Available: {', '.join(registered_rules())}.")
+        rules.append(_REGISTRY[name])
+    rules.extend(Rule.from_dict(definition) for definition in config.get("rules", []))
+    return RuleSet(rules + plugin_rules)
+
+
+def build_postprocessor(config=None):
+    """Returns a PostProcessor that applies build_rule_set(config) in a single pass."""
+    return PostProcessor([build_rule_set(config)])
@@ -0,0 +1,373 @@
+import contextlib
+import json
+import os
+import random
+import signal
+import subprocess
+import threading
+import time
+
+from .file_utils import atomic_write_text
+
+try:
+    import fcntl
+except ImportError:  # Windows: cross-process locking is unavailable, threads are still serialized.
+    fcntl = None
+
+# Seconds a killed process group gets to exit after SIGTERM before it is sent SIGKILL.
+KILL_GRACE_PERIOD = 2
+DEFAULT_QUARANTINE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "lyxtomarkdown", "quarantine.json")
+
+_quarantine_lock = threading.Lock()
+
+
+class ConversionTimeout(RuntimeError):
+    """Raised when a conversion stage runs longer than its timeout."""
+    def __init__(self, stage, timeout, lyx_file_path):
+        super().__init__(f"Conversion failed: {stage} stage of {lyx_file_path} timed out after {timeout}s")
+        self.stage = stage
+        self.timeout = timeout
+        self.lyx_file_path = lyx_file_path
+
+
+class QuarantinedDocument(RuntimeError):
+    """Raised instead of converting a document that is in quarantine."""
+
+
+def kill_process_tree(process):
+    """Terminates a subprocess started in its own session and everything it started."""
+    if process.poll() is not None:
+        return
+    use_group = hasattr(os, "killpg")
+    try:
+        if use_group:
+            os.killpg(process.pid, signal.SIGTERM)
+        else:
+            process.terminate()
+    except ProcessLookupError:
+        return
+    try:
+        process.wait(timeout=KILL_GRACE_PERIOD)
+    except subprocess.TimeoutExpired:
+        try:
+            if use_group:
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+        except ProcessLookupError:
+            pass
+        process.wait()
+
+
+def run_process(args, input_data=None, timeout=None):
+    """
+    Runs a command to completion, like subprocess.run with capture_output, but kills its whole
+    process tree if it runs past the timeout.
+
+    The command runs in a new session, so helpers it starts (LyX runs LaTeX tools, converters
+    and scripts) are killed with it rather than left running.
+
+    Args:
+        args (list): The command.
+        input_data (bytes, optional): Sent to the command's standard input.
+        timeout (float, optional): Seconds allowed; None waits forever.
+
+    Returns:
+        subprocess.CompletedProcess: With stdout and stderr as bytes.
+
+    Raises:
+        subprocess.TimeoutExpired: If the timeout expired; the process tree is gone by then.
+    """
+    process = subprocess.Popen(
+        args,
+        stdin=subprocess.PIPE if input_data is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        start_new_session=True
+    )
+    try:
+        stdout, stderr = process.communicate(input_data, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        kill_process_tree(process)
+        process.communicate()
+        raise
+    except BaseException:
+        kill_process_tree(process)
+        raise
+    return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+
+
+class Deadlines:
+    """
+    Per-stage deadlines that grow with the size of the stage's input.
+
+    A small document gets base_seconds plus seconds_per_mb for every megabyte, so a hung LyX on a
+    short file is noticed within about a minute instead of after the limit meant for the largest
+    documents. No stage ever gets more than its limit.
+    """
+    def __init__(self, base_seconds=60, seconds_per_mb=60, limits=None):
+        """
+        Args:
+            base_seconds (float): Seconds every stage gets regardless of its input.
+            seconds_per_mb (float): Seconds added per megabyte of input.
+            limits (dict, optional): The upper bound for each stage, e.g. the "stage_timeouts"
+                                     of config.json. A stage without a limit (or with None) is
+                                     only bounded by its size.
+        """
+        self.base_seconds = base_seconds
+        self.seconds_per_mb = seconds_per_mb
+        self.limits = dict(limits or {})
+
+    def for_stage(self, stage, size_bytes):
+        """Returns the seconds allowed for a stage whose input has size_bytes."""
+        deadline = self.base_seconds + self.seconds_per_mb * size_bytes / (1024 * 1024)
+        limit = self.limits.get(stage)
+        return round(min(deadline, limit) if limit else deadline, 1)
+
+
+def build_reliability(reliability_config, stage_timeouts, timeout=None, retries=None):
+    """
+    Returns the stage deadlines and retry policy that every kind of conversion uses.
+
+    Args:
+        reliability_config (dict): The "reliability" section of config.json.
+        stage_timeouts (dict): The "stage_timeouts" of the "converter" section, the upper bound
+                               of each stage's deadline.
+        timeout (float, optional): Replaces the bound of the export and Pandoc stages.
+        retries (int, optional): Replaces the configured number of retries.
+
+    Returns:
+        tuple: (deadlines, retry_policy) where retry_policy is None if retries are disabled.
+    """
+    limits = dict(stage_timeouts)
+    if timeout is not None:
+        limits.update(export=timeout, pandoc=timeout)
+    deadlines = Deadlines(reliability_config["deadline_base_seconds"], reliability_config["deadline_seconds_per_mb"],
+                          limits)
+    if retries is None:
+        retries = reliability_config["retries"]
+    retry_policy = RetryPolicy(retries, reliability_config["retry_backoff_seconds"]) if retries else None
+    return deadlines, retry_policy
+
+
+def is_transient(error):
+    """
+    Returns whether a failure may succeed on a second attempt.
+
+    Timeouts and tools killed by a signal (crashes) are transient; a tool that exits with an
+    error status has rejected the document and will do so again.
+    """
+    if isinstance(error, ConversionTimeout):
+        return True
+    return isinstance(error, subprocess.CalledProcessError) and error.returncode < 0
+
+
+class RetryPolicy:
+    """Bounded retries with exponential backoff and jitter for transient failures."""
+    def __init__(self, retries=2, backoff_seconds=1.0, max_backoff_seconds=30.0):
+        """
+        Args:
+            retries (int): Extra attempts after the first one; 0 disables retrying.
+            backoff_seconds (float): The wait before the first retry. Each retry waits twice as
+                                     long as the one before, with random jitter.
+            max_backoff_seconds (float): The longest wait between two attempts.
+        """
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+
+    def delay(self, attempt):
+        """Returns the seconds to wait before retry number attempt (starting at 1)."""
+        delay = min(self.backoff_seconds * 2 ** (attempt - 1), self.max_backoff_seconds)
+        return delay * random.uniform(0.5, 1.0)
+
+    def call(self, function, description, logger=None):
+        """
+        Calls function, retrying it while it fails transiently.
+
+        Args:
+            function (callable): Called without arguments.
+            description (str): What is attempted, for the log, e.g. "export stage of doc.lyx".
+            logger (Logger, optional): An instance of the Logger class for logging.
+
+        Returns:
+            The function's result. The last error is raised once the retries are used up.
+        """
+        attempt = 0
+        while True:
+            try:
+                return function()
+            except Exception as e:
+                attempt += 1
+                delay = self._retry_delay(attempt, e, description, logger)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    async def call_async(self, function, description, logger=None):
+        """Like call, for a coroutine function; waits between attempts without blocking the event loop."""
+        import asyncio
+
+        attempt = 0
+        while True:
+            try:
+                return await function()
+            except Exception as e:
+                attempt += 1
+                delay = self._retry_delay(attempt, e, description, logger)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+    def _retry_delay(self, attempt, error, description, logger):
+        """Returns the seconds to wait after failed attempt number attempt, or None to give up."""
+        if attempt > self.retries or not is_transient(error):
+            return None
+        delay = self.delay(attempt)
+        if logger:
+            logger.warning("Attempt %s of %s for the %s failed (%s); retrying in %.1fs.",
+                           attempt, self.retries + 1, description, error, delay)
+        return delay
+
+
+class Quarantine:
+    """
+    Remembers documents that failed in several batches, so later batches skip them.
+
+    A document is quarantined once it has failed `threshold` times in a row and stays
+    quarantined until its size or modification time changes. A successful conversion clears
+    its record. The records are kept in a JSON file shared by every process.
+    """
+    def __init__(self, path=None, threshold=3, logger=None):
+        """
+        Args:
+            path (str, optional): The quarantine file. Defaults to DEFAULT_QUARANTINE_FILE.
+            threshold (int): Consecutive failures after which a document is skipped.
+            logger (Logger, optional): An instance of the Logger class for logging.
+        """
+        self.path = path or DEFAULT_QUARANTINE_FILE
+        self.threshold = threshold
+        self.logger = logger
+        # The records last read, with the identity of the file they were read from.
+        self._cached = (None, {})
+
+    def _log(self, message, *args, level="info"):
+        """Helper method to log messages if a logger is available and enabled for the level."""
+        if self.logger and self.logger.is_enabled_for(level):
+            getattr(self.logger, level)(message, *args)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Serializes access to the file across threads and, where supported, across processes."""
+        with _quarantine_lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path + ".lock", 'a') as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _load_cached(self):
+        """
+        Returns the records, reading the file again only if it was replaced since the last read.
+        Every write replaces the file, so checking a large batch costs one stat per document.
+        """
+        try:
+            stat = os.stat(self.path)
+            stamp = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            return {}
+        cached_stamp, records = self._cached
+        if stamp != cached_stamp:
+            records = self._load()
+            self._cached = (stamp, records)
+        return records
+
+    def _save(self, records):
+        atomic_write_text(self.path, json.dumps(records, indent=1, ensure_ascii=False))
+
+    @staticmethod
+    def _version(lyx_file_path):
+        stat = os.stat(lyx_file_path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def check(self, lyx_file_path):
+        """
+        Refuses to let a quarantined document be converted.
+
+        Raises:
+            QuarantinedDocument: If the document is quarantined and has not changed since.
+        """
+        lyx_file_path = os.path.abspath(lyx_file_path)
+        record = self._load_cached().get(lyx_file_path)
+        if not record or record["failures"] < self.threshold:
+            return
+        try:
+            version = self._version(lyx_file_path)
+        except OSError:
+            return
+        if {"size": record["size"], "mtime_ns": record["mtime_ns"]} == version:
+            raise QuarantinedDocument(f"Conversion failed: {lyx_file_path} is quarantined after {record['failures']} "
+                                      f"failures (last error: {record['error']}); it is retried once it changes.")
+
+    def record_failure(self, lyx_file_path, error):
+        """Counts a failed conversion. Returns True if the document is now quarantined."""
+        lyx_file_path = os.path.abspath(lyx_file_path)
+        try:
+            version = self._version(lyx_file_path)
+        except OSError:
+            return False
+        with self._locked():
+            records = self._load()
+            record = records.get(lyx_file_path)
+            failures = 1
+            if record and {"size": record["size"], "mtime_ns": record["mtime_ns"]} == version:
+                failures = record["failures"] + 1
+            records[lyx_file_path] = {**version, "failures": failures, "error": str(error), "time": time.time()}
+            self._save(records)
+        if failures == self.threshold:
+            self._log("Quarantined %s after %s failed conversions; later batches skip it until it changes.",
+                      lyx_file_path, failures, level="warning")
+        return failures >= self.threshold
+
+    def record_success(self, lyx_file_path):
+        """Clears the failures of a document that converted."""
+        lyx_file_path = os.path.abspath(lyx_file_path)
+        if lyx_file_path not in self._load_cached():
+            return
+        with self._locked():
+            records = self._load()
+            if records.pop(lyx_file_path, None) is not None:
+                self._save(records)
+
+    def entries(self):
+        """Returns the records of the quarantined documents, keyed by path."""
+        return {path: record for path, record in self._load().items() if record["failures"] >= self.threshold}
+
+    def clear(self, source_paths=None):
+        """
+        Forgets the failures of the given documents, or of every document.
+
+        Returns:
+            int: The number of records removed.
+        """
+        with self._locked():
+            records = self._load()
+            if source_paths is None:
+                removed = len(records)
+                records = {}
+            else:
+                paths = {os.path.abspath(path) for path in source_paths}
+                removed = len(paths & records.keys())
+                records = {path: record for path, record in records.items() if path not in paths}
+            self._save(records)
+        return removed
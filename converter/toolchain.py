@@ -0,0 +1,233 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+
+from .cache import executable_fingerprint
+from .file_utils import atomic_write_text
+
+DEFAULT_PROBE_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "lyxtomarkdown", "toolchain.json")
+# Where the tools are usually installed when they are not on PATH, checked in order.
+KNOWN_LOCATIONS = {
+    "lyx": [
+        "/Applications/LyX.app/Contents/MacOS/lyx",
+        "/Applications/LyX 2.app/Contents/MacOS/lyx",
+        "/usr/local/bin/lyx",
+        "/usr/bin/lyx",
+        "/snap/bin/lyx",
+    ],
+    "pandoc": [
+        "/opt/homebrew/bin/pandoc",
+        "/usr/local/bin/pandoc",
+        "/usr/bin/pandoc",
+        os.path.expanduser("~/.cabal/bin/pandoc"),
+    ],
+}
+PROBE_TIMEOUT = 30
+# Probe results of executables that were replaced are dropped once the file holds more than this.
+MAX_PROBE_ENTRIES = 64
+
+_VERSION = re.compile(r'(\d+(?:\.\d+)+)')
+_probe_lock = threading.Lock()
+
+
+def resolve_executable(name, configured=None, search=True):
+    """
+    Finds an executable.
+
+    Args:
+        name (str): The tool's command name, "lyx" or "pandoc".
+        configured (str, optional): The path (or command name) given in the configuration.
+        search (bool): Whether to look on PATH and in the usual install locations when the
+                       configured path does not exist.
+
+    Returns:
+        str: The absolute path of the executable, or None if it cannot be found.
+    """
+    candidates = []
+    if configured:
+        candidates.append(os.path.expanduser(configured))
+    if search or not configured:
+        candidates.append(name)
+        candidates.extend(KNOWN_LOCATIONS.get(name, []))
+    for candidate in candidates:
+        if os.sep in candidate or (os.altsep and os.altsep in candidate):
+            if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+                return os.path.abspath(candidate)
+        else:
+            found = shutil.which(candidate)
+            if found:
+                return os.path.abspath(found)
+    return None
+
+
+def _run(command):
+    """Returns the combined output of a probe command, or None if it could not be run."""
+    try:
+        completed = subprocess.run(command, stdin=subprocess.DEVNULL, capture_output=True, text=True,
+                                   errors="replace", timeout=PROBE_TIMEOUT)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if completed.returncode != 0:
+        return None
+    return completed.stdout + completed.stderr
+
+
+def _probe_lyx(path):
+    output = _run([path, "--version"]) or ""
+    match = _VERSION.search(output.split("\n", 1)[0])
+    return {"version": match.group(1) if match else None, "features": []}
+
+
+def _probe_pandoc(path):
+    output = _run([path, "--version"]) or ""
+    lines = output.splitlines()
+    match = _VERSION.search(lines[0]) if lines else None
+    features = []
+    for line in lines:
+        # Pandoc 3 lists its compile-time features, e.g. "Features: +server +lua".
+        if line.startswith("Features:"):
+            features = [word[1:] for word in line.split()[1:] if word.startswith("+")]
+    server_command = None
+    sibling = os.path.join(os.path.dirname(path), "pandoc-server")
+    if os.path.isfile(sibling) and os.access(sibling, os.X_OK):
+        server_command = [sibling]
+    elif "server" in features:
+        server_command = [path, "server"]
+    elif shutil.which("pandoc-server"):
+        server_command = [shutil.which("pandoc-server")]
+    writers = (_run([path, "--list-output-formats"]) or "").split()
+    return {
+        "version": match.group(1) if match else None,
+        "features": features,
+        "server_command": server_command,
+        # An empty list means the writers are unknown, not that there are none.
+        "output_formats": writers,
+    }
+
+
+_PROBES = {"lyx": _probe_lyx, "pandoc": _probe_pandoc}
+
+
+def _load_probes(cache_path):
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def probe_executable(kind, path, cache_path=None, logger=None):
+    """
+    Returns the version and features of an executable, running it only if it changed.
+
+    Results are stored in a JSON file keyed by the executable's resolved path, size and
+    modification time, so they are reused by later runs until the tool is upgraded or replaced.
+    A probe that found no version (the tool crashed, hung or was missing a library) is not
+    stored, so the next run probes the tool again.
+
+    Args:
+        kind (str): "lyx" or "pandoc".
+        path (str): The executable.
+        cache_path (str, optional): The probe cache file. Defaults to DEFAULT_PROBE_CACHE.
+        logger (Logger, optional): An instance of the Logger class for logging.
+
+    Returns:
+        dict: "path", "fingerprint", "version" (None if unknown) and "features", plus
+              "server_command" and "output_formats" for Pandoc.
+    """
+    cache_path = cache_path or DEFAULT_PROBE_CACHE
+    fingerprint = executable_fingerprint(path)
+    with _probe_lock:
+        probe = _load_probes(cache_path).get(fingerprint)
+    if probe and probe.get("kind") == kind and probe.get("version"):
+        return probe
+
+    start = time.perf_counter()
+    probe = {"kind": kind, "path": path, "fingerprint": fingerprint, "probed_at": time.time()}
+    probe.update(_PROBES[kind](path))
+    if logger:
+        logger.info("Probed %s: %s %s in %.2fs.",
+                    path, kind, probe["version"] or "(unknown version)", time.perf_counter() - start)
+    if not probe["version"]:
+        return probe
+    with _probe_lock:
+        probes = _load_probes(cache_path)
+        probes[fingerprint] = probe
+        if len(probes) > MAX_PROBE_ENTRIES:
+            for key in sorted(probes, key=lambda key: probes[key].get("probed_at", 0))[:-MAX_PROBE_ENTRIES]:
+                del probes[key]
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+            atomic_write_text(cache_path, json.dumps(probes, indent=1))
+        except OSError as e:
+            if logger:
+                logger.warning("Could not save the toolchain probe to %s: %s", cache_path, e)
+    return probe
+
+
+class Toolchain:
+    """
+    The LyX and Pandoc executables in use, with their probed versions and features.
+
+    The identity used in cache keys combines each tool's version with its fingerprint, so
+    cached conversions are invalidated when a tool is upgraded, even behind a wrapper script
+    whose own file does not change.
+    """
+    def __init__(self, lyx_executable, pandoc_executable, cache_path=None, logger=None):
+        """
+        Probes both executables, reading earlier results from the probe cache when possible.
+
+        Args:
+            lyx_executable (str): The path to the LyX executable.
+            pandoc_executable (str): The path to the Pandoc executable.
+            cache_path (str, optional): The probe cache file. Defaults to DEFAULT_PROBE_CACHE.
+            logger (Logger, optional): An instance of the Logger class for logging.
+        """
+        self.lyx_executable = lyx_executable
+        self.pandoc_executable = pandoc_executable
+        self.cache_path = cache_path
+        self.logger = logger
+        self.lyx = probe_executable("lyx", lyx_executable, cache_path, logger)
+        self.pandoc = probe_executable("pandoc", pandoc_executable, cache_path, logger)
+
+    def _current(self, kind):
+        """Returns a tool's probe, probing it again if the executable changed since."""
+        probe = getattr(self, kind)
+        if executable_fingerprint(probe["path"]) != probe["fingerprint"]:
+            probe = probe_executable(kind, probe["path"], self.cache_path, self.logger)
+            setattr(self, kind, probe)
+        return probe
+
+    def identity(self):
+        """Returns the toolchain part of the cache key."""
+        identity = {}
+        for kind in ("lyx", "pandoc"):
+            probe = self._current(kind)
+            identity[kind] = f"{probe['version'] or 'unknown'}@{probe['fingerprint']}"
+        return identity
+
+    def versions(self):
+        """Returns the version of each tool, None where it is unknown."""
+        return {"lyx": self.lyx["version"], "pandoc": self.pandoc["version"]}
+
+    @property
+    def pandoc_server_command(self):
+        """The command that starts a `pandoc server`, or None if this Pandoc has no server."""
+        return self.pandoc.get("server_command")
+
+    def supports_output_format(self, output_format):
+        """Returns whether Pandoc has a writer for a format; True when the writers are unknown."""
+        writers = self.pandoc.get("output_formats")
+        return not writers or output_format in writers
+
+    def describe(self):
+        """Returns a one-line description of the tools and their versions."""
+        return (f"LyX {self.lyx['version'] or '(unknown version)'} ({self.lyx_executable}), "
+                f"Pandoc {self.pandoc['version'] or '(unknown version)'} ({self.pandoc_executable})")
+
+    def to_dict(self):
+        return {"lyx": dict(self.lyx), "pandoc": dict(self.pandoc)}
@@ -0,0 +1,265 @@
+import codecs
+import re
+import threading
+
+CHUNK_SIZE = 1 << 16
+# Enough to cover the LyX header or the LaTeX preamble, where the encoding is declared.
+HEADER_SIZE = 1 << 16
+REPLACEMENT_CHARACTER = "\ufffd"
+
+# inputenc options and LyX \inputencoding values, mapped to Python codecs. "auto" and "default"
+# mean "the language's encoding", which is left to the caller's default.
+INPUT_ENCODINGS = {
+    "utf8": "utf-8", "utf8x": "utf-8", "utf8-plain": "utf-8", "utf-8": "utf-8",
+    "ascii": "ascii",
+    "cp1255": "cp1255", "iso8859-8": "iso8859-8", "8859-8": "iso8859-8",
+    "cp1250": "cp1250", "cp1251": "cp1251", "cp1252": "cp1252", "ansinew": "cp1252", "cp1257": "cp1257",
+    "latin1": "latin-1", "latin2": "iso8859-2", "latin3": "iso8859-3", "latin4": "iso8859-4",
+    "latin5": "iso8859-9", "latin9": "iso8859-15", "latin10": "iso8859-16",
+    "iso8859-7": "iso8859-7", "koi8-r": "koi8-r", "koi8-u": "koi8-u",
+    "cp437": "cp437", "cp850": "cp850", "cp852": "cp852", "cp855": "cp855", "cp858": "cp858",
+    "cp866": "cp866", "applemac": "mac-roman", "macce": "mac-latin2",
+}
+
+_INPUTENC = re.compile(rb'\\usepackage\[([^\]]*)\]\{inputenc\}')
+_LYX_INPUTENCODING = re.compile(rb'^\\inputencoding[ \t]+(\S+)', re.MULTILINE)
+# LyX switches the input encoding in the body of mixed-language exports, e.g. around Hebrew text
+# in an English document.
+_ENCODING_SWITCH = re.compile(rb'\\inputencoding\{([^}\s]*)\}')
+# Bytes held back at the end of a chunk, so a switch cut in two is seen whole in the next one.
+_SWITCH_LOOKBEHIND = 64
+_ERROR_HANDLER = "lyxtomarkdown-count"
+_error_counts = threading.local()
+
+
+def _count_undecodable(error):
+    _error_counts.value = getattr(_error_counts, "value", 0) + error.end - error.start
+    return REPLACEMENT_CHARACTER, error.end
+
+
+codecs.register_error(_ERROR_HANDLER, _count_undecodable)
+
+
+class TranscodeResult:
+    """The text of a transcoded file and what happened to it."""
+    def __init__(self, text, encoding, source, undecodable_bytes, declared=None, switches=0):
+        """
+        Args:
+            text (str): The decoded text, after artifact cleanup.
+            encoding (str): The codec the text started in.
+            source (str): How the encoding was chosen: "argument", "declared", "detected",
+                          "default" or "ambiguous" (several encodings were declared and the
+                          text has no switches between them, so the default was used).
+            undecodable_bytes (int): Bytes that are invalid in the encoding. They are
+                                     replaced with U+FFFD rather than dropped.
+            declared (list, optional): Every encoding declared in the preamble.
+            switches (int): The in-body \\inputencoding{...} switches that were followed.
+        """
+        self.text = text
+        self.encoding = encoding
+        self.source = source
+        self.undecodable_bytes = undecodable_bytes
+        self.declared = list(declared or [])
+        self.switches = switches
+
+    @property
+    def transcoded(self):
+        """False when the input was already UTF-8 and was only decoded."""
+        return codecs.lookup(self.encoding).name not in ("utf-8", "utf-8-sig")
+
+
+def declared_encodings(head):
+    """
+    Returns the codecs declared in a LaTeX preamble or LyX header, in order, without repeats.
+
+    Mixed-language exports declare several, e.g. \\usepackage[cp1255,latin9]{inputenc}.
+    """
+    encodings = []
+    for match in _INPUTENC.finditer(head):
+        for option in match.group(1).decode('ascii', errors='replace').split(","):
+            encoding = INPUT_ENCODINGS.get(option.strip().lower())
+            if encoding and encoding not in encodings:
+                encodings.append(encoding)
+    if not encodings:
+        match = _LYX_INPUTENCODING.search(head)
+        encoding = match and INPUT_ENCODINGS.get(match.group(1).decode('ascii', errors='replace').lower())
+        if encoding:
+            encodings.append(encoding)
+    return encodings
+
+
+def declared_encoding(head):
+    """
+    Returns the codec declared in a LaTeX preamble or LyX header, or None.
+
+    The last inputenc option that names a known encoding wins, as it does in LaTeX.
+    """
+    encodings = declared_encodings(head)
+    return encodings[-1] if encodings else None
+
+
+def looks_like_utf8(head, complete=False):
+    """
+    Returns True if head contains non-ASCII bytes and all of them form valid UTF-8.
+
+    Single-byte encodings almost never produce valid multi-byte UTF-8 sequences by accident, so
+    this is a reliable signal. A sequence cut off at the end of head is tolerated, unless head
+    is the complete file.
+    """
+    if head.isascii():
+        return False
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=complete)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def detect_encoding(head, default="cp1255", complete=False):
+    """
+    Chooses the encoding of a file from its first bytes, or all of them if complete is True.
+
+    With several declared encodings, LaTeX starts in the last one and the body switches between
+    them with \\inputencoding{...}. If head has no such switch, the switches cannot be relied on
+    and the default is used when it is among the declared encodings.
+
+    Returns:
+        tuple: (encoding, source) where source is "declared", "detected", "default" or
+               "ambiguous".
+    """
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig", "detected"
+    encodings = declared_encodings(head)
+    if len(encodings) > 1 and default in encodings and not _ENCODING_SWITCH.search(head):
+        return default, "ambiguous"
+    if encodings:
+        return encodings[-1], "declared"
+    if looks_like_utf8(head, complete):
+        return "utf-8", "detected"
+    return default, "default"
+
+
+def _remove(text, remove):
+    # str.replace is much faster than str.translate on non-ASCII text such as Hebrew.
+    for char in remove or ():
+        text = text.replace(char, "")
+    return text
+
+
+def iter_decoded(stream, encoding, remove=None, chunk_size=CHUNK_SIZE, first_chunk=b""):
+    """
+    Decodes a binary stream chunk by chunk with an incremental decoder.
+
+    Invalid bytes are replaced with U+FFFD; transcode_file counts them.
+
+    Args:
+        stream: A binary file object.
+        encoding (str): The codec.
+        remove (str, optional): Characters deleted from the text in the same pass.
+        chunk_size (int): The number of bytes read at a time.
+        first_chunk (bytes): Bytes already read from the stream.
+
+    Yields:
+        str: Decoded text.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors=_ERROR_HANDLER)
+    chunk = first_chunk or stream.read(chunk_size)
+    while True:
+        final = not chunk
+        text = _remove(decoder.decode(chunk, final=final), remove)
+        if text:
+            yield text
+        if final:
+            return
+        chunk = stream.read(chunk_size)
+
+
+class _SwitchingDecoder:
+    """
+    Decodes a LaTeX stream that changes its input encoding with \\inputencoding{...}.
+
+    The switch is ASCII in every supported encoding, so it is found in the raw bytes; the text
+    after it is decoded with the encoding it names. Switches to unknown encodings are ignored.
+    """
+    def __init__(self, encoding, remove=None):
+        self.encoding = encoding
+        self.remove = remove
+        self.switches = 0
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors=_ERROR_HANDLER)
+        self._pending = b""
+
+    def _decode(self, data, final=False):
+        is_utf8 = codecs.lookup(self.encoding).name in ("utf-8", "utf-8-sig")
+        return _remove(self._decoder.decode(data, final=final), None if is_utf8 else self.remove)
+
+    def decode(self, chunk, final=False):
+        data = self._pending + chunk
+        end = len(data) if final else max(len(data) - _SWITCH_LOOKBEHIND, 0)
+        pieces = []
+        position = 0
+        for match in _ENCODING_SWITCH.finditer(data):
+            if match.start() >= end:
+                break
+            end = max(end, match.end())
+            encoding = INPUT_ENCODINGS.get(match.group(1).decode('ascii', errors='replace').lower())
+            if encoding is None:
+                continue
+            pieces.append(self._decode(data[position:match.end()], final=True))
+            position = match.end()
+            self.switches += 1
+            self.encoding = encoding
+            self._decoder = codecs.getincrementaldecoder(encoding)(errors=_ERROR_HANDLER)
+        pieces.append(self._decode(data[position:end], final=final))
+        self._pending = data[end:]
+        return "".join(pieces)
+
+
+def transcode_file(path, encoding=None, default_encoding="cp1255", remove=None, chunk_size=CHUNK_SIZE):
+    """
+    Reads a text file in its own encoding.
+
+    The encoding is taken from the encoding argument, the file's LaTeX/LyX header or a UTF-8
+    check of its first bytes, in that order, falling back to default_encoding. When the header
+    declares several encodings, the \\inputencoding{...} switches in the body are followed. The
+    file is streamed in chunks; artifact removal happens in the same pass and is skipped for
+    UTF-8 input, where such characters are genuine.
+
+    Args:
+        path (str): The file to read.
+        encoding (str, optional): Overrides detection.
+        default_encoding (str): Used when nothing is declared or detected.
+        remove (str, optional): Characters deleted when transcoding from a non-UTF-8 encoding.
+        chunk_size (int): The number of bytes read at a time.
+
+    Returns:
+        TranscodeResult: The text, the encoding used and the number of undecodable bytes.
+    """
+    with open(path, 'rb') as f:
+        head_size = max(chunk_size, HEADER_SIZE)
+        head = f.read(head_size)
+        declared = declared_encodings(head)
+        source = "argument"
+        if encoding is None:
+            encoding, source = detect_encoding(head, default_encoding, complete=len(head) < head_size)
+        is_utf8 = codecs.lookup(encoding).name in ("utf-8", "utf-8-sig")
+
+        previous_count = getattr(_error_counts, "value", 0)
+        _error_counts.value = 0
+        switches = 0
+        try:
+            if source == "declared" and len(declared) > 1:
+                decoder = _SwitchingDecoder(encoding, remove)
+                pieces = []
+                chunk = head
+                while chunk:
+                    pieces.append(decoder.decode(chunk))
+                    chunk = f.read(chunk_size)
+                pieces.append(decoder.decode(b"", final=True))
+                text = ''.join(pieces)
+                switches = decoder.switches
+            else:
+                text = ''.join(iter_decoded(f, encoding, None if is_utf8 else remove, chunk_size, head))
+            undecodable = _error_counts.value
+        finally:
+            _error_counts.value = previous_count
+    return TranscodeResult(text, encoding, source, undecodable, declared, switches)
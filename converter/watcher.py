@@ -0,0 +1,378 @@
+import ctypes
+import ctypes.util
+import errno
+import fnmatch
+import glob
+import os
+import select
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .batch import _convert_job, output_directory_for, source_root
+from .cache import hash_file
+
+# inotify constants from <sys/inotify.h>.
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct("iIII")
+_WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+               | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+
+def _watch_targets(sources):
+    """Returns (directory, recursive) pairs covering every source."""
+    targets = {}
+    for source in sources:
+        recursive = os.path.isdir(source) or glob.has_magic(source)
+        directory = source_root(source)
+        targets[directory] = targets.get(directory, False) or recursive
+    return list(targets.items())
+
+
+def _scan_lyx_files(directory, recursive):
+    """Yields (path, stat result) for the .lyx files in directory."""
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive:
+                    yield from _scan_lyx_files(entry.path, recursive)
+            elif entry.name.endswith(".lyx"):
+                yield entry.path, entry.stat()
+        except OSError:
+            continue
+
+
+class PollingEventSource:
+    """Detects changed files by comparing the size and modification time of every .lyx file."""
+    name = "polling"
+
+    def __init__(self, targets, interval=1.0):
+        """
+        Args:
+            targets (list): (directory, recursive) pairs to watch.
+            interval (float): Seconds between two scans.
+        """
+        self.targets = targets
+        self.interval = interval
+        self._snapshot = self._scan()
+        self._next_scan = time.monotonic() + interval
+
+    def _scan(self):
+        snapshot = {}
+        for directory, recursive in self.targets:
+            for path, stat in _scan_lyx_files(directory, recursive):
+                snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def wait(self, timeout):
+        """
+        Waits up to timeout seconds for changes.
+
+        Returns:
+            set: The paths that were created, modified or removed.
+        """
+        remaining = self._next_scan - time.monotonic()
+        if remaining > timeout:
+            time.sleep(timeout)
+            return set()
+        if remaining > 0:
+            time.sleep(remaining)
+        self._next_scan = time.monotonic() + self.interval
+
+        snapshot = self._scan()
+        previous = self._snapshot
+        self._snapshot = snapshot
+        changed = {path for path, signature in snapshot.items() if previous.get(path) != signature}
+        changed.update(path for path in previous if path not in snapshot)
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyEventSource:
+    """Receives change notifications from the Linux kernel through inotify, via ctypes."""
+    name = "inotify"
+
+    def __init__(self, targets):
+        """
+        Args:
+            targets (list): (directory, recursive) pairs to watch.
+
+        Raises:
+            OSError: If inotify is unavailable or the watch limit is exhausted.
+        """
+        library = ctypes.util.find_library("c")
+        libc = ctypes.CDLL(library or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available on this platform")
+        self._libc = libc
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self._directories = {}  # watch descriptor -> (directory, recursive)
+        self.targets = targets
+        try:
+            for directory, recursive in targets:
+                self._add_directory(directory, recursive)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_directory(self, directory, recursive):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error in (errno.ENOENT, errno.ENOTDIR):
+                return  # Removed before the watch was added.
+            raise OSError(error, f"Cannot watch {directory}: {os.strerror(error)}")
+        self._directories[wd] = (directory, recursive)
+        if recursive:
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                return
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    self._add_directory(entry.path, recursive)
+
+    def wait(self, timeout):
+        """
+        Waits up to timeout seconds for changes.
+
+        Returns:
+            set: The paths that were created, modified, moved or removed.
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped; report everything so nothing is missed.
+                for directory, recursive in self.targets:
+                    changed.update(path for path, _ in _scan_lyx_files(directory, recursive))
+                continue
+            if mask & IN_IGNORED:
+                self._directories.pop(wd, None)
+                continue
+            if wd not in self._directories or not name:
+                continue
+
+            directory, recursive = self._directories[wd]
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                    # Files may already exist in a directory created or moved into the tree.
+                    self._add_directory(path, recursive)
+                    changed.update(p for p, _ in _scan_lyx_files(path, recursive))
+                continue
+            changed.add(path)
+        return changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class LyxWatcher:
+    """
+    Watches LyX files and re-converts them when they are saved.
+
+    Bursts of events for the same file (LyX writes, renames and touches backups on every save)
+    are coalesced with a debounce window, files whose content did not change are skipped, and a
+    file is never converted by two workers at the same time: a change that arrives while it is
+    being converted is picked up once the running conversion finishes.
+    """
+    def __init__(self, converter, sources, output_directory=None, debounce=0.5, poll_interval=1.0,
+                 use_inotify=None, max_workers=None, on_result=None, logger=None):
+        """
+        Initializes the watcher.
+
+        Args:
+            converter (LyxConverter): The converter used for every file.
+            sources (list): Files, directories (watched recursively) or glob patterns.
+            output_directory (str, optional): The root directory for the generated Markdown files,
+                                              mirrored as in BatchConverter. Defaults to each
+                                              file's own directory.
+            debounce (float): Seconds without further events before a file is converted.
+            poll_interval (float): Seconds between scans when inotify is not used.
+            use_inotify (bool, optional): Force (True) or disable (False) inotify. By default it
+                                          is used when available, with polling as the fallback.
+            max_workers (int, optional): The maximum number of concurrent conversions.
+            on_result (callable, optional): Called with a BatchResult after every conversion, from
+                                            a worker thread.
+            logger (Logger, optional): An instance of the Logger class for logging.
+        """
+        self.converter = converter
+        self.sources = list(sources)
+        self.output_directory = output_directory
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.on_result = on_result
+        self.logger = logger
+        self.event_source = None
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._due = {}  # path -> monotonic time at which the debounce window closes
+        self._running = set()
+        self._changed_while_running = set()
+        self._hashes = {}  # path -> content hash of the last successful conversion
+
+    def _log(self, message, *args, level="info"):
+        """Helper method to log messages if a logger is available and enabled for the level."""
+        if self.logger and self.logger.is_enabled_for(level):
+            getattr(self.logger, level)(message, *args)
+
+    def _create_event_source(self):
+        targets = _watch_targets(self.sources)
+        if self.use_inotify is not False:
+            try:
+                return InotifyEventSource(targets)
+            except OSError as e:
+                if self.use_inotify:
+                    raise
+                self._log("inotify unavailable (%s), falling back to polling every %ss.",
+                          e, self.poll_interval, level="warning")
+        return PollingEventSource(targets, self.poll_interval)
+
+    def _root_for(self, path):
+        """Returns the mirrored root directory if path belongs to a watched source, otherwise None."""
+        if not path.endswith(".lyx"):
+            return None
+        for source in self.sources:
+            root = source_root(source)
+            if os.path.isdir(source):
+                if path.startswith(root + os.sep):
+                    return root
+            elif glob.has_magic(source):
+                if fnmatch.fnmatch(path, os.path.abspath(source)):
+                    return root
+            elif path == os.path.abspath(source):
+                return root
+        return None
+
+    def remember_current(self, paths):
+        """
+        Records the current content of paths as converted, e.g. the files an initial batch run
+        converted, so that only later edits trigger their conversion. Pass only the files that
+        converted: a file left out is converted on its next save even if it did not change.
+        """
+        for path in paths:
+            try:
+                self._hashes[os.path.abspath(path)] = hash_file(path)
+            except OSError:
+                continue
+
+    def run(self):
+        """Watches until stop() is called. Blocks the calling thread."""
+        self._stop.clear()
+        self.event_source = self._create_event_source()
+        self._log("Watching %s for changes (%s).", ", ".join(self.sources), self.event_source.name)
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while not self._stop.is_set():
+                    for path in self.event_source.wait(self._next_timeout()):
+                        self._on_event(os.path.abspath(path))
+                    self._dispatch_due(executor)
+        finally:
+            self.event_source.close()
+            self._log("Stopped watching.")
+
+    def stop(self):
+        """Asks run() to return; conversions already in progress are finished first."""
+        self._stop.set()
+
+    def _next_timeout(self):
+        # Wake up for the earliest debounce deadline, and regularly to notice stop().
+        with self._lock:
+            if not self._due:
+                return 0.5
+            return min(0.5, max(0.0, min(self._due.values()) - time.monotonic()))
+
+    def _on_event(self, path):
+        if self._root_for(path) is None:
+            return
+        with self._lock:
+            if path in self._running:
+                self._changed_while_running.add(path)
+            else:
+                self._due[path] = time.monotonic() + self.debounce
+
+    def _dispatch_due(self, executor):
+        now = time.monotonic()
+        with self._lock:
+            ready = [path for path, deadline in self._due.items() if deadline <= now]
+            for path in ready:
+                del self._due[path]
+
+        for path in ready:
+            try:
+                content_hash = hash_file(path)
+            except FileNotFoundError:
+                self._hashes.pop(path, None)
+                self._log("%s was removed, nothing to convert.", path)
+                continue
+            except OSError as e:
+                self._log("Cannot read %s: %s", path, e, level="warning")
+                continue
+            if self._hashes.get(path) == content_hash:
+                self._log("%s is unchanged, skipping conversion.", path)
+                continue
+
+            with self._lock:
+                self._running.add(path)
+            output_directory = output_directory_for(path, self._root_for(path), self.output_directory)
+            self._log("%s changed, converting.", path)
+            executor.submit(self._convert, path, output_directory, content_hash)
+
+    def _convert(self, path, output_directory, content_hash):
+        result = _convert_job(self.converter, path, output_directory)
+        with self._lock:
+            if result.succeeded:
+                self._hashes[path] = content_hash
+            self._running.discard(path)
+            if path in self._changed_while_running:
+                self._changed_while_running.discard(path)
+                self._due[path] = time.monotonic() + self.debounce
+
+        if result.succeeded:
+            self._log("Converted %s in %.2fs", path, result.duration)
+        else:
+            self._log("Failed to convert %s: %s", path, result.error, level="error")
+        if self.on_result:
+            self.on_result(result)
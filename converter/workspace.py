@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+
+# Preferred locations for scratch files, in order. tmpfs keeps intermediate I/O off the disk.
+TMPFS_DIRECTORIES = ("/dev/shm",)
+# A workspace needs room for the document, its LaTeX export and LyX's temporary files.
+SPACE_FACTOR = 4
+MIN_FREE_BYTES = 64 * 1024 * 1024
+
+
+def set_origin(lyx_text, origin):
+    """
+    Returns lyx_text with its \\origin header set to the directory origin.
+
+    LyX resolves relative paths (graphics, child documents, bibliographies) against \\origin, so a
+    copy of a document placed elsewhere must point it back at the original directory.
+    """
+    origin_line = f"\\origin {origin.rstrip(os.sep)}{os.sep}\n"
+    lines = lyx_text.splitlines(keepends=True)
+    for index, line in enumerate(lines):
+        if line.startswith("\\origin "):
+            lines[index] = origin_line
+            return "".join(lines)
+        if line.startswith("\\end_header"):
+            break
+    position = next((i + 1 for i, line in enumerate(lines) if line.startswith("\\begin_header")), 0)
+    lines.insert(position, origin_line)
+    return "".join(lines)
+
+
+def scratch_root(preferred=None, needed_bytes=0):
+    """
+    Returns the directory in which workspaces are created.
+
+    Args:
+        preferred (str, optional): A configured scratch directory, used if it is writable.
+        needed_bytes (int): The size of the job; tmpfs is skipped when it is short of space.
+
+    Returns:
+        str: preferred, a tmpfs directory such as /dev/shm, or the system temporary directory.
+    """
+    candidates = [preferred] if preferred else []
+    candidates += list(TMPFS_DIRECTORIES)
+    for directory in candidates:
+        if not os.path.isdir(directory) or not os.access(directory, os.W_OK | os.X_OK):
+            continue
+        try:
+            free = shutil.disk_usage(directory).free
+        except OSError:
+            continue
+        if free >= max(MIN_FREE_BYTES, needed_bytes * SPACE_FACTOR):
+            return directory
+    return tempfile.gettempdir()
+
+
+class Workspace:
+    """
+    A private scratch directory for one conversion job.
+
+    The source document is copied in with its \\origin pointing back at the original directory,
+    so LyX writes its export inside the workspace and never into the source tree. Concurrent jobs,
+    even for the same document, never share a path. The directory is removed on exit.
+
+    Usage:
+        with Workspace(lyx_file_path) as workspace:
+            run_lyx_export(workspace.lyx_path)
+            read(workspace.tex_path)
+    """
+    def __init__(self, lyx_file_path, scratch_directory=None, prefix="lyxtomarkdown-"):
+        """
+        Args:
+            lyx_file_path (str): The document to convert.
+            scratch_directory (str, optional): Where to create the workspace. Defaults to tmpfs
+                                               when available, else the temporary directory.
+            prefix (str): The prefix of the workspace directory name.
+        """
+        self.source_path = os.path.abspath(lyx_file_path)
+        self.scratch_directory = scratch_directory
+        self.prefix = prefix
+        self.directory = None
+        self.lyx_path = None
+
+    @property
+    def tex_path(self):
+        """The path of the LaTeX file LyX exports from lyx_path."""
+        return os.path.splitext(self.lyx_path)[0] + ".tex"
+
+    def __enter__(self):
+        with open(self.source_path, 'rb') as f:
+            content = f.read()
+        root = scratch_root(self.scratch_directory, len(content))
+        self.directory = tempfile.mkdtemp(prefix=self.prefix, dir=root)
+        try:
+            self.lyx_path = os.path.join(self.directory, os.path.basename(self.source_path))
+            # surrogateescape keeps documents in legacy encodings byte-for-byte intact.
+            text = content.decode('utf-8', errors='surrogateescape')
+            origin = os.path.dirname(self.source_path)
+            with open(self.lyx_path, 'wb') as f:
+                f.write(set_origin(text, origin).encode('utf-8', errors='surrogateescape'))
+        except BaseException:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        return False
@@ -1,9 +1,18 @@
+import asyncio
+import itertools
+import queue
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
 import threading
 
+from converter.async_converter import AsyncLyxConverter
+from converter.batch import collect_lyx_files, output_directory_for
 from converter.lyx_converter import LyxConverter
+from converter.rules import build_postprocessor
+from converter.supervision import build_reliability
+from converter.toolchain import resolve_executable
+from converter.watcher import LyxWatcher
 from config.config_manager import ConfigManager
 from logging_utils.logger import Logger
 from logging_utils.error_handler import ErrorHandler
@@ -11,28 +20,81 @@ from logging_utils.error_handler import ErrorHandler
 from gui_frames.config_frame import ConfigFrame
 from gui_frames.io_frame import IOFrame
 from gui_frames.action_frame import ActionFrame
+from gui_frames.queue_frame import QueueFrame
 from gui_frames.status_frame import StatusFrame
 
+# How often updates from worker threads are applied to the widgets.
+UI_REFRESH_MS = 50
+# Updates applied per tick; the rest wait for the next one, so a burst cannot freeze the window.
+MAX_UI_EVENTS = 500
+
+
+class QueuedJob:
+    """A file in the conversion queue."""
+    ACTIVE = ("queued", "running")
+
+    def __init__(self, job_id, lyx_file_path, root):
+        """
+        Args:
+            job_id (str): The job's row id in the QueueFrame.
+            lyx_file_path (str): The file to convert.
+            root (str): The directory whose layout is mirrored in the output directory.
+        """
+        self.job_id = job_id
+        self.lyx_file_path = lyx_file_path
+        self.root = root
+        self.status = "pending"
+        self.future = None
+
+    @property
+    def active(self):
+        return self.status in self.ACTIVE
+
 class LyxConverterApp(tk.Tk):
     """The main controller class for the LyX to Markdown converter GUI."""
     def __init__(self):
         super().__init__()
         self.title("LyX to Markdown Converter")
-        self.geometry("700x500")
-        self.minsize(650, 500)
+        self.geometry("760x720")
+        self.minsize(650, 600)
 
         # --- Setup Core Components ---
-        self.logger = Logger()
+        self.logger = Logger(use_queue=True)
         self.error_handler = ErrorHandler(self.logger)
         self.config_manager = ConfigManager()
         self.config = self.config_manager.load_config()
         self.logger.info("Application started and configuration loaded.")
+        self._resolve_executables()
+        self.watcher = None
+        self.jobs = {}
+        # The latest job of every file, so that adding a file already in the queue is found quickly.
+        self._jobs_by_path = {}
+        self._job_ids = itertools.count(1)
+        self._async_converter = None
+        self._async_converter_paths = None
+        self._loop = None
+        # Worker threads never touch widgets: they post callables here, and the Tk main loop
+        # runs them, and renders the status messages they logged, every UI_REFRESH_MS.
+        self._ui_events = queue.SimpleQueue()
 
         self._setup_theme()
         self._create_widgets()
+        self.after(UI_REFRESH_MS, self._process_ui_events)
 
         self.protocol("WM_DELETE_WINDOW", self._on_closing)
 
+    def _resolve_executables(self):
+        """Replaces configured LyX and Pandoc paths that do not exist with the ones found on PATH."""
+        config_paths = self.config["paths"]
+        for name in ("lyx", "pandoc"):
+            key = f"{name}_executable"
+            if config_paths.get(key) and os.path.exists(config_paths[key]):
+                continue
+            found = resolve_executable(name, config_paths.get(key))
+            if found:
+                self.logger.info(f"{key} not found at {config_paths.get(key)!r}, using {found}.")
+                config_paths[key] = found
+
     def _setup_theme(self):
         style = ttk.Style(self)
         try:
@@ -50,7 +112,12 @@ class LyxConverterApp(tk.Tk):
         self.io_frame = IOFrame(main_frame, self, self.config["paths"])
         self.io_frame.pack(fill="x", pady=10)
 
-        self.action_frame = ActionFrame(main_frame, self._start_conversion_thread)
+        self.queue_frame = QueueFrame(main_frame, self.add_lyx_files, self.add_lyx_folder, self._retry_jobs,
+                                      self._remove_jobs)
+        self.queue_frame.pack(fill="both", expand=True, pady=5)
+
+        self.action_frame = ActionFrame(main_frame, self._convert_queue, self._toggle_watch,
+                                        self._cancel_conversion)
         self.action_frame.pack(fill="x", pady=10)
 
         self.status_frame = StatusFrame(main_frame, "Status")
@@ -76,59 +143,295 @@ class LyxConverterApp(tk.Tk):
             self.logger.info(f"Selected output directory: {path}")
             selector.set(path)
 
-    def _start_conversion_thread(self):
-        self.action_frame.set_button_state("disabled")
-        self.status_frame.clear()
-        self.logger.info("Conversion process started by user.")
+    def add_lyx_files(self):
+        paths = filedialog.askopenfilenames(filetypes=[("LyX files", "*.lyx"), ("All files", "*.*")])
+        for path in paths:
+            self._add_job(path, os.path.dirname(path))
+        if paths:
+            self.logger.info(f"Queued {len(paths)} files.")
 
-        thread = threading.Thread(target=self._run_conversion)
-        thread.daemon = True
-        thread.start()
+    def add_lyx_folder(self):
+        folder = filedialog.askdirectory()
+        if folder:
+            files = collect_lyx_files(folder)
+            for path, root in files:
+                self._add_job(path, root)
+            self.logger.info(f"Queued {len(files)} files from {folder}")
+            self.status_frame.log(f"Queued {len(files)} files from {folder}.")
+
+    def _add_job(self, lyx_file_path, root):
+        lyx_file_path = os.path.abspath(lyx_file_path)
+        job = self._jobs_by_path.get(lyx_file_path)
+        if job and job.status in ("pending", *QueuedJob.ACTIVE):
+            return job
+        job = QueuedJob(f"job{next(self._job_ids)}", lyx_file_path, root)
+        self.jobs[job.job_id] = job
+        self._jobs_by_path[lyx_file_path] = job
+        self.queue_frame.add(job.job_id, lyx_file_path)
+        return job
+
+    def _post(self, function, *args):
+        """Runs function(*args) on the Tk main loop. Safe to call from any thread."""
+        self._ui_events.put((function, args))
+
+    def _process_ui_events(self):
+        """
+        Applies what worker threads posted since the last tick, in one batch of at most
+        MAX_UI_EVENTS, then renders the status messages. A longer backlog is applied in the
+        following ticks, which come without the usual delay, so user input is handled in between.
+        An update that fails is logged and skipped.
+        """
+        delay = UI_REFRESH_MS
+        try:
+            for _ in range(MAX_UI_EVENTS):
+                try:
+                    function, args = self._ui_events.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    function(*args)
+                except Exception as e:
+                    self.logger.error(f"UI update {getattr(function, '__name__', function)} failed: {e}",
+                                      exc_info=True)
+            else:
+                delay = 1
+            self.status_frame.flush()
+        finally:
+            self.after(delay, self._process_ui_events)
+
+    def _ensure_loop(self):
+        """Starts the event loop thread that runs every conversion, on first use."""
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=self._loop.run_forever)
+            thread.daemon = True
+            thread.start()
+        return self._loop
+
+    def _converter_options(self):
+        """Returns the LyxConverter settings taken from the configuration."""
+        asset_config = self.config["assets"]
+        try:
+            postprocessor = build_postprocessor(self.config["postprocess"])
+        except ValueError as e:
+            self.logger.error(f"Invalid post-processing rules, using the defaults: {e}")
+            postprocessor = build_postprocessor()
+        deadlines, retry_policy = build_reliability(self.config["reliability"],
+                                                    self.config["converter"]["stage_timeouts"])
+        return {
+            "postprocessor": postprocessor,
+            "deadlines": deadlines,
+            "retry_policy": retry_policy,
+            "scratch_directory": self.config["converter"]["scratch_directory"] or None,
+            "asset_directory": asset_config["directory"] if asset_config["enabled"] else None,
+            "hardlink_assets": asset_config["hardlinks"],
+        }
 
-    def _run_conversion(self):
+    def _get_async_converter(self, config_paths):
+        paths = (config_paths["lyx_executable"], config_paths["pandoc_executable"])
+        if self._async_converter is None or self._async_converter_paths != paths:
+            converter = LyxConverter(lyx_executable=paths[0], pandoc_executable=paths[1], logger=self.logger,
+                                     **self._converter_options())
+            self._async_converter = AsyncLyxConverter(converter, max_concurrency=os.cpu_count() or 1,
+                                                      logger=self.logger)
+            self._async_converter_paths = paths
+        return self._async_converter
+
+    def _convert_queue(self):
+        """Starts converting every pending job, or the selected input file if nothing is queued."""
         config_paths = self.config_frame.get_paths()
         io_paths = self.io_frame.get_paths()
-        
         lyx_file = io_paths.get("last_lyx_file")
         output_dir = io_paths.get("last_output_dir")
 
-        if not all([config_paths.get("lyx_executable"), config_paths.get("pandoc_executable"), lyx_file, output_dir]):
+        pending = [job for job in self.jobs.values() if job.status == "pending"]
+        if not pending and lyx_file:
+            job = self._add_job(lyx_file, os.path.dirname(lyx_file))
+            pending = [job] if job.status == "pending" else []
+        if not pending:
+            messagebox.showinfo("Nothing to Convert", "Add files or folders to the queue first.")
+            return
+        if not all([config_paths.get("lyx_executable"), config_paths.get("pandoc_executable")]):
             self.error_handler.handle_exception(ValueError("All paths must be specified."))
+            messagebox.showerror("Error", "The LyX and Pandoc executables must be specified.")
+            return
+
+        self.logger.info(f"Conversion of {len(pending)} files started by user.")
+        self.logger.info(f"Conversion arguments: {config_paths}, {io_paths}")
+        self.status_frame.log(f"Converting {len(pending)} files...")
+        async_converter = self._get_async_converter(config_paths)
+        loop = self._ensure_loop()
+        for job in pending:
+            self._submit(job, async_converter, output_dir or None, loop)
+        self.action_frame.set_running(True)
+
+    def _submit(self, job, async_converter, output_dir, loop):
+        job.status = "queued"
+        self.queue_frame.update_job(job.job_id, "Queued")
+        output_directory = output_directory_for(job.lyx_file_path, job.root, output_dir)
+        job.future = asyncio.run_coroutine_threadsafe(
+            async_converter.convert(
+                job.lyx_file_path, output_directory,
+                on_progress=lambda event, job=job: self._post(self._report_progress, job, event)
+            ),
+            loop
+        )
+        job.future.add_done_callback(lambda future, job=job: self._post(self._job_finished, job, future))
+
+    def _report_progress(self, job, event):
+        """Shows the stage a job is in. Runs on the Tk main loop."""
+        if not job.active or event.status != "started" or event.stage in ("queued", "done"):
+            return
+        job.status = "running"
+        self.queue_frame.update_job(job.job_id, f"Running: {event.stage}", event.elapsed)
+
+    def _job_finished(self, job, future):
+        """Records the outcome of a job. Runs on the Tk main loop."""
+        name = os.path.basename(job.lyx_file_path)
+        if future.cancelled():
+            job.status = "cancelled"
+            self.queue_frame.update_job(job.job_id, "Cancelled")
+            self.status_frame.log(f"Cancelled {name}.")
+        elif future.exception() is not None:
+            error = future.exception()
+            job.status = "failed"
+            self.queue_frame.update_job(job.job_id, "Failed")
+            self.status_frame.log(f"FAILED {name}: {error}")
+            self.logger.error(f"Conversion of {job.lyx_file_path} failed: {error}")
+        else:
+            job.status = "done"
+            self.queue_frame.update_job(job.job_id, "Done")
+            self.status_frame.log(f"OK     {name} -> {future.result()}")
+
+        if not any(other.active for other in self.jobs.values()):
+            self.action_frame.set_running(False)
+            counts = {status: 0 for status in ("done", "failed", "cancelled")}
+            for other in self.jobs.values():
+                if other.status in counts:
+                    counts[other.status] += 1
+            summary = (f"Finished: {counts['done']} converted, {counts['failed']} failed, "
+                       f"{counts['cancelled']} cancelled.")
+            self.status_frame.log(summary)
+            self.logger.info(summary)
+
+    def _cancel_conversion(self):
+        """Cancels every queued and running job; running LyX or Pandoc processes are killed."""
+        active = [job for job in self.jobs.values() if job.active]
+        if active:
+            self.logger.info(f"Cancelling {len(active)} conversions...")
+        for job in active:
+            job.future.cancel()
+
+    def _selected_or_all(self, statuses):
+        selected = self.queue_frame.selected()
+        jobs = [self.jobs[job_id] for job_id in selected] if selected else self.jobs.values()
+        return [job for job in jobs if job.status in statuses]
+
+    def _retry_jobs(self):
+        """Queues the selected failed or cancelled jobs (all of them if none is selected) again."""
+        jobs = self._selected_or_all(("failed", "cancelled"))
+        for job in jobs:
+            job.status = "pending"
+            self.queue_frame.update_job(job.job_id, "Pending")
+        if jobs:
+            self._convert_queue()
+
+    def _remove_jobs(self):
+        """Removes the selected jobs (all finished ones if none is selected); running jobs stay."""
+        for job in self._selected_or_all(("pending", "done", "failed", "cancelled")):
+            del self.jobs[job.job_id]
+            if self._jobs_by_path.get(job.lyx_file_path) is job:
+                del self._jobs_by_path[job.lyx_file_path]
+            self.queue_frame.remove(job.job_id)
+
+    def _toggle_watch(self):
+        """
+        Starts or stops re-converting the selected file whenever it is saved. Without a selected
+        file, asks for a folder and watches every .lyx file in it, as --watch does.
+        """
+        if not self.action_frame.is_watching():
+            self._stop_watching()
+            return
+
+        config_paths = self.config_frame.get_paths()
+        io_paths = self.io_frame.get_paths()
+        lyx_file = io_paths.get("last_lyx_file")
+        output_dir = io_paths.get("last_output_dir")
+        if not all([config_paths.get("lyx_executable"), config_paths.get("pandoc_executable"), output_dir]):
             messagebox.showerror("Error", "All paths must be specified.")
-            self.action_frame.set_button_state("normal")
+            self.action_frame.set_watching(False)
+            return
+        source = lyx_file or filedialog.askdirectory(title="Choose a folder to watch")
+        if not source:
+            self.action_frame.set_watching(False)
             return
 
-        try:
-            self.status_frame.log(f"Starting conversion for: {os.path.basename(lyx_file)}...")
-            self.logger.info(f"Conversion arguments: {config_paths}, {io_paths}")
-
-            # Use the new LyxConverter class
-            converter = LyxConverter(
-                lyx_executable=config_paths["lyx_executable"],
-                pandoc_executable=config_paths["pandoc_executable"],
-                logger=self.logger
-            )
-            markdown_file = converter.convert(lyx_file_path=lyx_file, output_directory=output_dir)
-
-            self.status_frame.log(f"\nSuccess! Markdown file created at:")
-            self.status_frame.log(markdown_file)
-            self.logger.info(f"Conversion successful. Output: {markdown_file}")
-            messagebox.showinfo("Success", "Conversion completed successfully!")
+        converter = LyxConverter(
+            lyx_executable=config_paths["lyx_executable"],
+            pandoc_executable=config_paths["pandoc_executable"],
+            logger=self.logger,
+            **self._converter_options()
+        )
+        watch_config = self.config["watch"]
+        self.watcher = LyxWatcher(
+            converter,
+            [source],
+            output_directory=output_dir,
+            debounce=watch_config["debounce_seconds"],
+            poll_interval=watch_config["poll_interval_seconds"],
+            use_inotify=None if watch_config["use_inotify"] else False,
+            max_workers=1,
+            on_result=lambda result: self._post(self._report_watch_result, result),
+            logger=self.logger
+        )
+        thread = threading.Thread(target=self.watcher.run)
+        thread.daemon = True
+        thread.start()
+        self.status_frame.log(f"Watching {os.path.basename(source)} for changes...")
+        self.logger.info(f"Watch mode started for {source}")
+
+    def _stop_watching(self):
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+            self.status_frame.log("Stopped watching.")
+            self.logger.info("Watch mode stopped.")
 
+    def _report_watch_result(self, result):
+        """Shows the outcome of a watch-mode conversion. Runs on the Tk main loop."""
+        name = os.path.basename(result.lyx_file_path)
+        if result.succeeded:
+            self.status_frame.log(f"Re-converted {name} in {result.duration:.2f}s -> {result.output_path}")
+        else:
+            self.status_frame.log(f"Re-converting {name} failed: {result.error}")
+
+    def _stop_loop(self):
+        """Lets cancelled conversions kill their processes, then stops the event loop thread."""
+        loop, self._loop = self._loop, None
+        if loop is None:
+            return
+
+        async def shutdown():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout=5)
         except Exception as e:
-            user_message = self.error_handler.handle_exception(e)
-            self.status_frame.log(f"\nAn error occurred. See logs/app.log for details.")
-            messagebox.showerror("Conversion Failed", user_message)
-        finally:
-            self.action_frame.set_button_state("normal")
+            self.logger.warning(f"Conversions did not stop cleanly: {e}")
+        loop.call_soon_threadsafe(loop.stop)
 
     def _on_closing(self):
         """Handles saving the config on window close."""
         self.logger.info("Application closing, saving configuration.")
+        self._cancel_conversion()
+        self._stop_watching()
+        self._stop_loop()
         config_paths = self.config_frame.get_paths()
         io_paths = self.io_frame.get_paths()
         self.config["paths"] = {**config_paths, **io_paths}
         self.config_manager.save_config(self.config)
+        self.logger.close()
         self.destroy()
 
 if __name__ == "__main__":
@@ -3,11 +3,34 @@ from tkinter import ttk
 
 class ActionFrame(ttk.Frame):
     """Frame for the main action buttons."""
-    def __init__(self, parent, convert_command):
+    def __init__(self, parent, convert_command, watch_command=None, cancel_command=None):
         super().__init__(parent, padding=(0, 10))
 
-        self.convert_button = tk.Button(self, text="Convert to Markdown", command=convert_command)
-        self.convert_button.pack()
+        buttons = ttk.Frame(self)
+        buttons.pack()
+        self.convert_button = tk.Button(buttons, text="Convert to Markdown", command=convert_command)
+        self.convert_button.pack(side="left")
 
-    def set_button_state(self, state):
-        self.convert_button.config(state=state)
+        self.cancel_button = None
+        if cancel_command:
+            self.cancel_button = tk.Button(buttons, text="Cancel", command=cancel_command, state="disabled")
+            self.cancel_button.pack(side="left", padx=(5, 0))
+
+        self.watch_enabled = tk.BooleanVar(value=False)
+        if watch_command:
+            self.watch_check = ttk.Checkbutton(
+                self, text="Watch for changes and re-convert on save",
+                variable=self.watch_enabled, command=watch_command
+            )
+            self.watch_check.pack(pady=(5, 0))
+
+    def set_running(self, running):
+        """Enables the cancel button while conversions run; the convert button stays usable."""
+        if self.cancel_button:
+            self.cancel_button.config(state="normal" if running else "disabled")
+
+    def is_watching(self):
+        return self.watch_enabled.get()
+
+    def set_watching(self, enabled):
+        self.watch_enabled.set(enabled)
@@ -0,0 +1,44 @@
+import tkinter as tk
+from tkinter import ttk
+
+class QueueFrame(ttk.LabelFrame):
+    """Frame listing the files queued for conversion with their progress."""
+    def __init__(self, parent, add_files_command, add_folder_command, retry_command, remove_command):
+        super().__init__(parent, text="Conversion Queue", padding="10")
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        self.tree = ttk.Treeview(self, columns=("status", "time"), height=6, selectmode="extended")
+        self.tree.heading("#0", text="File")
+        self.tree.heading("status", text="Status")
+        self.tree.heading("time", text="Time")
+        self.tree.column("#0", width=380, stretch=True)
+        self.tree.column("status", width=140, stretch=False)
+        self.tree.column("time", width=70, stretch=False, anchor="e")
+        self.tree.grid(row=0, column=0, sticky="nsew")
+
+        scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.tree.yview)
+        scrollbar.grid(row=0, column=1, sticky="ns")
+        self.tree.config(yscrollcommand=scrollbar.set)
+
+        buttons = ttk.Frame(self)
+        buttons.grid(row=1, column=0, columnspan=2, sticky="w", pady=(5, 0))
+        tk.Button(buttons, text="Add Files...", command=add_files_command).pack(side="left")
+        tk.Button(buttons, text="Add Folder...", command=add_folder_command).pack(side="left", padx=(5, 0))
+        tk.Button(buttons, text="Retry", command=retry_command).pack(side="left", padx=(5, 0))
+        tk.Button(buttons, text="Remove", command=remove_command).pack(side="left", padx=(5, 0))
+
+    def add(self, job_id, path):
+        self.tree.insert("", "end", iid=job_id, text=path, values=("Pending", ""))
+
+    def update_job(self, job_id, status, elapsed=None):
+        if self.tree.exists(job_id):
+            self.tree.item(job_id, values=(status, "" if elapsed is None else f"{elapsed:.1f}s"))
+
+    def remove(self, job_id):
+        if self.tree.exists(job_id):
+            self.tree.delete(job_id)
+
+    def selected(self):
+        """Returns the ids of the selected jobs."""
+        return list(self.tree.selection())
@@ -2,7 +2,15 @@ import tkinter as tk
 from tkinter import ttk
 
 class StatusFrame(ttk.LabelFrame):
-    """A frame for displaying status messages with a scrollbar."""
+    """
+    A frame for displaying status messages with a scrollbar.
+
+    log and clear must be called on the Tk main loop; worker threads post them through the
+    application's UI event queue. Messages are collected and rendered by flush, which the
+    application calls once per tick, and only the last MAX_LINES lines are kept.
+    """
+    MAX_LINES = 1000
+
     def __init__(self, parent, text):
         super().__init__(parent, text=text, padding="10")
         self.grid_rowconfigure(0, weight=1)
@@ -16,14 +24,33 @@ class StatusFrame(ttk.LabelFrame):
         scrollbar.grid(row=0, column=1, sticky="ns")
         self.text_widget.config(yscrollcommand=scrollbar.set)
 
+        self._lines = []
+        self._clear = False
+
     def log(self, message):
-        self.text_widget.config(state="normal")
-        self.text_widget.insert(tk.END, message + "\n")
-        self.text_widget.see(tk.END)
-        self.text_widget.config(state="disabled")
-        self.update_idletasks()
+        self._lines.append(message)
+        if len(self._lines) > 2 * self.MAX_LINES:
+            del self._lines[:-self.MAX_LINES]
 
     def clear(self):
-        self.text_widget.config(state="normal")
-        self.text_widget.delete(1.0, tk.END)
-        self.text_widget.config(state="disabled")
+        self._lines = []
+        self._clear = True
+
+    def flush(self):
+        """Writes the messages logged since the last flush with a single insert, then trims the oldest lines."""
+        lines, clear = self._lines, self._clear
+        if not (clear or lines):
+            return
+        self._lines = []
+        self._clear = False
+        widget = self.text_widget
+        widget.config(state="normal")
+        if clear:
+            widget.delete(1.0, tk.END)
+        if lines:
+            widget.insert(tk.END, "\n".join(lines[-self.MAX_LINES:]) + "\n")
+            excess = int(widget.index("end-1c").split(".")[0]) - 1 - self.MAX_LINES
+            if excess > 0:
+                widget.delete(1.0, f"{excess + 1}.0")
+            widget.see(tk.END)
+        widget.config(state="disabled")
@@ -1,33 +1,42 @@
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 import os
+import queue
+import threading
 
-class Logger:
-    """A centralized logger for the application."""
-    def __init__(self, name='LyxConverterApp', log_file='app.log', log_level=logging.INFO, console_level=logging.INFO):
-        """
-        Initializes the logger.
+# Handlers and queue listeners of every configured logger, by name. They live here rather than on
+# Logger instances so that a Logger can be pickled into worker processes.
+_backends = {}
+_backends_lock = threading.Lock()
 
-        Args:
-            name (str): The name of the logger.
-            log_file (str): The name of the log file.
-            log_level (int): The logging level for the file.
-            console_level (int): The logging level for the console.
-        """
-        self.logger = logging.getLogger(name)
-        self.logger.setLevel(log_level)
 
-        # Prevent duplicate handlers if this class is instantiated multiple times
-        if self.logger.hasHandlers():
-            self.logger.handlers.clear()
+class _InProcessQueueHandler(QueueHandler):
+    """
+    Hands records to the writer thread unformatted.
+
+    The standard QueueHandler formats every message on the calling thread so that records can
+    cross process boundaries; within one process that is unnecessary, so formatting is left to
+    the writer thread as well.
+    """
+    def prepare(self, record):
+        return record
+
+
+class _FormatOnceListener(QueueListener):
+    """Merges a record's arguments into its message once, instead of once per handler."""
+    def prepare(self, record):
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
 
-        # --- Log Directory ---
-        log_dir = 'logs'
-        if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
-        
-        log_path = os.path.join(log_dir, log_file)
 
+class _LoggingBackend:
+    """The real handlers of one logger and, in queue mode, the thread that feeds them."""
+    def __init__(self, name, log_path, log_level, console_level):
+        self.name = name
+        self.settings = (log_path, log_level, console_level)
         # --- File Handler ---
         # Rotate logs, keeping 5 files of 1MB each.
         file_handler = RotatingFileHandler(
@@ -46,22 +55,153 @@ class Logger:
         file_handler.setFormatter(formatter)
         console_handler.setFormatter(formatter)
 
-        # --- Add Handlers ---
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(console_handler)
+        self.handlers = [file_handler, console_handler]
+        self.listeners = []
+        self.process_queue = None
+
+    def attach(self, logger, use_queue):
+        logger.handlers.clear()
+        if use_queue:
+            thread_queue = queue.SimpleQueue()
+            self._listen(thread_queue)
+            logger.addHandler(_InProcessQueueHandler(thread_queue))
+        else:
+            for handler in self.handlers:
+                logger.addHandler(handler)
+
+    def _listen(self, record_queue):
+        listener = _FormatOnceListener(record_queue, *self.handlers, respect_handler_level=True)
+        listener.start()
+        self.listeners.append(listener)
+
+    def get_process_queue(self):
+        """Returns a queue that worker processes can send records through, creating it on first use."""
+        if self.process_queue is None:
+            import multiprocessing
+            self.process_queue = multiprocessing.Queue(-1)
+            self._listen(self.process_queue)
+        return self.process_queue
+
+    def close(self, logger):
+        """Writes out every queued record, then logs synchronously from here on."""
+        listeners, self.listeners = self.listeners, []
+        for listener in listeners:
+            listener.stop()
+        if self.process_queue is not None:
+            self.process_queue.close()
+            self.process_queue.join_thread()
+            self.process_queue = None
+        if listeners:
+            self.attach(logger, use_queue=False)
+        for handler in self.handlers:
+            handler.flush()
+
+
+def init_worker_logging(name, process_queue, level):
+    """
+    Process pool initializer: routes the named logger of a worker process to the parent's
+    queue, so that only the parent ever writes the log file.
+    """
+    logger = logging.getLogger(name)
+    logger.handlers.clear()
+    logger.addHandler(QueueHandler(process_queue))
+    logger.setLevel(level)
+
+
+@atexit.register
+def _close_all():
+    with _backends_lock:
+        for backend in _backends.values():
+            backend.close(logging.getLogger(backend.name))
+
+
+class Logger:
+    """A centralized logger for the application."""
+    def __init__(self, name='LyxConverterApp', log_file='app.log', log_level=logging.INFO, console_level=logging.INFO,
+                 use_queue=False):
+        """
+        Initializes the logger.
+
+        Args:
+            name (str): The name of the logger.
+            log_file (str): The name of the log file.
+            log_level (int): The logging level for the file.
+            console_level (int): The logging level for the console.
+            use_queue (bool): Hand records to a background thread that formats and writes them,
+                              so logging never blocks the caller on file or console I/O.
+                              Call close() (or let the interpreter exit) to flush the queue.
+        """
+        self.name = name
+        self.logger = logging.getLogger(name)
+        self.logger.setLevel(log_level)
+
+        # --- Log Directory ---
+        log_dir = 'logs'
+        log_path = os.path.join(log_dir, log_file)
+
+        with _backends_lock:
+            backend = _backends.get(name)
+            if (backend is None or use_queue != bool(backend.listeners)
+                    or backend.settings != (log_path, log_level, console_level)):
+                if backend is not None:
+                    # Instantiated again with other settings: replace the handlers rather than
+                    # keep writing where the first instance asked.
+                    backend.close(self.logger)
+                    for handler in backend.handlers:
+                        handler.close()
+
+                if not os.path.exists(log_dir):
+                    os.makedirs(log_dir)
+
+                backend = _LoggingBackend(name, log_path, log_level, console_level)
+                backend.attach(self.logger, use_queue)
+                _backends[name] = backend
+            # Otherwise the logger is already set up: instantiating Logger again must not add
+            # duplicate handlers or restart the writer thread.
+
+    def process_initializer(self):
+        """
+        Returns (initializer, initargs) for a process pool whose workers should log through this
+        logger's writer thread, or (None, ()) when the logger does not use a queue.
+        """
+        with _backends_lock:
+            backend = _backends.get(self.name)
+            if backend is None or not backend.listeners:
+                return None, ()
+            return init_worker_logging, (self.name, backend.get_process_queue(), self.logger.level)
+
+    def close(self):
+        """Flushes queued records and stops the writer thread. Later messages are written directly."""
+        with _backends_lock:
+            backend = _backends.get(self.name)
+            if backend is not None:
+                backend.close(self.logger)
+
+    def is_enabled_for(self, level):
+        """Returns True if messages at level (e.g. logging.DEBUG or "debug") would be logged."""
+        if isinstance(level, str):
+            level = logging.getLevelName(level.upper())
+        return self.logger.isEnabledFor(level)
+
+    # The message may contain %-style placeholders for args; it is only formatted if the record
+    # is actually written, and in queue mode that happens on the writer thread.
+
+    def debug(self, message, *args):
+        """Logs a debug-level message."""
+        self.logger.debug(message, *args)
 
-    def info(self, message):
+    def info(self, message, *args):
         """Logs an info-level message."""
-        self.logger.info(message)
+        self.logger.info(message, *args)
 
-    def warning(self, message):
+    def warning(self, message, *args):
         """Logs a warning-level message."""
-        self.logger.warning(message)
+        self.logger.warning(message, *args)
 
-    def error(self, message, exc_info=False):
+    def error(self, message, *args, exc_info=False):
         """Logs an error-level message."""
-        self.logger.error(message, exc_info=exc_info)
+        self.logger.error(message, *args, exc_info=exc_info)
 
-    def critical(self, message, exc_info=False):
+    def critical(self, message, *args, exc_info=False):
         """Logs a critical-level message."""
-        self.logger.critical(message, exc_info=exc_info)
+        self.logger.critical(message, *args, exc_info=exc_info)
@@ -1,48 +1,747 @@
+import argparse
+import glob
+import json
+import logging
 import os
-from converter.lyx_converter import LyxConverter
+import sys
+
+from config.config_manager import ConfigManager
+from converter.batch import BatchConverter, BatchResult, BatchSummary, collect_lyx_files, read_manifest
+from converter.cache import ConversionCache
+from converter.lyx_converter import LyxConverter, format_base
+from converter.metrics import MetricsRecorder
+from converter.postprocess import PostProcessor
+from converter.rules import build_rule_set
+from converter.supervision import Quarantine, build_reliability
+from converter.toolchain import Toolchain, resolve_executable
 from logging_utils.logger import Logger
 
-def main():
+# asyncio, the Pandoc server, the metrics exporters, the profiler, the watcher, the daemon and the
+# incremental and distributed converters are imported only by the options that use them, so that a
+# plain conversion starts quickly when called from build scripts. The modules imported above are
+# the ones every conversion needs.
+
+# Exit codes.
+EXIT_OK = 0
+EXIT_FAILED = 1  # At least one file failed to convert.
+EXIT_USAGE = 2  # Invalid arguments or manifest.
+EXIT_TOOLCHAIN = 3  # LyX or Pandoc was not found or lacks a required feature.
+EXIT_NO_INPUTS = 4  # The inputs matched no .lyx files.
+EXIT_INTERRUPTED = 130
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert LyX files to Markdown. Accepts files, directories (searched recursively) and glob patterns."
+    )
+    parser.add_argument("inputs", nargs="*",
+                        help="LyX files, directories or glob patterns to convert. '-' reads one input per line "
+                             "from standard input.")
+    parser.add_argument("--manifest",
+                        help="JSON or CSV file mapping inputs to outputs ('-' for standard input), used instead "
+                             "of positional inputs.")
+    parser.add_argument("-o", "--output-dir",
+                        help="Directory for the Markdown files. Defaults to each input's own directory.")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="Maximum number of concurrent conversions (default: number of CPUs).")
+    parser.add_argument("--processes", action="store_true",
+                        help="Use worker processes instead of threads.")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Drive all conversions from one asyncio event loop.")
+    parser.add_argument("--timeout", type=float,
+                        help="Most seconds allowed for the LyX export and for Pandoc, per file; smaller files "
+                             "get less (default: stage_timeouts from config.json).")
+    parser.add_argument("--lyx", help="Path to the LyX executable (default: from config.json).")
+    parser.add_argument("--pandoc", help="Path to the Pandoc executable (default: from config.json).")
+    parser.add_argument("--export-backend", choices=LyxConverter.EXPORT_BACKENDS,
+                        help="Export LaTeX with the LyX executable or the built-in reader, which falls back "
+                             "to LyX for unsupported content (default: from config.json).")
+    parser.add_argument("--scratch-dir", metavar="DIR",
+                        help="Directory for the per-job export workspaces (default: from config.json, "
+                             "else /dev/shm or the system temporary directory).")
+    parser.add_argument("--to", metavar="FORMATS",
+                        help="Comma-separated Pandoc output formats, e.g. gfm,commonmark,html. Each document "
+                             "is exported and parsed once and rendered to every format (default: from "
+                             "config.json, else a single Markdown file).")
+    parser.add_argument("--asset-dir", metavar="DIR",
+                        help="Store the referenced graphics in DIR, relative to the output directory or "
+                             "absolute, and point their links there (default: off, or from config.json).")
+    parser.add_argument("--no-assets", action="store_true",
+                        help="Leave graphics and their links as they are.")
+    parser.add_argument("--pandoc-backend", choices=["auto", "subprocess", "server"],
+                        help="Run one Pandoc process per file, or keep warm 'pandoc server' processes "
+                             "for the whole batch; 'auto' uses servers when Pandoc supports them and more "
+                             "than one document is converted (default: from config.json).")
+    parser.add_argument("--pandoc-servers", type=int,
+                        help="Number of pandoc server processes for --pandoc-backend server.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Split large documents at their parts, chapters or sections and only re-convert "
+                             "the ones that changed (uses the conversion cache directory).")
+    parser.add_argument("--check-toolchain", action="store_true",
+                        help="Find LyX and Pandoc, print their versions and features and exit.")
+    parser.add_argument("--native-coverage", action="store_true",
+                        help="Report which inputs the built-in reader can export on its own and exit.")
+    parser.add_argument("--config", default="config.json",
+                        help="Configuration file that provides the defaults (default: config.json).")
+    parser.add_argument("--json", action="store_true",
+                        help="Print one JSON object per converted file and a final summary object instead "
+                             "of the human-readable report.")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="Only print warnings and errors to the console log.")
+
+    watch_group = parser.add_argument_group("watch mode")
+    watch_group.add_argument("--watch", action="store_true",
+                             help="After converting, keep watching the inputs and re-convert files when they are saved.")
+    watch_group.add_argument("--debounce", type=float,
+                             help="Seconds to wait for a burst of save events to settle (default: from config.json).")
+    watch_group.add_argument("--poll", action="store_true",
+                             help="Poll for changes instead of using inotify.")
+    watch_group.add_argument("--poll-interval", type=float,
+                             help="Seconds between polls when inotify is not used (default: from config.json).")
+
+    reliability_group = parser.add_argument_group("retries and quarantine")
+    reliability_group.add_argument("--retries", type=int,
+                                   help="Times a stage that timed out or crashed is retried (default: from "
+                                        "config.json).")
+    reliability_group.add_argument("--no-quarantine", action="store_true",
+                                   help="Convert quarantined files too, and do not record failures.")
+    reliability_group.add_argument("--quarantine-list", action="store_true",
+                                   help="List the quarantined files and exit.")
+    reliability_group.add_argument("--quarantine-clear", action="store_true",
+                                   help="Release the given inputs (or every file) from quarantine and exit.")
+
+    cache_group = parser.add_argument_group("conversion cache")
+    cache_group.add_argument("--cache", dest="cache", action="store_true", default=None,
+                             help="Reuse cached Markdown for unchanged documents (default: from config.json).")
+    cache_group.add_argument("--no-cache", dest="cache", action="store_false",
+                             help="Disable the conversion cache for this run.")
+    cache_group.add_argument("--cache-dir", help="Directory of the conversion cache.")
+    cache_group.add_argument("--cache-stats", action="store_true",
+                             help="Print cache hit/miss statistics and exit.")
+    cache_group.add_argument("--cache-invalidate", action="store_true",
+                             help="Remove the cached conversions of the given inputs (or of everything) and exit.")
+
+    daemon_group = parser.add_argument_group("conversion daemon")
+    daemon_group.add_argument("--serve", action="store_true",
+                              help="Run a conversion daemon that keeps the converter warm and accepts jobs over "
+                                   "HTTP on localhost or a Unix socket, until stopped with Ctrl+C.")
+    daemon_group.add_argument("--submit", action="store_true",
+                              help="Send the inputs to a running daemon instead of converting them here.")
+    daemon_group.add_argument("--address",
+                              help="host:port or Unix socket path of the daemon (default: from config.json).")
+    daemon_group.add_argument("--priority", type=int, default=0,
+                              help="Priority of the submitted jobs; higher runs first (default: 0).")
+
+    distributed_group = parser.add_argument_group("distributed batch")
+    distributed_group.add_argument("--shard-dir", metavar="DIR",
+                                   help="Convert as one of several workers, possibly on different hosts, that share "
+                                        "this work directory (e.g. on NFS). The first worker splits its inputs into "
+                                        "shards; later workers may leave out the inputs to join the batch.")
+    distributed_group.add_argument("--shard-size", type=int,
+                                   help="Documents per shard (default: from config.json).")
+    distributed_group.add_argument("--lease-seconds", type=float,
+                                   help="Seconds without a heartbeat after which another worker takes over a "
+                                        "shard (default: from config.json).")
+    distributed_group.add_argument("--worker-id",
+                                   help="Name of this worker in leases and results (default: host name and PID).")
+    distributed_group.add_argument("--merge", action="store_true",
+                                   help="Combine the results of every shard in --shard-dir into summary.json, "
+                                        "print the summary and exit.")
+
+    metrics_group = parser.add_argument_group("metrics and profiling")
+    metrics_group.add_argument("--metrics-jsonl",
+                               help="Append the time, CPU time, bytes and exit status of every stage of every "
+                                    "conversion to this JSON-lines file (default: from config.json).")
+    metrics_group.add_argument("--metrics-prometheus",
+                               help="Write stage latency histograms to this file for the node_exporter textfile "
+                                    "collector (default: from config.json).")
+    metrics_group.add_argument("--stage-times", action="store_true",
+                               help="Print per-stage latency percentiles after the batch.")
+    metrics_group.add_argument("--rule-stats", action="store_true",
+                               help="Print how often each post-processing rule matched and the time it took.")
+    metrics_group.add_argument("--profile",
+                               help="Convert a single file under cProfile and tracemalloc, writing the profile to "
+                                    "this path and a text report next to it.")
+
+    args = parser.parse_args(argv)
+    if args.processes and args.pandoc_backend == "server":
+        parser.error("--pandoc-backend server can only be used with threads, not --processes")
+    if args.use_async and (args.processes or args.incremental):
+        parser.error("--async cannot be combined with --processes or --incremental")
+    if args.to and (args.use_async or args.incremental or args.watch or args.profile):
+        parser.error("--to cannot be combined with --async, --incremental, --watch or --profile")
+    if args.retries is not None and args.retries < 0:
+        parser.error("--retries cannot be negative")
+    if args.watch and args.processes:
+        parser.error("--watch can only be used with threads, not --processes")
+    if (args.metrics_prometheus or args.stage_times or args.rule_stats) and args.processes:
+        parser.error("--metrics-prometheus, --stage-times and --rule-stats can only be used with threads, "
+                     "not --processes")
+    if (args.metrics_jsonl or args.metrics_prometheus or args.stage_times) and args.use_async:
+        parser.error("stage metrics are not recorded with --async")
+    if args.profile and (args.use_async or args.processes or args.watch or args.incremental or len(args.inputs) != 1):
+        parser.error("--profile converts exactly one file, without --async, --processes, --watch or --incremental")
+    if args.manifest and (args.inputs or args.watch or args.profile or args.native_coverage):
+        parser.error("--manifest cannot be combined with positional inputs, --watch, --profile or --native-coverage")
+    if args.inputs.count("-") > 1:
+        parser.error("standard input can only be read once")
+    if args.native_coverage and not args.inputs:
+        parser.error("--native-coverage requires at least one input")
+    if args.serve and (args.submit or args.inputs or args.manifest or args.watch or args.use_async or args.processes
+                       or args.profile or args.native_coverage or args.stage_times or args.rule_stats):
+        parser.error("--serve takes no inputs and cannot be combined with --submit, --watch, --async, --processes, "
+                     "--profile, --native-coverage, --stage-times or --rule-stats")
+    if args.submit and (args.watch or args.use_async or args.processes or args.profile or args.incremental
+                        or args.native_coverage):
+        parser.error("--submit cannot be combined with --watch, --async, --processes, --profile, --incremental "
+                     "or --native-coverage; the daemon decides how it converts")
+    if args.shard_dir and (args.watch or args.use_async or args.serve or args.submit or args.profile
+                           or args.native_coverage):
+        parser.error("--shard-dir cannot be combined with --watch, --async, --serve, --submit, --profile "
+                     "or --native-coverage")
+    if args.merge and (not args.shard_dir or args.inputs or args.manifest):
+        parser.error("--merge requires --shard-dir and takes no inputs")
+    if args.shard_size is not None and args.shard_size < 1:
+        parser.error("--shard-size must be at least 1")
+    if not args.inputs and not args.manifest and not args.shard_dir and not (args.cache_stats or args.cache_invalidate or args.serve
+                                                      or args.check_toolchain or args.quarantine_list
+                                                      or args.quarantine_clear):
+        parser.error("at least one input is required")
+    return args
+
+def build_report(args):
+    """Returns the callback that prints each result as it completes."""
+    def report(result):
+        if args.json:
+            print(json.dumps({
+                "type": "result",
+                "input": result.lyx_file_path,
+                "output": result.output_path,
+                "status": "ok" if result.succeeded else "failed",
+                "error": result.error,
+                "duration": round(result.duration, 3),
+            }, ensure_ascii=False), flush=True)
+        elif result.succeeded:
+            output = result.output_path
+            if isinstance(output, dict):
+                output = ", ".join(output.values())
+            print(f"OK     {result.lyx_file_path} -> {output} ({result.duration:.2f}s)")
+        else:
+            print(f"FAILED {result.lyx_file_path}: {result.error}")
+    return report
+
+def print_summary(args, summary):
+    """Prints the summary of a batch."""
+    if args.json:
+        print(json.dumps({
+            "type": "summary",
+            "converted": len(summary.succeeded),
+            "failed": len(summary.failed),
+            "wall_time": round(summary.wall_time, 3),
+        }))
+    else:
+        print(f"\n{summary.format()}")
+
+def read_stdin_inputs(inputs):
+    """Replaces a '-' input with the inputs listed on standard input, one per line."""
+    if "-" not in inputs:
+        return inputs
+    index = inputs.index("-")
+    listed = [line.strip() for line in sys.stdin if line.strip()]
+    return inputs[:index] + listed + inputs[index + 1:]
+
+def plan_jobs(args, batch):
+    """Returns the batch jobs for the positional inputs or the --manifest."""
+    if not args.manifest:
+        return batch.plan(args.inputs, args.output_dir)
+    if args.manifest == "-":
+        return read_manifest(sys.stdin.read())
+    with open(args.manifest, 'r', encoding='utf-8') as f:
+        manifest = f.read()
+    return read_manifest(manifest, base_directory=os.path.dirname(os.path.abspath(args.manifest)))
+
+def build_cache(args, cache_config, logger):
+    """Creates the conversion cache if it is enabled on the command line or in config.json."""
+    enabled = cache_config["enabled"] if args.cache is None else args.cache
+    if not (enabled or args.cache_stats or args.cache_invalidate):
+        return None
+    return ConversionCache(
+        cache_dir=args.cache_dir or cache_config["directory"] or None,
+        max_bytes=cache_config["max_size_mb"] * 1024 * 1024,
+        logger=logger
+    )
+
+def build_quarantine(args, reliability_config, logger):
+    """Creates the quarantine unless it is disabled on the command line or in config.json."""
+    threshold = reliability_config["quarantine_after"]
+    if (args.no_quarantine or not threshold) and not (args.quarantine_list or args.quarantine_clear):
+        return None
+    return Quarantine(reliability_config["quarantine_file"] or None, threshold=threshold or 1, logger=logger)
+
+def run_quarantine_command(args, quarantine):
+    """Handles --quarantine-list and --quarantine-clear."""
+    if args.quarantine_clear:
+        sources = None
+        if args.inputs:
+            sources = [path for source in args.inputs for path, _ in collect_lyx_files(source)]
+        removed = quarantine.clear(sources)
+        print(f"Released {removed} files from quarantine ({quarantine.path}).")
+    if args.quarantine_list:
+        entries = quarantine.entries()
+        print(f"{len(entries)} quarantined files ({quarantine.path}):")
+        for path, record in sorted(entries.items()):
+            print(f"  {path}: {record['failures']} failures, last: {record['error']}")
+    return EXIT_OK
+
+def run_cache_command(args, cache):
+    """Handles --cache-stats and --cache-invalidate."""
+    if args.cache_invalidate:
+        sources = None
+        if args.inputs:
+            sources = [path for source in args.inputs for path, _ in collect_lyx_files(source)]
+        removed = cache.invalidate(sources)
+        print(f"Removed {removed} cached conversions from {cache.cache_dir}.")
+    if args.cache_stats:
+        stats = cache.stats()
+        lookups = stats["hits"] + stats["misses"]
+        hit_rate = stats["hits"] / lookups * 100 if lookups else 0.0
+        print(f"Cache: {cache.cache_dir}")
+        print(f"  entries: {stats['entries']} ({stats['size_bytes'] / 1024 / 1024:.1f} of "
+              f"{stats['max_bytes'] / 1024 / 1024:.0f} MB)")
+        print(f"  hits: {stats['hits']}, misses: {stats['misses']} ({hit_rate:.1f}% hit rate)")
+    return EXIT_OK
+
+def find_toolchain(args, config_paths, logger):
     """
-    Example of how to run the conversion from the command line using the converter package.
-    Users should update the paths below to match their system configuration.
+    Resolves and probes LyX and Pandoc.
+
+    Paths given on the command line are used as they are. Paths from config.json that do not
+    exist fall back to PATH and the usual install locations.
+
+    Returns:
+        Toolchain: The probed toolchain, or None if an executable cannot be found.
     """
-    # --- Setup Logging ---
-    logger = Logger()
+    executables = []
+    for name, label, given, configured in (("lyx", "LyX", args.lyx, config_paths["lyx_executable"]),
+                                           ("pandoc", "Pandoc", args.pandoc, config_paths["pandoc_executable"])):
+        path = resolve_executable(name, given or configured, search=not given)
+        if path is None:
+            where = given if given else f"{configured} or on PATH"
+            logger.error(f"{label} executable not found at {where}.")
+            return None
+        if not given and configured and path != os.path.abspath(os.path.expanduser(configured)):
+            logger.info(f"{label} not found at {configured}, using {path}.")
+        executables.append(path)
+    toolchain = Toolchain(*executables, logger=logger)
+    logger.info(f"Using {toolchain.describe()}.")
+    return toolchain
+
+def run_check_toolchain(args, toolchain):
+    """Handles --check-toolchain: prints the resolved executables with their versions and features."""
+    if args.json:
+        print(json.dumps(toolchain.to_dict(), ensure_ascii=False))
+        return EXIT_OK
+    for label, probe in (("LyX", toolchain.lyx), ("Pandoc", toolchain.pandoc)):
+        print(f"{label}: {probe['path']}")
+        print(f"  version: {probe['version'] or 'unknown'}")
+        if probe["features"]:
+            print(f"  features: {', '.join(probe['features'])}")
+    server_command = toolchain.pandoc_server_command
+    print(f"  server: {' '.join(server_command) if server_command else 'not supported'}")
+    writers = toolchain.pandoc["output_formats"]
+    print(f"  writers: {', '.join(writers) if writers else 'unknown'}")
+    return EXIT_OK
+
+def choose_pandoc_backend(args, requested, toolchain, logger):
+    """
+    Returns "server" or "subprocess" for the requested Pandoc backend.
+
+    "auto" keeps warm servers when Pandoc has them and more than one document will be converted;
+    a single document converts faster with one Pandoc process. An explicit "server" request
+    falls back to subprocesses when Pandoc lists its features and the server is not one of them.
+    """
+    if args.processes:
+        return "subprocess"
+    if requested == "auto":
+        several = (args.serve or args.watch or args.manifest or len(args.inputs) > 1
+                   or any(os.path.isdir(source) or glob.has_magic(source) for source in args.inputs))
+        return "server" if several and toolchain.pandoc_server_command else "subprocess"
+    if requested == "server" and toolchain.pandoc["features"] and not toolchain.pandoc_server_command:
+        logger.warning(f"Pandoc {toolchain.pandoc['version']} has no server support; running one Pandoc "
+                       f"process per file instead.")
+        return "subprocess"
+    return requested
+
+def run_native_coverage(args):
+    """Handles --native-coverage: reports which LyX features force a fallback to the LyX export."""
+    from converter.lyx_reader import scan_coverage
+    paths = [path for source in args.inputs for path, _ in collect_lyx_files(source)]
+    supported, features, errors = scan_coverage(paths)
+    readable = len(paths) - len(errors)
+    percentage = supported / readable * 100 if readable else 0.0
+    print(f"Native reader supports {supported} of {readable} files ({percentage:.1f}%).")
+    if features:
+        print("Features that require the LyX export (files affected):")
+        for feature, count in features.most_common():
+            print(f"  {count:6d}  {feature}")
+    for path, error in errors.items():
+        print(f"  ERROR {path}: {error}")
+    return EXIT_OK
 
+def build_metrics(args, metrics_config):
+    """Creates the metrics hooks requested on the command line or in config.json."""
+    hooks = []
+    jsonl_path = args.metrics_jsonl or metrics_config["jsonl_path"]
+    if jsonl_path:
+        from converter.metrics import JsonLinesExporter
+        hooks.append(JsonLinesExporter(jsonl_path))
+    prometheus_path = args.metrics_prometheus or metrics_config["prometheus_textfile"]
+    # Prometheus aggregates live in one process; worker processes cannot share them.
+    if prometheus_path and not args.processes and not args.use_async:
+        from converter.metrics import PrometheusTextfileExporter
+        hooks.append(PrometheusTextfileExporter(prometheus_path,
+                                                flush_interval=metrics_config["prometheus_flush_seconds"]))
+    stage_summary = None
+    if args.stage_times:
+        from converter.metrics import StageSummary
+        stage_summary = StageSummary()
+        hooks.append(stage_summary)
+    return MetricsRecorder(hooks), stage_summary
+
+def run_profile(args, converter):
+    """Handles --profile: converts a single file under cProfile and tracemalloc."""
+    from converter.metrics import profile_conversion
+    paths = [path for path, _ in collect_lyx_files(args.inputs[0])]
+    if len(paths) != 1:
+        print(f"--profile needs exactly one .lyx file, but {args.inputs[0]} matches {len(paths)}.")
+        return EXIT_NO_INPUTS
+    lyx_file_path = paths[0]
+    output_directory = args.output_dir or os.path.dirname(os.path.abspath(lyx_file_path))
+    output_path = profile_conversion(converter, lyx_file_path, output_directory, args.profile)
+    print(f"OK     {lyx_file_path} -> {output_path}")
+    print(f"Profile written to {args.profile} (report: {args.profile}.txt)")
+    return EXIT_OK
+
+def run_async(converter, batch, jobs, logger, report):
+    """Handles --async: converts the whole batch on one event loop, bounded by --workers."""
+    import asyncio
+    from converter.async_converter import AsyncLyxConverter
+
+    async_converter = AsyncLyxConverter(converter, max_concurrency=batch.max_workers, logger=logger)
+    return asyncio.run(async_converter.convert_batch(jobs, on_result=report))
+
+def run_watch(args, converter, watch_config, logger, report, converted):
+    """
+    Handles --watch: re-converts inputs as they are saved until interrupted with Ctrl+C.
+
+    converted lists the files the initial batch converted; the others are converted again on
+    their next save even if their content did not change.
+    """
+    from converter.watcher import LyxWatcher
+
+    watcher = LyxWatcher(
+        converter,
+        args.inputs,
+        output_directory=args.output_dir,
+        debounce=args.debounce if args.debounce is not None else watch_config["debounce_seconds"],
+        poll_interval=args.poll_interval or watch_config["poll_interval_seconds"],
+        use_inotify=False if args.poll or not watch_config["use_inotify"] else None,
+        max_workers=args.workers,
+        on_result=report,
+        logger=logger
+    )
+    watcher.remember_current(converted)
+    print("Watching for changes. Press Ctrl+C to stop.")
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        watcher.stop()
+    return EXIT_OK
+
+def daemon_address(args, daemon_config):
+    """Returns the daemon address from --address or config.json."""
+    from converter.daemon import address_from_config, parse_address
+    return parse_address(args.address) if args.address else address_from_config(daemon_config)
+
+def daemon_token(address, daemon_config, create=False):
+    """Returns the token that authenticates TCP clients, or None for a Unix socket."""
+    from converter.daemon import load_token
+    if address[0] == "unix":
+        return None
+    return load_token(daemon_config["token_file"] or None, create=create)
+
+def run_serve(args, converter, formats, daemon_config, logger):
+    """Handles --serve: runs the conversion daemon until it is shut down."""
+    from converter.daemon import ConversionDaemon, serve
+
+    try:
+        address = daemon_address(args, daemon_config)
+        token = daemon_token(address, daemon_config, create=True)
+    except (OSError, ValueError) as e:
+        logger.error(str(e))
+        return EXIT_USAGE
+    daemon = ConversionDaemon(converter, max_workers=args.workers or daemon_config["workers"] or None,
+                              formats=formats, logger=logger)
+
+    def ready(address):
+        where = address[1] if address[0] == "unix" else f"http://{address[1]}:{address[2]}"
+        print(f"Conversion daemon listening on {where}. Press Ctrl+C to stop.", flush=True)
+
+    try:
+        serve(daemon, address, on_ready=ready, token=token)
+    except (OSError, RuntimeError, ValueError) as e:
+        logger.error(f"Could not start the daemon: {e}")
+        return EXIT_USAGE
+    return EXIT_OK
+
+def run_submit(args, daemon_config, logger):
+    """Handles --submit: queues the inputs on a running daemon and reports them as they finish."""
+    import time
+    from converter.daemon import DaemonClient
+
+    try:
+        address = daemon_address(args, daemon_config)
+        try:
+            token = daemon_token(address, daemon_config)
+        except OSError as e:
+            raise OSError(f"Could not read the daemon token, is the daemon running? {e}")
+        client = DaemonClient(address, token=token)
+        jobs = plan_jobs(args, BatchConverter(None))
+    except (OSError, ValueError) as e:
+        logger.error(str(e))
+        return EXIT_USAGE
+    if not jobs:
+        logger.error("The inputs do not match any .lyx files.")
+        return EXIT_NO_INPUTS
+
+    formats = [f.strip() for f in args.to.split(",") if f.strip()] if args.to else None
+    report = build_report(args)
+    summary = BatchSummary()
+    start = time.perf_counter()
+    try:
+        submitted = []
+        for job in jobs:
+            lyx_file_path, output_directory = job[:2]
+            output_path = job[2] if len(job) > 2 else None
+            submitted.append(client.submit(lyx_file_path, output_directory, output_path,
+                                           priority=args.priority, formats=formats))
+        for job in submitted:
+            job = client.wait(job["id"])
+            error = job["error"] or ("Cancelled by the daemon." if job["status"] == "cancelled" else None)
+            result = BatchResult(job["input"], output_path=job["output"], error=error,
+                                 duration=job["duration"] or 0.0)
+            summary.add(result)
+            report(result)
+    except ConnectionError as e:
+        logger.error(str(e))
+        return EXIT_TOOLCHAIN
+    except ValueError as e:
+        logger.error(f"The daemon rejected the job: {e}")
+        return EXIT_USAGE
+    except RuntimeError as e:
+        logger.error(f"The daemon failed: {e}")
+        return EXIT_FAILED
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+    summary.wall_time = time.perf_counter() - start
+    print_summary(args, summary)
+    return EXIT_FAILED if summary.failed else EXIT_OK
+
+def run_shard_worker(args, batch, distributed_config, logger, report):
+    """Handles --shard-dir: converts shards of a batch shared with other workers until none are left."""
+    from converter.distributed import ShardWorker, create_plan, load_plan
+
+    try:
+        if args.inputs or args.manifest:
+            jobs = plan_jobs(args, batch)
+            if not jobs:
+                logger.error("The inputs do not match any .lyx files.")
+                return EXIT_NO_INPUTS
+            create_plan(args.shard_dir, jobs, args.shard_size or distributed_config["shard_size"])
+        else:
+            load_plan(args.shard_dir)
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not plan the distributed batch: {e}")
+        return EXIT_USAGE
+    worker = ShardWorker(
+        batch,
+        args.shard_dir,
+        worker_id=args.worker_id,
+        lease_seconds=args.lease_seconds or distributed_config["lease_seconds"],
+        poll_seconds=distributed_config["poll_seconds"],
+        logger=logger
+    )
+    summary = worker.run(on_result=report)
+    print_summary(args, summary)
+    return EXIT_FAILED if summary.failed else EXIT_OK
+
+def run_merge(args, logger):
+    """Handles --merge: combines the results of every shard of a distributed batch."""
+    from converter.distributed import merge_results
+
+    try:
+        summary, missing = merge_results(args.shard_dir)
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not merge the distributed batch: {e}")
+        return EXIT_USAGE
+    if missing:
+        logger.warning(f"{len(missing)} shards have no results yet: {', '.join(missing)}")
+    print_summary(args, summary)
+    return EXIT_FAILED if summary.failed or missing else EXIT_OK
+
+def run(args, logger):
+    """Runs the command-line action args asks for and returns its exit code; see main."""
     # --- Configuration ---
-    LYX_EXECUTABLE = "/Applications/LyX 2.app/Contents/MacOS/lyx"  # For macOS
-    PANDOC_EXECUTABLE = "/opt/homebrew/bin/pandoc"  # For macOS with Homebrew
-
-    project_dir = os.path.dirname(os.path.abspath(__file__))
-    lyx_file = os.path.join(project_dir, "newfile2.lyx")
-    output_dir = project_dir
-    # --- End of Configuration ---
-
-    if not os.path.exists(LYX_EXECUTABLE):
-        logger.error(f"LyX executable not found at: {LYX_EXECUTABLE}")
-        return
-    if not os.path.exists(PANDOC_EXECUTABLE):
-        logger.error(f"Pandoc executable not found at: {PANDOC_EXECUTABLE}")
-        return
-
-    try:
-        logger.info("Starting command-line conversion...")
-        
-        converter = LyxConverter(
-            lyx_executable=LYX_EXECUTABLE, 
-            pandoc_executable=PANDOC_EXECUTABLE, 
-            logger=logger
+    config = ConfigManager(args.config).load_config()
+    config_paths = config["paths"]
+    cache = build_cache(args, config["cache"], logger)
+    if args.cache_stats or args.cache_invalidate:
+        return run_cache_command(args, cache)
+    quarantine = build_quarantine(args, config["reliability"], logger)
+    if args.quarantine_list or args.quarantine_clear:
+        return run_quarantine_command(args, quarantine)
+    if args.merge:
+        return run_merge(args, logger)
+    if args.submit:
+        return run_submit(args, config["daemon"], logger)
+
+    toolchain = find_toolchain(args, config_paths, logger)
+    if toolchain is None:
+        return EXIT_TOOLCHAIN
+    if args.check_toolchain:
+        return run_check_toolchain(args, toolchain)
+    lyx_executable = toolchain.lyx_executable
+    pandoc_executable = toolchain.pandoc_executable
+
+    try:
+        rule_set = build_rule_set(config["postprocess"])
+        format_postprocessors = {
+            output_format: PostProcessor([build_rule_set(rules)])
+            for output_format, rules in config["postprocess"]["formats"].items()
+        }
+    except ValueError as e:
+        logger.error(f"Invalid post-processing rules: {e}")
+        return EXIT_USAGE
+    formats = [f.strip() for f in args.to.split(",") if f.strip()] if args.to else None
+    formats = formats or config["converter"]["output_formats"] or None
+    if formats:
+        if args.use_async or args.incremental or args.watch or args.profile:
+            logger.error("Multiple output formats cannot be combined with --async, --incremental, --watch "
+                         "or --profile; set \"output_formats\" to [] or leave out those options.")
+            return EXIT_USAGE
+        try:
+            LyxConverter.output_paths_for("document.lyx", ".", formats)
+        except ValueError as e:
+            logger.error(str(e))
+            return EXIT_USAGE
+        missing = [f for f in formats if not toolchain.supports_output_format(format_base(f))]
+        if missing:
+            logger.error(f"Pandoc {toolchain.pandoc['version']} has no writer for: {', '.join(missing)}")
+            return EXIT_TOOLCHAIN
+
+    logger.info("Starting command-line conversion...")
+
+    converter_config = config["converter"]
+    pandoc_backend = None
+    requested_backend = args.pandoc_backend or converter_config["pandoc_backend"]
+    if choose_pandoc_backend(args, requested_backend, toolchain, logger) == "server":
+        from converter.pandoc_backend import PandocServerBackend
+        pandoc_backend = PandocServerBackend(
+            pandoc_executable,
+            workers=args.pandoc_servers or converter_config["pandoc_servers"],
+            logger=logger,
+            server_command=toolchain.pandoc_server_command
         )
-        
-        markdown_file = converter.convert(lyx_file_path=lyx_file, output_directory=output_dir)
-        
-        logger.info(f"Conversion successful. Output at: {markdown_file}")
-        print(f"\nConversion successful. Output at: {markdown_file}")
 
-    except Exception as e:
-        logger.error(f"An error occurred during command-line conversion: {e}", exc_info=True)
-        print(f"\nAn error occurred: {e}")
+    metrics, stage_summary = build_metrics(args, config["metrics"])
+    deadlines, retry_policy = build_reliability(config["reliability"], converter_config["stage_timeouts"],
+                                                timeout=args.timeout, retries=args.retries)
+    asset_config = config["assets"]
+    asset_directory = None
+    if not args.no_assets and (args.asset_dir or asset_config["enabled"]):
+        asset_directory = args.asset_dir or asset_config["directory"]
+    converter = LyxConverter(
+        lyx_executable=lyx_executable,
+        pandoc_executable=pandoc_executable,
+        logger=logger,
+        cache=cache,
+        postprocessor=PostProcessor([rule_set]),
+        export_backend=args.export_backend or converter_config["export_backend"],
+        pandoc_backend=pandoc_backend,
+        metrics=metrics,
+        scratch_directory=args.scratch_dir or converter_config["scratch_directory"] or None,
+        asset_directory=asset_directory,
+        hardlink_assets=asset_config["hardlinks"],
+        format_postprocessors=format_postprocessors,
+        toolchain=toolchain,
+        deadlines=deadlines,
+        retry_policy=retry_policy,
+        quarantine=quarantine
+    )
+    document_converter = converter
+    if args.incremental:
+        from converter.incremental import IncrementalConverter
+        document_converter = IncrementalConverter(converter, cache=cache, logger=logger)
+    batch = BatchConverter(document_converter, max_workers=args.workers, use_processes=args.processes,
+                           logger=logger, formats=formats)
+
+    report = build_report(args)
+    try:
+        if args.serve:
+            return run_serve(args, document_converter, formats, config["daemon"], logger)
+        if args.profile:
+            return run_profile(args, converter)
+        if args.shard_dir:
+            return run_shard_worker(args, batch, config["distributed"], logger, report)
+        try:
+            jobs = plan_jobs(args, batch)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read manifest: {e}")
+            return EXIT_USAGE
+        if not jobs:
+            logger.error("The inputs do not match any .lyx files.")
+            return EXIT_NO_INPUTS
+        if args.use_async:
+            summary = run_async(converter, batch, jobs, logger, report)
+        else:
+            summary = batch.convert_jobs(jobs, on_result=report)
+        print_summary(args, summary)
+        if stage_summary:
+            print(f"\n{stage_summary.format()}", file=sys.stderr if args.json else sys.stdout)
+        if args.rule_stats:
+            print(f"\n{rule_set.format_stats()}", file=sys.stderr if args.json else sys.stdout)
+        if args.watch:
+            return run_watch(args, document_converter, config["watch"], logger, report,
+                             [result.lyx_file_path for result in summary.succeeded])
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+    finally:
+        converter.pandoc_backend.close()
+        metrics.close()
+        if cache:
+            cache.flush()
+    return EXIT_FAILED if summary.failed else EXIT_OK
+
+
+def main(argv=None):
+    """
+    Runs the conversion from the command line.
+
+    Every input is converted as part of a batch, so one bad file never stops the others.
+    Returns the process exit code: EXIT_OK if every file converted, EXIT_FAILED if any failed,
+    and the other EXIT_ codes when nothing could be converted.
+    """
+    args = parse_args(argv)
+    args.inputs = read_stdin_inputs(args.inputs)
+    if args.native_coverage:
+        return run_native_coverage(args)
+
+    # --- Setup Logging ---
+    logger = Logger(console_level=logging.WARNING if args.quiet else logging.INFO, use_queue=True)
+    try:
+        return run(args, logger)
+    finally:
+        logger.close()
+
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks.corpus import LYX_FOOTER, LYX_HEADER
+from benchmarks.stub_toolchain import write_stub_toolchain
+from converter.assets import AssetLinks, AssetStore, find_graphics
+from converter.lyx_converter import LyxConverter
+from converter.markdown_scanner import TEXT
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256))
+
+
+def _read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def _write_document(path, graphic):
+    """Writes a document that shows graphic and links to it in its text, as Pandoc would."""
+    target = graphic.replace(" ", "%20")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(LYX_HEADER
+                + "\\begin_layout Standard\n\\begin_inset Graphics\n"
+                + f"\tfilename \"{graphic}\"\n\tscale 50\n\\end_inset\n\n\\end_layout\n"
+                + f"\\begin_layout Standard\n![איור]({target})\n\\end_layout\n"
+                + LYX_FOOTER)
+    return path
+
+
+class AssetTest(unittest.TestCase):
+    """Converts documents with graphics and checks what lands in the asset directory."""
+
+    def setUp(self):
+        self._temp = tempfile.TemporaryDirectory()
+        self.root = self._temp.name
+        self.first = _write_document(os.path.join(self.root, "in", "week1", "notes.lyx"), "img/plot.png")
+        self.second = _write_document(os.path.join(self.root, "in", "week2", "notes.lyx"), "figure one.png")
+        for path in (os.path.join(self.root, "in", "week1", "img", "plot.png"),
+                     os.path.join(self.root, "in", "week2", "figure one.png")):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(PNG)
+        self.output_directory = os.path.join(self.root, "out")
+        self.lyx, self.pandoc = write_stub_toolchain(os.path.join(self.root, "stubs"))
+
+    def tearDown(self):
+        self._temp.cleanup()
+
+    def _asset_files(self):
+        directory = os.path.join(self.output_directory, "assets")
+        return sorted(name for name in os.listdir(directory) if not name.startswith("."))
+
+    def test_graphics_are_published_once(self):
+        converter = LyxConverter(self.lyx, self.pandoc, asset_directory="assets")
+        first, second = (converter.convert(path, self.output_directory,
+                                           output_path=os.path.join(self.output_directory, f"week{index}.md"))
+                         for index, path in enumerate((self.first, self.second), 1))
+
+        self.assertEqual(len(self._asset_files()), 2)  # The image and the index.
+        name = next(name for name in self._asset_files() if name.endswith(".png"))
+        with open(os.path.join(self.output_directory, "assets", name), 'rb') as f:
+            self.assertEqual(f.read(), PNG)
+        self.assertIn(f"](assets/{name})", _read(first))
+        self.assertIn(f"](assets/{name})", _read(second))
+
+    def test_assets_are_off_by_default(self):
+        output_path = LyxConverter(self.lyx, self.pandoc).convert(self.first, self.output_directory)
+        self.assertFalse(os.path.exists(os.path.join(self.output_directory, "assets")))
+        self.assertIn("img/plot.png", _read(output_path))
+
+    def test_store_follows_its_sources(self):
+        store = AssetStore(os.path.join(self.root, "store"))
+        source = os.path.join(self.root, "in", "week1", "img", "plot.png")
+        asset_path = store.publish([source])[source]
+        os.remove(asset_path)
+        self.assertEqual(store.publish([source]), {source: asset_path})
+        self.assertTrue(os.path.exists(asset_path))
+
+        with open(source, 'ab') as f:
+            f.write(b"edited")
+        self.assertNotEqual(store.publish([source])[source], asset_path)
+
+    def test_links_are_matched_in_any_form(self):
+        lyx_text = _read(self.first) + "\\begin_inset External\n\tfilename table.pdf\n\\end_inset\n"
+        self.assertEqual(find_graphics(lyx_text), ["img/plot.png", "table.pdf"])
+        links = AssetLinks({"img/plot.png": "assets/a1.png"}, "/data/week1")
+        for target in ("img/plot.png", "img/plot", "/data/week1/img/plot.png", "plot.png", "img%2Fplot.png"):
+            self.assertEqual(links.link_for(target), "assets/a1.png", target)
+        self.assertIsNone(links.link_for("other.png"))
+        self.assertEqual(links.transform("see ])img/plot.png( and $](x)$", TEXT),
+                         "see ](assets/a1.png) and $](x)$")
+
+
+if __name__ == "__main__":
+    unittest.main()
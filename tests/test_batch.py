@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks.corpus import write_corpus
+from benchmarks.stub_toolchain import write_stub_toolchain
+from converter.batch import BatchConverter
+from converter.lyx_converter import LyxConverter
+
+
+def _read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+class BatchConverterTest(unittest.TestCase):
+    """Converts directory trees with BatchConverter and checks every file is accounted for."""
+
+    def setUp(self):
+        self._temp = tempfile.TemporaryDirectory()
+        self.root = self._temp.name
+        self.source = os.path.join(self.root, "in")
+        self.inputs = (write_corpus(os.path.join(self.source, "week1"), 2, 2000, seed=1)
+                       + write_corpus(os.path.join(self.source, "week2", "extra"), 2, 2000, seed=2))
+        self.output_directory = os.path.join(self.root, "out")
+        lyx, pandoc = write_stub_toolchain(os.path.join(self.root, "stubs"))
+        self.converter = LyxConverter(lyx, pandoc)
+
+    def tearDown(self):
+        self._temp.cleanup()
+
+    def _expected_output(self, lyx_file_path):
+        relative = os.path.relpath(os.path.splitext(lyx_file_path)[0] + ".md", self.source)
+        return os.path.join(self.output_directory, relative)
+
+    def test_mirrors_the_directory_tree(self):
+        summary = BatchConverter(self.converter, max_workers=3).convert([self.source], self.output_directory)
+        self.assertEqual(summary.failed, [])
+        self.assertEqual(sorted(result.lyx_file_path for result in summary.results), sorted(self.inputs))
+        for result in summary.results:
+            self.assertEqual(result.output_path, self._expected_output(result.lyx_file_path))
+
+        single = self.converter.convert(self.inputs[0], os.path.join(self.root, "single"))
+        self.assertEqual(_read(self._expected_output(self.inputs[0])), _read(single))
+
+    def test_failed_file_does_not_stop_the_batch(self):
+        broken = os.path.join(self.source, "week1", "broken.lyx")
+        with open(broken, 'w', encoding='utf-8') as f:
+            f.write("not a LyX document\n")
+        reported = []
+        summary = BatchConverter(self.converter, max_workers=2).convert([self.source], self.output_directory,
+                                                                       on_result=reported.append)
+        self.assertEqual([result.lyx_file_path for result in summary.failed], [broken])
+        self.assertEqual(len(summary.succeeded), len(self.inputs))
+        self.assertEqual(len(reported), len(self.inputs) + 1)
+
+    def test_overlapping_sources_are_converted_once(self):
+        batch = BatchConverter(self.converter)
+        jobs = batch.plan([self.source, self.inputs[0], os.path.join(self.source, "week1", "*.lyx")],
+                          self.output_directory)
+        self.assertEqual(sorted(job[0] for job in jobs), sorted(self.inputs))
+
+    def test_process_pool_matches_thread_pool(self):
+        summary = BatchConverter(self.converter, max_workers=2, use_processes=True).convert(
+            [self.source], os.path.join(self.root, "processes"))
+        self.assertEqual(summary.failed, [])
+        threads = BatchConverter(self.converter, max_workers=2).convert([self.source], self.output_directory)
+        outputs = {result.lyx_file_path: _read(result.output_path) for result in threads.results}
+        for result in summary.results:
+            self.assertEqual(_read(result.output_path), outputs[result.lyx_file_path])
+
+
+if __name__ == "__main__":
+    unittest.main()
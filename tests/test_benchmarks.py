@@ -0,0 +1,63 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from benchmarks import bench_pipeline
+from benchmarks.corpus import make_lyx, make_markdown, write_corpus
+
+ARGS = ["--documents", "2", "--size", "2000", "--repeat", "1"]
+
+
+def _read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+class BenchmarkTest(unittest.TestCase):
+    """Checks that benchmark runs are reproducible and that slow stages are reported."""
+
+    def setUp(self):
+        self._temp = tempfile.TemporaryDirectory()
+        self.root = self._temp.name
+        self.baseline = os.path.join(self.root, "baseline.json")
+
+    def tearDown(self):
+        self._temp.cleanup()
+
+    def _main(self, *args):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            status = bench_pipeline.main(ARGS + ["--baseline", self.baseline] + list(args))
+        return status, output.getvalue()
+
+    def test_corpus_is_determined_by_the_seed(self):
+        self.assertEqual(make_markdown(5000, seed=3), make_markdown(5000, seed=3))
+        self.assertNotEqual(make_markdown(5000, seed=3), make_markdown(5000, seed=4))
+        first = write_corpus(os.path.join(self.root, "a"), 2, 2000, seed=5)
+        second = write_corpus(os.path.join(self.root, "b"), 2, 2000, seed=5)
+        self.assertEqual([_read(path) for path in first], [_read(path) for path in second])
+        self.assertEqual(_read(first[1]), make_lyx(2000, seed=6))
+
+    def test_saved_baseline_records_every_stage(self):
+        status, _ = self._main("--save-baseline")
+        self.assertEqual(status, 0)
+        with open(self.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        self.assertEqual(baseline["parameters"]["documents"], 2)
+        self.assertEqual(set(baseline["stages"]), set(bench_pipeline.STAGES))
+
+    def test_slower_stage_is_a_regression(self):
+        stages = {stage: {"min": 1e-9, "median": 1e-9} for stage in bench_pipeline.STAGES}
+        with open(self.baseline, 'w', encoding='utf-8') as f:
+            json.dump({"parameters": {}, "stages": stages}, f)
+        status, output = self._main()
+        self.assertEqual(status, 1)
+        self.assertIn("Regression in: export", output)
+        self.assertIn("different parameters", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
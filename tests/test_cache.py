@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks.corpus import write_corpus
+from benchmarks.stub_toolchain import write_stub_toolchain
+from converter.cache import ConversionCache
+from converter.lyx_converter import LyxConverter
+from converter.metrics import MetricsHook, MetricsRecorder
+
+
+def _read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+class _Conversions(MetricsHook):
+    def __init__(self):
+        self.conversions = []
+
+    def on_conversion(self, conversion):
+        self.conversions.append(conversion)
+
+    def stages(self):
+        """Returns the stages of the last conversion by name."""
+        return {stage.stage: stage for stage in self.conversions[-1].stages}
+
+
+class ConversionCacheTest(unittest.TestCase):
+    """Checks when a conversion is restored from the cache and when LyX and Pandoc run again."""
+
+    def setUp(self):
+        self._temp = tempfile.TemporaryDirectory()
+        self.root = self._temp.name
+        self.lyx_file_path = write_corpus(os.path.join(self.root, "in"), 1, 2000)[0]
+        self.output_directory = os.path.join(self.root, "out")
+        self.stubs = os.path.join(self.root, "stubs")
+        self.lyx, self.pandoc = write_stub_toolchain(self.stubs)
+        self.cache = ConversionCache(os.path.join(self.root, "cache"))
+        self.hook = _Conversions()
+        self.converter = self._converter()
+
+    def tearDown(self):
+        self._temp.cleanup()
+
+    def _converter(self):
+        return LyxConverter(self.lyx, self.pandoc, cache=self.cache, metrics=MetricsRecorder([self.hook]))
+
+    def _convert(self):
+        """Converts the document and returns its Markdown and whether it came from the cache."""
+        output_path = self.converter.convert(self.lyx_file_path, self.output_directory)
+        stages = self.hook.stages()
+        hit = stages["cache"].detail == "hit"
+        self.assertEqual("export" not in stages, hit)
+        return _read(output_path), hit
+
+    def test_unchanged_document_is_restored(self):
+        markdown, hit = self._convert()
+        self.assertFalse(hit)
+        os.remove(os.path.join(self.output_directory, "document_000.md"))
+        self.assertEqual(self._convert(), (markdown, True))
+
+        self.cache.flush()
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 1, 1))
+
+    def test_edited_document_is_converted_again(self):
+        self._convert()
+        with open(self.lyx_file_path, 'a', encoding='utf-8') as f:
+            f.write("\n")
+        self.assertFalse(self._convert()[1])
+        self.assertTrue(self._convert()[1])
+
+    def test_replaced_toolchain_is_converted_again(self):
+        self._convert()
+        self.lyx, self.pandoc = write_stub_toolchain(self.stubs, pandoc_latency=0.01)
+        self.converter = self._converter()
+        self.assertFalse(self._convert()[1])
+
+    def test_invalidate_forgets_a_source(self):
+        self._convert()
+        self.assertEqual(self.cache.invalidate([self.lyx_file_path]), 1)
+        self.assertFalse(self._convert()[1])
+        self.assertEqual(self.cache.invalidate(), 1)
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ConversionCache(os.path.join(self.root, "small"), max_bytes=2500)
+        keys = [cache.make_text_key(str(index), {}, {}) for index in range(3)]
+        for age, key in enumerate(keys[:2]):
+            cache.put_text(key, "x" * 1000)
+            os.utime(cache._entry_path(key), (1000 + age, 1000 + age))
+        self.assertIsNotNone(cache.get_text(keys[0]))
+        cache.put_text(keys[2], "x" * 1000)
+
+        self.assertIsNone(cache.get_text(keys[1]))
+        self.assertIsNotNone(cache.get_text(keys[0]))
+        self.assertIsNotNone(cache.get_text(keys[2]))
+        self.assertLessEqual(cache.stats()["size_bytes"], 2500)
+        self.assertEqual([name for name in os.listdir(cache.cache_dir) if name.endswith(".tmp")], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import http.client
+import json
+import os
+import queue
+import stat
+import tempfile
+import threading
+import unittest
+
+from benchmarks.corpus import write_corpus
+from benchmarks.stub_toolchain import write_stub_toolchain
+from converter.daemon import (CANCELLED, DONE, QUEUED, ConversionDaemon, DaemonClient, create_server, load_token,
+                              serve)
+from converter.lyx_converter import LyxConverter
+
+
+def _read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+class DaemonTest(unittest.TestCase):
+    """Runs the daemon's job API on localhost and on a Unix socket and checks who it serves."""
+
+    def setUp(self):
+        temp = tempfile.TemporaryDirectory()
+        # Cleanups run last first, so servers started by a test stop before their directory goes.
+        self.addCleanup(temp.cleanup)
+        self.root = temp.name
+        self.lyx_file_path = write_corpus(os.path.join(self.root, "in"), 1, 2000)[0]
+        self.output_directory = os.path.join(self.root, "out")
+        lyx, pandoc = write_stub_toolchain(os.path.join(self.root, "stubs"))
+        self.converter = LyxConverter(lyx, pandoc)
+        self.token = load_token(os.path.join(self.root, "daemon", "daemon.token"), create=True)
+
+    def _serve(self, address, token=None):
+        """Serves a new daemon in the background until the test ends. Returns its address."""
+        ready = queue.Queue()
+        thread = threading.Thread(target=serve, args=(ConversionDaemon(self.converter, 2), address),
+                                  kwargs={"on_ready": ready.put, "token": token}, daemon=True)
+        thread.start()
+        served = ready.get(timeout=10)
+
+        def stop():
+            DaemonClient(served, token=token).shutdown()
+            thread.join(10)
+        self.addCleanup(stop)
+        return served
+
+    def _raw(self, address, method, path, headers, body=None):
+        connection = http.client.HTTPConnection(address[1], address[2], timeout=10)
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            return response.status, json.loads(response.read().decode("utf-8"))
+        finally:
+            connection.close()
+
+    def test_token_file_is_private_and_stable(self):
+        token_file = os.path.join(self.root, "daemon", "daemon.token")
+        self.assertEqual(stat.S_IMODE(os.stat(token_file).st_mode), 0o600)
+        self.assertEqual(load_token(token_file, create=True), self.token)
+        self.assertEqual(load_token(token_file), self.token)
+        empty = os.path.join(self.root, "empty.token")
+        open(empty, 'w').close()
+        with self.assertRaises(ValueError):
+            load_token(empty)
+        with self.assertRaises(ValueError):
+            create_server(ConversionDaemon(self.converter), ("tcp", "127.0.0.1", 0))
+
+    def test_requests_without_the_token_are_rejected(self):
+        address = self._serve(("tcp", "127.0.0.1", 0), self.token)
+        for token in (None, "wrong", self.token + "x"):
+            with self.subTest(token=token), self.assertRaises(ConnectionError):
+                DaemonClient(address, token=token).submit(self.lyx_file_path, self.output_directory)
+        host = f"127.0.0.1:{address[2]}"
+        for headers in ({"Host": host}, {"Host": host, "Authorization": "Bearer wrong"},
+                        {"Host": host, "Authorization": self.token}):
+            self.assertEqual(self._raw(address, "GET", "/status", headers)[0], 401)
+        self.assertEqual(DaemonClient(address, token=self.token).jobs(), [])
+        self.assertFalse(os.path.exists(self.output_directory))
+
+    def test_foreign_hosts_and_non_json_posts_are_rejected(self):
+        address = self._serve(("tcp", "127.0.0.1", 0), self.token)
+        authorization = f"Bearer {self.token}"
+        status, reply = self._raw(address, "GET", "/status",
+                                  {"Host": f"attacker.example:{address[2]}", "Authorization": authorization})
+        self.assertEqual(status, 403)
+        self.assertIn("attacker.example", reply["error"])
+        body = json.dumps({"input": self.lyx_file_path})
+        status, _ = self._raw(address, "POST", "/jobs", {"Host": f"localhost:{address[2]}",
+                                                         "Authorization": authorization,
+                                                         "Content-Type": "text/plain"}, body)
+        self.assertEqual(status, 415)
+
+    def test_authorized_job_is_converted(self):
+        address = self._serve(("tcp", "127.0.0.1", 0), self.token)
+        client = DaemonClient(address, token=self.token)
+        job = client.submit(self.lyx_file_path, self.output_directory, wait=30)
+        self.assertEqual(job["status"], DONE)
+        single = self.converter.convert(self.lyx_file_path, os.path.join(self.root, "single"))
+        self.assertEqual(_read(job["output"]), _read(single))
+        self.assertEqual(client.status()["completed"], 1)
+        with self.assertRaises(ValueError):
+            client._request("POST", "/jobs", {"input": "relative.lyx"})
+
+    def test_unix_socket_is_owner_only(self):
+        socket_path = os.path.join(self.root, "run", "daemon.sock")
+        address = self._serve(("unix", socket_path))
+        self.assertEqual(stat.S_IMODE(os.stat(socket_path).st_mode), 0o600)
+        job = DaemonClient(address).submit(self.lyx_file_path, self.output_directory, wait=30)
+        self.assertEqual(job["status"], DONE)
+
+    def test_identical_queued_jobs_are_merged(self):
+        daemon = ConversionDaemon(self.converter, 1)
+        first = daemon.submit(self.lyx_file_path, self.output_directory)
+        self.assertIs(daemon.submit(self.lyx_file_path, self.output_directory, priority=5), first)
+        self.assertEqual((first.status, first.priority), (QUEUED, 5))
+        other = daemon.submit(self.lyx_file_path, os.path.join(self.root, "elsewhere"))
+        self.assertTrue(daemon.cancel(other.id))
+        daemon.close()
+        self.assertEqual((first.status, other.status), (CANCELLED, CANCELLED))
+        with self.assertRaises(RuntimeError):
+            daemon.submit(self.lyx_file_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
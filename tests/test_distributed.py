@@ -0,0 +1,97 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from benchmarks.corpus import write_corpus
+from benchmarks.stub_toolchain import write_stub_toolchain
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+DOCUMENTS = 12
+SHARD_SIZE = 2
+
+
+class DistributedBatchTest(unittest.TestCase):
+    """Runs several local worker processes against one work directory, as separate hosts would."""
+
+    def setUp(self):
+        self._temp = tempfile.TemporaryDirectory()
+        self.root = self._temp.name
+        self.inputs = write_corpus(os.path.join(self.root, "in"), DOCUMENTS, 2000)
+        self.work_directory = os.path.join(self.root, "work")
+        self.output_directory = os.path.join(self.root, "out")
+        self.config_path = os.path.join(self.root, "config.json")
+        with open(self.config_path, 'w', encoding='utf-8') as f:
+            json.dump({"distributed": {"poll_seconds": 0.2}, "reliability": {"quarantine_after": 0}}, f)
+        # Workers write their logs and caches under the temporary directory, not the repository.
+        self.env = dict(os.environ, HOME=self.root)
+
+    def tearDown(self):
+        self._temp.cleanup()
+
+    def _stubs(self, lyx_latency):
+        return write_stub_toolchain(os.path.join(self.root, f"stubs-{lyx_latency}"), lyx_latency=lyx_latency)
+
+    def _start_worker(self, worker_id, stubs, *extra):
+        lyx, pandoc = stubs
+        command = [sys.executable, MAIN, "--config", self.config_path, "--lyx", lyx, "--pandoc", pandoc,
+                   "--shard-dir", self.work_directory, "--worker-id", worker_id, "-q", *extra]
+        # In a session of its own, so that a worker can be killed together with its LyX.
+        return subprocess.Popen(command, cwd=self.root, env=self.env, start_new_session=True,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def _planned_worker(self, worker_id, stubs, *extra):
+        return self._start_worker(worker_id, stubs, os.path.join(self.root, "in"), "-o", self.output_directory,
+                                  "--shard-size", str(SHARD_SIZE), *extra)
+
+    def _merge(self):
+        exit_code = subprocess.call([sys.executable, MAIN, "--config", self.config_path, "--shard-dir",
+                                     self.work_directory, "--merge", "-q"],
+                                    cwd=self.root, env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        with open(os.path.join(self.work_directory, "summary.json"), encoding='utf-8') as f:
+            return exit_code, json.load(f)
+
+    def _assert_complete(self, summary):
+        self.assertEqual(summary["missing_shards"], [])
+        self.assertEqual(summary["failed"], 0)
+        self.assertEqual(sorted(r["input"] for r in summary["results"]), sorted(self.inputs))
+        for result in summary["results"]:
+            self.assertTrue(os.path.exists(result["output"]), result["output"])
+
+    def test_workers_share_the_shards(self):
+        stubs = self._stubs(0.1)
+        workers = [self._planned_worker(f"worker-{index}", stubs) for index in range(3)]
+        for worker in workers:
+            self.assertEqual(worker.wait(timeout=120), 0)
+
+        exit_code, summary = self._merge()
+        self.assertEqual(exit_code, 0)
+        self._assert_complete(summary)
+        self.assertEqual(summary["shards"], DOCUMENTS // SHARD_SIZE)
+        self.assertEqual(os.listdir(os.path.join(self.work_directory, "leases")), [])
+
+    def test_shard_of_killed_worker_is_reclaimed(self):
+        leases = os.path.join(self.work_directory, "leases")
+        doomed = self._planned_worker("doomed", self._stubs(5), "--lease-seconds", "1")
+        deadline = time.monotonic() + 30
+        while not (os.path.isdir(leases) and os.listdir(leases)):
+            self.assertLess(time.monotonic(), deadline, "the first worker never claimed a shard")
+            time.sleep(0.05)
+        os.killpg(doomed.pid, signal.SIGKILL)
+        doomed.wait()
+
+        survivor = self._start_worker("survivor", self._stubs(0), "--lease-seconds", "1")
+        self.assertEqual(survivor.wait(timeout=120), 0)
+
+        exit_code, summary = self._merge()
+        self.assertEqual(exit_code, 0)
+        self._assert_complete(summary)
+        self.assertEqual(summary["workers"], ["survivor"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import os
+import stat
+import sys
+import tempfile
+import unittest
+
+from benchmarks.corpus import LYX_FOOTER, LYX_HEADER
+from benchmarks.stub_toolchain import write_stub_toolchain
+from converter.cache import ConversionCache
+from converter.lyx_converter import LyxConverter
+from converter.metrics import MetricsHook, MetricsRecorder
+
+# A Pandoc stand-in that records how it was called and labels its output with the format, so
+# tests can tell which input each output was rendered from.
+RECORDING_PANDOC = r'''#!{python}
+import sys
+options = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("--") and "=" in arg)
+with open({log!r}, "a", encoding="utf-8") as f:
+    f.write(options["from"] + " " + options["to"] + "\n")
+text = sys.stdin.buffer.read().decode("utf-8")
+if options["to"] == "json":
+    text = "[parsed] " + text
+sys.stdout.buffer.write(("<" + options["to"] + "> " + text).encode("utf-8"))
+'''
+DOCUMENT = LYX_HEADER + "\\begin_layout Standard\nשלום (עולם)\n\\end_layout\n" + LYX_FOOTER
+
+
+def _read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+class _Stages(MetricsHook):
+    def __init__(self):
+        self.stages = []
+
+    def on_stage(self, stage):
+        self.stages.append(stage.stage)
+
+
+class OutputFormatTest(unittest.TestCase):
+    """Renders one document to several formats and checks how often LyX and Pandoc ran."""
+
+    def setUp(self):
+        self._temp = tempfile.TemporaryDirectory()
+        self.root = self._temp.name
+        self.lyx_file_path = os.path.join(self.root, "notes.lyx")
+        with open(self.lyx_file_path, 'w', encoding='utf-8') as f:
+            f.write(DOCUMENT)
+        self.output_directory = os.path.join(self.root, "out")
+        self.lyx, _ = write_stub_toolchain(os.path.join(self.root, "stubs"))
+        self.log = os.path.join(self.root, "pandoc.log")
+        self.pandoc = os.path.join(self.root, "stubs", "recording-pandoc")
+        with open(self.pandoc, 'w', encoding='utf-8') as f:
+            f.write(RECORDING_PANDOC.format(python=sys.executable, log=self.log))
+        os.chmod(self.pandoc, os.stat(self.pandoc).st_mode | stat.S_IXUSR)
+        self.hook = _Stages()
+        self.cache = ConversionCache(os.path.join(self.root, "cache"))
+        self.converter = LyxConverter(self.lyx, self.pandoc, cache=self.cache,
+                                      metrics=MetricsRecorder([self.hook]))
+
+    def tearDown(self):
+        self._temp.cleanup()
+
+    def _pandoc_calls(self):
+        """Returns the "from to" formats of the Pandoc runs since the last call, sorted."""
+        if not os.path.exists(self.log):
+            return []
+        calls = _read(self.log).splitlines()
+        os.remove(self.log)
+        return sorted(calls)
+
+    def test_formats_are_rendered_from_one_parse(self):
+        paths = self.converter.convert(self.lyx_file_path, self.output_directory,
+                                       formats=["gfm", "commonmark", "html"])
+        self.assertEqual(paths, {
+            "gfm": os.path.join(self.output_directory, "notes.gfm.md"),
+            "commonmark": os.path.join(self.output_directory, "notes.commonmark.md"),
+            "html": os.path.join(self.output_directory, "notes.html"),
+        })
+        self.assertEqual(self.hook.stages.count("export"), 1)
+        self.assertEqual(self._pandoc_calls(), ["json commonmark", "json gfm", "json html", "latex json"])
+        # Markdown formats are post-processed; HTML is not.
+        self.assertIn(")עולם(", _read(paths["gfm"]))
+        self.assertTrue(_read(paths["gfm"]).startswith("<gfm> <json> [parsed] "))
+        self.assertIn("(עולם)", _read(paths["html"]))
+
+    def test_single_format_needs_no_parse(self):
+        paths = self.converter.convert(self.lyx_file_path, self.output_directory, formats=["gfm"])
+        self.assertEqual(paths, {"gfm": os.path.join(self.output_directory, "notes.md")})
+        self.assertEqual(self._pandoc_calls(), ["latex gfm"])
+
+    def test_only_uncached_formats_are_rendered(self):
+        self.converter.convert(self.lyx_file_path, self.output_directory, formats=["gfm", "html"])
+        self._pandoc_calls()
+        self.hook.stages.clear()
+        self.converter.convert(self.lyx_file_path, self.output_directory, formats=["gfm", "html"])
+        self.assertEqual(self._pandoc_calls(), [])
+        self.assertNotIn("export", self.hook.stages)
+
+        self.converter.convert(self.lyx_file_path, self.output_directory, formats=["gfm", "html", "rst"])
+        self.assertEqual(self._pandoc_calls(), ["latex rst"])
+
+    def test_unsupported_requests_are_rejected(self):
+        with self.assertRaises(ValueError):
+            self.converter.convert(self.lyx_file_path, self.output_directory, formats=["docx"])
+        with self.assertRaises(ValueError):
+            self.converter.convert(self.lyx_file_path, self.output_directory, formats=["gfm"],
+                                   output_path=os.path.join(self.root, "notes.md"))
+        self.assertFalse(os.path.exists(self.output_directory))
+
+
+if __name__ == "__main__":
+    unittest.main()
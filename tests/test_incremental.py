@@ -0,0 +1,93 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks.corpus import write_corpus
+from benchmarks.stub_toolchain import write_stub_toolchain
+from converter.cache import ConversionCache
+from converter.incremental import IncrementalConverter
+from converter.lyx_converter import LyxConverter
+from converter.metrics import MetricsHook, MetricsRecorder
+from converter.supervision import Quarantine
+
+DOCUMENTS = 4
+
+
+def _read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+class _Conversions(MetricsHook):
+    def __init__(self):
+        self.conversions = []
+
+    def on_conversion(self, conversion):
+        self.conversions.append(conversion)
+
+
+class IncrementalConverterTest(unittest.TestCase):
+    """Checks that incremental conversions write what a full conversion writes."""
+
+    def setUp(self):
+        self._temp = tempfile.TemporaryDirectory()
+        self.root = self._temp.name
+        self.inputs = write_corpus(os.path.join(self.root, "in"), DOCUMENTS, 20000)
+        self.lyx, self.pandoc = write_stub_toolchain(os.path.join(self.root, "stubs"))
+        self.hook = _Conversions()
+        self.converter = LyxConverter(self.lyx, self.pandoc, metrics=MetricsRecorder([self.hook]),
+                                      quarantine=Quarantine(os.path.join(self.root, "quarantine.json")))
+        self.incremental = IncrementalConverter(self.converter, cache=ConversionCache(os.path.join(self.root, "cache")))
+
+    def tearDown(self):
+        self._temp.cleanup()
+
+    def _assert_same_as_full_conversion(self, lyx_file_path, chunks=None, reused=None):
+        full = self.converter.convert(lyx_file_path, os.path.join(self.root, "full"))
+        result = self.incremental.convert_incremental(lyx_file_path, os.path.join(self.root, "incremental"))
+        self.assertIsNone(result.fallback_reason)
+        if chunks is not None:
+            self.assertEqual(result.chunks, chunks)
+        if reused is not None:
+            self.assertEqual(result.reused, reused)
+        self.assertEqual(_read(result.output_path), _read(full))
+        return result
+
+    def test_matches_full_conversion(self):
+        for lyx_file_path in self.inputs:
+            with self.subTest(lyx_file_path=os.path.basename(lyx_file_path)):
+                result = self._assert_same_as_full_conversion(lyx_file_path, reused=0)
+                self.assertGreater(result.chunks, 1)
+
+    def test_matches_full_conversion_after_an_edit(self):
+        lyx_file_path = self.inputs[0]
+        chunks = self._assert_same_as_full_conversion(lyx_file_path).chunks
+
+        text = _read(lyx_file_path)
+        marker = "\\begin_layout Section\n"
+        last_section = text.rindex(marker) + len(marker)
+        with open(lyx_file_path, 'w', encoding='utf-8') as f:
+            f.write(text[:last_section] + "(נערך) " + text[last_section:])
+        self._assert_same_as_full_conversion(lyx_file_path, chunks=chunks, reused=chunks - 1)
+
+    def test_recorded_like_full_conversion(self):
+        lyx_file_path = self.inputs[0]
+        self.incremental.convert(lyx_file_path, os.path.join(self.root, "incremental"))
+        conversion = self.hook.conversions[-1]
+        self.assertEqual(conversion.lyx_file_path, lyx_file_path)
+        stages = {stage.stage for stage in conversion.stages}
+        self.assertTrue({"cache", "export", "pandoc", "postprocess"} <= stages, stages)
+
+        quarantine = Quarantine(os.path.join(self.root, "quarantine.json"), threshold=1)
+        self.converter.quarantine = quarantine
+        self.converter.lyx_executable = os.path.join(self.root, "missing-lyx")
+        edited = self.inputs[1]
+        with open(edited, 'a', encoding='utf-8') as f:
+            f.write("\n")
+        with self.assertRaises(RuntimeError):
+            self.incremental.convert(edited, os.path.join(self.root, "incremental"))
+        self.assertIn(os.path.abspath(edited), {os.path.abspath(path) for path in quarantine.entries()})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import logging
+import os
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+from logging_utils.logger import Logger, _backends
+
+
+def _read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def _log_from_worker(name, index):
+    logging.getLogger(name).info("worker %d", index)
+    return os.getpid()
+
+
+class _Formatted:
+    """An argument that counts how often it is turned into text."""
+    def __init__(self):
+        self.count = 0
+
+    def __str__(self):
+        self.count += 1
+        return "formatted"
+
+
+class LoggerTest(unittest.TestCase):
+    """Checks that queued records reach logs/<file> and that disabled messages cost no formatting."""
+
+    def setUp(self):
+        self._temp = tempfile.TemporaryDirectory()
+        self._cwd = os.getcwd()
+        os.chdir(self._temp.name)
+        self.name = f"test-{self.id()}"
+        self.log_path = os.path.join(self._temp.name, "logs", "test.log")
+
+    def tearDown(self):
+        backend = _backends.pop(self.name)
+        backend.close(logging.getLogger(self.name))
+        for handler in backend.handlers:
+            handler.close()
+        os.chdir(self._cwd)
+        self._temp.cleanup()
+
+    def _logger(self, **kwargs):
+        return Logger(self.name, log_file="test.log", console_level=logging.CRITICAL, **kwargs)
+
+    def test_queued_records_are_written_by_close(self):
+        logger = self._logger(use_queue=True)
+        for index in range(100):
+            logger.info("record %d of %s", index, "100")
+        logger.close()
+        lines = _read(self.log_path).splitlines()
+        self.assertEqual(len(lines), 100)
+        self.assertTrue(lines[-1].endswith(" - INFO - record 99 of 100"))
+
+        logger.warning("after close")
+        self.assertIn("WARNING - after close", _read(self.log_path))
+
+    def test_instantiating_again_keeps_one_set_of_handlers(self):
+        self._logger()
+        handlers = list(logging.getLogger(self.name).handlers)
+        self._logger().info("once")
+        self.assertEqual(logging.getLogger(self.name).handlers, handlers)
+        self.assertEqual(_read(self.log_path).count("once"), 1)
+
+    def test_disabled_levels_are_not_formatted(self):
+        logger = self._logger(use_queue=True)
+        self.assertFalse(logger.is_enabled_for("debug"))
+        self.assertTrue(logger.is_enabled_for(logging.WARNING))
+        argument = _Formatted()
+        logger.debug("value %s", argument)
+        self.assertEqual(argument.count, 0)
+        logger.info("value %s", argument)
+        logger.close()
+        self.assertEqual(_read(self.log_path).count("value formatted"), 1)
+
+    def test_worker_processes_log_through_the_parent(self):
+        logger = self._logger(use_queue=True)
+        initializer, initargs = logger.process_initializer()
+        with ProcessPoolExecutor(2, initializer=initializer, initargs=initargs) as pool:
+            pids = set(pool.map(_log_from_worker, [self.name] * 4, range(4)))
+        logger.close()
+        self.assertNotIn(os.getpid(), pids)
+        content = _read(self.log_path)
+        for index in range(4):
+            self.assertIn(f"INFO - worker {index}", content)
+
+    def test_plain_logger_has_no_process_initializer(self):
+        self.assertEqual(self._logger().process_initializer(), (None, ()))
+
+
+if __name__ == "__main__":
+    unittest.main()
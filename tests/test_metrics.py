@@ -0,0 +1,83 @@
+import json
+import os
+import pickle
+import tempfile
+import unittest
+
+from benchmarks.corpus import write_corpus
+from benchmarks.stub_toolchain import write_stub_toolchain
+from converter.lyx_converter import LyxConverter
+from converter.metrics import JsonLinesExporter, MetricsRecorder, PrometheusTextfileExporter
+
+
+def _read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+class MetricsExporterTest(unittest.TestCase):
+    """Converts a few documents with exporters attached and checks what they write."""
+
+    def setUp(self):
+        self._temp = tempfile.TemporaryDirectory()
+        self.root = self._temp.name
+        self.inputs = write_corpus(os.path.join(self.root, "in"), 2, 2000)
+        self.broken = os.path.join(self.root, "in", "broken.lyx")
+        with open(self.broken, 'w', encoding='utf-8') as f:
+            f.write("not a LyX document\n")
+        self.lyx, self.pandoc = write_stub_toolchain(os.path.join(self.root, "stubs"))
+
+    def tearDown(self):
+        self._temp.cleanup()
+
+    def _convert_all(self, hook):
+        metrics = MetricsRecorder([hook])
+        converter = LyxConverter(self.lyx, self.pandoc, metrics=metrics)
+        for lyx_file_path in self.inputs:
+            converter.convert(lyx_file_path, os.path.join(self.root, "out"))
+        with self.assertRaises(RuntimeError):
+            converter.convert(self.broken, os.path.join(self.root, "out"))
+        metrics.close()
+
+    def test_json_lines_has_one_line_per_conversion(self):
+        path = os.path.join(self.root, "metrics", "conversions.jsonl")
+        self._convert_all(JsonLinesExporter(path))
+
+        records = [json.loads(line) for line in _read(path).splitlines()]
+        self.assertEqual([record["file"] for record in records], self.inputs + [self.broken])
+        self.assertEqual([record["succeeded"] for record in records], [True, True, False])
+        stages = {stage["stage"]: stage for stage in records[0]["stages"]}
+        self.assertEqual(stages["export"]["exit_status"], 0)
+        self.assertEqual(stages["pandoc"]["detail"], "subprocess")
+        self.assertGreater(stages["postprocess"]["bytes_out"], 0)
+        self.assertIsNotNone(records[2]["stages"][-1]["error"])
+
+    def test_prometheus_textfile_aggregates_stages(self):
+        path = os.path.join(self.root, "metrics", "lyxtomarkdown.prom")
+        self._convert_all(PrometheusTextfileExporter(path, flush_interval=3600))
+
+        lines = _read(path).splitlines()
+        self.assertIn('lyxtomarkdown_conversions_total{status="succeeded"} 2', lines)
+        self.assertIn('lyxtomarkdown_conversions_total{status="failed"} 1', lines)
+        self.assertIn('lyxtomarkdown_stage_duration_seconds_count{stage="export"} 3', lines)
+        self.assertIn('lyxtomarkdown_stage_duration_seconds_bucket{stage="export",le="+Inf"} 3', lines)
+        self.assertIn('lyxtomarkdown_stage_failures_total{stage="export"} 1', lines)
+        self.assertEqual([name for name in os.listdir(os.path.dirname(path))], ["lyxtomarkdown.prom"])
+
+    def test_only_per_file_exporters_cross_processes(self):
+        exporter = pickle.loads(pickle.dumps(MetricsRecorder([JsonLinesExporter("metrics.jsonl")]))).hooks[0]
+        self.assertEqual(exporter.path, "metrics.jsonl")
+        with self.assertRaises(TypeError):
+            pickle.dumps(PrometheusTextfileExporter("metrics.prom"))
+
+    def test_recorder_without_hooks_measures_nothing(self):
+        metrics = MetricsRecorder()
+        with metrics.conversion(self.inputs[0]) as conversion:
+            with metrics.stage("export", self.inputs[0]) as stage:
+                pass
+        self.assertIsNone(conversion)
+        self.assertEqual(stage.wall_time, 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
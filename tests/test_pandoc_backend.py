@@ -0,0 +1,69 @@
+import os
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from benchmarks.corpus import write_corpus
+from benchmarks.stub_toolchain import write_stub_toolchain
+from converter.lyx_converter import LyxConverter
+from converter.pandoc_backend import SubprocessPandocBackend
+
+OPTIONS = {"from": "latex", "to": "markdown"}
+LATEX = "\\begin{document}\n\\section{מבוא}\n\nשלום $x^2$\n\\end{document}\n"
+
+
+def _write_script(path, body):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"#!{sys.executable}\n{body}")
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+    return path
+
+
+class SubprocessPandocBackendTest(unittest.TestCase):
+    """Checks that Pandoc gets its input on stdin and that nothing is left on disk."""
+
+    def setUp(self):
+        self._temp = tempfile.TemporaryDirectory()
+        self.root = self._temp.name
+        self.lyx, self.pandoc = write_stub_toolchain(os.path.join(self.root, "stubs"))
+
+    def tearDown(self):
+        self._temp.cleanup()
+
+    def test_pipes_text_through_stdin_and_stdout(self):
+        markdown = SubprocessPandocBackend(self.pandoc).convert(LATEX, OPTIONS)
+        self.assertEqual(markdown, "# מבוא\n\nשלום $x^2$\n")
+
+    def test_failure_raises_with_stderr(self):
+        pandoc = _write_script(os.path.join(self.root, "failing-pandoc"),
+                               "import sys\nsys.stderr.write('Error at line 1')\nsys.exit(64)\n")
+        with self.assertRaises(subprocess.CalledProcessError) as raised:
+            SubprocessPandocBackend(pandoc).convert(LATEX, OPTIONS)
+        self.assertEqual(raised.exception.returncode, 64)
+        self.assertIn(b"Error at line 1", raised.exception.stderr)
+
+    def test_timeout_kills_pandoc(self):
+        _, pandoc = write_stub_toolchain(os.path.join(self.root, "slow"), pandoc_latency=30)
+        start = time.monotonic()
+        with self.assertRaises(subprocess.TimeoutExpired):
+            SubprocessPandocBackend(pandoc).convert(LATEX, OPTIONS, timeout=0.5)
+        self.assertLess(time.monotonic() - start, 10)
+
+    def test_conversion_leaves_no_intermediate_files(self):
+        source = os.path.join(self.root, "in")
+        lyx_file_path = write_corpus(source, 1, 2000)[0]
+        scratch = os.path.join(self.root, "scratch")
+        os.makedirs(scratch)
+        converter = LyxConverter(self.lyx, self.pandoc, scratch_directory=scratch)
+        output_path = converter.convert(lyx_file_path, os.path.join(self.root, "out"))
+
+        self.assertEqual(os.listdir(source), [os.path.basename(lyx_file_path)])
+        self.assertEqual(os.listdir(os.path.dirname(output_path)), [os.path.basename(output_path)])
+        self.assertEqual(os.listdir(scratch), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import pickle
+import unittest
+
+from converter.markdown_scanner import MATH, TEXT
+from converter.rules import Rule, RuleSet, build_postprocessor, build_rule_set
+
+DOCUMENT = ("Ł a -> (b) $f(x) -> \\cdot Ł$\n\n"
+            "```\nx -> (y) Ł\n```\n\n"
+            "$$g(t) -> 1$$ (end)\n")
+
+
+def _rules(*definitions, enabled=()):
+    return {"enabled": list(enabled), "rules": list(definitions)}
+
+
+class RuleEngineTest(unittest.TestCase):
+    """Runs rule sets built from configuration entries over Markdown with text, math and code."""
+
+    def test_rules_apply_only_in_their_regions(self):
+        processor = build_postprocessor(_rules(
+            {"name": "arrow", "find": "->", "replace": "→"},
+            {"name": "times", "find": "\\cdot", "replace": "\\times", "regions": ["math"]},
+            {"name": "code_arrow", "type": "regex", "find": r"-+>", "replace": "=>", "regions": ["code"]},
+            enabled=["remove_stray_character", "flip_parentheses"],
+        ))
+        self.assertEqual(processor.process(DOCUMENT),
+                         " a → )b( $f(x) -> \\times $\n\n"
+                         "```\nx => (y) \n```\n\n"
+                         "$$g(t) -> 1$$ )end(\n")
+
+    def test_chunk_boundaries_do_not_change_the_result(self):
+        processor = build_postprocessor(_rules(
+            {"name": "arrow", "find": "->", "replace": "→"},
+            {"name": "times", "find": "\\cdot", "replace": "\\times", "regions": ["math"]},
+            enabled=["remove_stray_character", "flip_parentheses"],
+        ))
+        chunks = [DOCUMENT[i:i + 3] for i in range(0, len(DOCUMENT), 3)]
+        self.assertEqual("".join(processor.process_chunks(chunks)), processor.process(DOCUMENT))
+
+    def test_longest_literal_wins(self):
+        rules = build_rule_set(_rules({"name": "en", "find": "--", "replace": "–"},
+                                      {"name": "em", "find": "---", "replace": "—"}))
+        self.assertEqual(rules.transform("a---b--c", TEXT), "a—b–c")
+
+    def test_replacements_are_not_matched_again(self):
+        rules = build_rule_set(_rules({"name": "swap", "find": "ab", "replace": "ba"},
+                                      {"name": "mark", "find": "ba", "replace": "X"}))
+        self.assertEqual(rules.transform("abba", TEXT), "baX")
+
+    def test_backreferences_match_the_original_text(self):
+        rules = build_rule_set(_rules(
+            {"name": "upper", "find": "ab", "replace": "AB"},
+            {"name": "repeated_word", "type": "regex", "find": r"\b(\w+) \1\b", "replace": r"\1"},
+            {"name": "hyphenated_twice", "type": "regex", "find": r"(?P<w>\w+)-(?P=w)", "replace": r"\g<w>"},
+            {"name": "digits", "type": "regex", "find": r"\d+", "replace": "#"},
+        ))
+        self.assertEqual(rules.transform("go go 12 so-so ab ab", TEXT), "go # so AB AB")
+        self.assertEqual(rules.transform("go go 12 so-so ab ab", MATH), "go go 12 so-so ab ab")
+        hits = {name: rule["hits"] for name, rule in rules.stats()["rules"].items()}
+        self.assertEqual(hits, {"upper": 2, "repeated_word": 1, "hyphenated_twice": 1, "digits": 1})
+
+    def test_single_characters_share_the_translation_table(self):
+        rules = build_rule_set(_rules({"name": "nbsp", "find": "\u00a0", "replace": " "},
+                                      {"name": "quotes", "type": "translate", "find": "״׳", "replace": "\"'"},
+                                      enabled=["flip_parentheses"]))
+        self.assertEqual(rules.transform("(א״ב)\u00a0ג׳", TEXT), ")א\"ב( ג'")
+        self.assertEqual(rules.stats()["rules"]["flip_parentheses"]["hits"], 2)
+        restored = pickle.loads(pickle.dumps(rules))
+        self.assertEqual(restored.transform("(א״ב)", TEXT), ")א\"ב(")
+
+    def test_invalid_rules_are_rejected(self):
+        for definition in ({"name": "empty", "type": "regex", "find": "x*"},
+                           {"name": "broken", "type": "regex", "find": "("},
+                           {"name": "region", "find": "x", "regions": ["tables"]},
+                           {"name": "lengths", "type": "translate", "find": "ab", "replace": "c"},
+                           {"name": "missing"}):
+            with self.subTest(definition["name"]), self.assertRaises(ValueError):
+                build_rule_set(_rules(definition))
+        with self.assertRaises(ValueError):
+            build_rule_set({"enabled": ["no_such_rule"]})
+        with self.assertRaises(ValueError):
+            build_rule_set(_rules({"name": "twice", "find": "a"}, {"name": "twice", "find": "b"}))
+
+    def test_function_replacements(self):
+        rule = Rule("double", r"\d+", lambda match: str(int(match.group()) * 2), kind="regex")
+        self.assertEqual(RuleSet([rule]).transform("1 and 21", TEXT), "2 and 42")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import json
+import os
+import stat
+import sys
+import tempfile
+import unittest
+
+from benchmarks.stub_toolchain import write_stub_toolchain
+from converter.toolchain import Toolchain, probe_executable, resolve_executable
+
+# A Pandoc stand-in that answers the probe's questions and records every time it is run.
+PROBED_PANDOC = r'''#!{python}
+import sys
+with open({calls!r}, "a", encoding="utf-8") as f:
+    f.write(" ".join(sys.argv[1:]) + "\n")
+if "--version" in sys.argv:
+    print("pandoc {version}\nFeatures: +server +lua\nScripting engine: Lua 5.4")
+elif "--list-output-formats" in sys.argv:
+    print("commonmark\ngfm\nhtml")
+'''
+
+
+class ToolchainTest(unittest.TestCase):
+    """Probes stub executables and checks when the probe cache is used and when they run again."""
+
+    def setUp(self):
+        self._temp = tempfile.TemporaryDirectory()
+        self.root = self._temp.name
+        # The LyX stub prints no version, like a LyX that cannot start without a display.
+        self.lyx, _ = write_stub_toolchain(os.path.join(self.root, "stubs"))
+        self.calls = os.path.join(self.root, "calls.log")
+        self.pandoc = os.path.join(self.root, "stubs", "probed-pandoc")
+        self._write_pandoc("3.1.2")
+        self.cache_path = os.path.join(self.root, "cache", "toolchain.json")
+
+    def tearDown(self):
+        self._temp.cleanup()
+
+    def _write_pandoc(self, version):
+        with open(self.pandoc, 'w', encoding='utf-8') as f:
+            f.write(PROBED_PANDOC.format(python=sys.executable, calls=self.calls, version=version))
+        os.chmod(self.pandoc, os.stat(self.pandoc).st_mode | stat.S_IXUSR)
+
+    def _calls(self):
+        """Returns the Pandoc runs since the last call."""
+        if not os.path.exists(self.calls):
+            return []
+        with open(self.calls, encoding='utf-8') as f:
+            calls = f.read().splitlines()
+        os.remove(self.calls)
+        return calls
+
+    def test_probe_reports_version_and_features(self):
+        toolchain = Toolchain(self.lyx, self.pandoc, self.cache_path)
+        self.assertEqual(toolchain.versions(), {"lyx": None, "pandoc": "3.1.2"})
+        self.assertEqual(toolchain.pandoc["features"], ["server", "lua"])
+        self.assertEqual(toolchain.pandoc_server_command, [self.pandoc, "server"])
+        self.assertTrue(toolchain.supports_output_format("gfm"))
+        self.assertFalse(toolchain.supports_output_format("docx"))
+        self.assertIn("Pandoc 3.1.2", toolchain.describe())
+        self.assertIn("LyX (unknown version)", toolchain.describe())
+
+    def test_probe_is_cached_across_runs(self):
+        first = Toolchain(self.lyx, self.pandoc, self.cache_path)
+        self.assertEqual(sorted(self._calls()), ["--list-output-formats", "--version"])
+        second = Toolchain(self.lyx, self.pandoc, self.cache_path)
+        self.assertEqual(self._calls(), [])
+        self.assertEqual(second.identity(), first.identity())
+        self.assertEqual(self._calls(), [])
+
+    def test_replaced_executable_is_probed_again(self):
+        toolchain = Toolchain(self.lyx, self.pandoc, self.cache_path)
+        identity = toolchain.identity()
+        self._calls()
+        self._write_pandoc("3.6")
+        self.assertNotEqual(toolchain.identity(), identity)
+        self.assertEqual(toolchain.versions()["pandoc"], "3.6")
+        self.assertIn("--version", self._calls())
+        self.assertEqual(Toolchain(self.lyx, self.pandoc, self.cache_path).versions()["pandoc"], "3.6")
+        self.assertEqual(self._calls(), [])
+
+    def test_probe_without_a_version_is_not_stored(self):
+        probe = probe_executable("lyx", self.lyx, self.cache_path)
+        self.assertIsNone(probe["version"])
+        self.assertFalse(os.path.exists(self.cache_path))
+
+        probe_executable("pandoc", self.pandoc, self.cache_path)
+        with open(self.cache_path, encoding='utf-8') as f:
+            stored = json.load(f)
+        self.assertEqual([entry["kind"] for entry in stored.values()], ["pandoc"])
+
+    def test_configured_path_is_resolved(self):
+        self.assertEqual(resolve_executable("pandoc", self.pandoc), self.pandoc)
+        self.assertIsNone(resolve_executable("pandoc", os.path.join(self.root, "missing"), search=False))
+        self.assertEqual(resolve_executable("python", sys.executable, search=False), sys.executable)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import codecs
+import os
+import tempfile
+import unittest
+
+from converter.transcode import HEADER_SIZE, detect_encoding, transcode_file
+
+HEBREW = "שלום עולם (הגדרה)"
+LRM = "\u200e"
+# Long enough that the body is read in several chunks after the header.
+PADDING = "%" * HEADER_SIZE + "\n"
+
+
+class TranscodeTest(unittest.TestCase):
+    """Writes LaTeX exports in various encodings and checks which encoding transcode_file picks."""
+
+    def setUp(self):
+        self._temp = tempfile.TemporaryDirectory()
+        self.root = self._temp.name
+
+    def tearDown(self):
+        self._temp.cleanup()
+
+    def _write(self, data):
+        path = os.path.join(self.root, "document.tex")
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_declared_cp1255_is_transcoded(self):
+        latex = "\\usepackage[cp1255]{inputenc}\n" + PADDING + HEBREW + LRM + "\n"
+        result = transcode_file(self._write(latex.encode('cp1255')), remove=LRM, chunk_size=7)
+        self.assertEqual((result.encoding, result.source), ("cp1255", "declared"))
+        self.assertTrue(result.transcoded)
+        self.assertTrue(result.text.endswith(HEBREW + "\n"))
+        self.assertEqual(result.undecodable_bytes, 0)
+
+    def test_lyx_header_declaration(self):
+        head = "\\lyxformat 544\n\\inputencoding cp1255\n".encode('ascii')
+        self.assertEqual(detect_encoding(head + HEBREW.encode('cp1255')), ("cp1255", "declared"))
+
+    def test_undeclared_utf8_is_detected_and_kept(self):
+        text = HEBREW + "\n" + PADDING + HEBREW + LRM + "\n"
+        result = transcode_file(self._write(text.encode('utf-8')), remove=LRM, chunk_size=5)
+        self.assertEqual((result.encoding, result.source), ("utf-8", "detected"))
+        self.assertFalse(result.transcoded)
+        self.assertEqual(result.text, text)
+
+    def test_byte_order_mark_is_stripped(self):
+        result = transcode_file(self._write(codecs.BOM_UTF8 + HEBREW.encode('utf-8')))
+        self.assertEqual((result.encoding, result.source, result.text), ("utf-8-sig", "detected", HEBREW))
+
+    def test_undeclared_single_byte_text_uses_the_default(self):
+        result = transcode_file(self._write(HEBREW.encode('cp1255')))
+        self.assertEqual((result.encoding, result.source, result.text), ("cp1255", "default", HEBREW))
+        # A file ending in what could be the start of a UTF-8 sequence is not UTF-8.
+        latin = transcode_file(self._write("café".encode('latin-1')), default_encoding="latin-1")
+        self.assertEqual((latin.source, latin.text), ("default", "café"))
+
+    def test_argument_overrides_the_declaration(self):
+        path = self._write(b"\\usepackage[latin9]{inputenc}\n" + HEBREW.encode('iso8859-8'))
+        result = transcode_file(path, encoding="iso8859-8")
+        self.assertEqual((result.encoding, result.source), ("iso8859-8", "argument"))
+        self.assertEqual(result.declared, ["iso8859-15"])
+        self.assertTrue(result.text.endswith(HEBREW))
+
+    def test_undecodable_bytes_are_replaced_and_counted(self):
+        result = transcode_file(self._write(b"\\usepackage[utf8]{inputenc}\nabc\xff\xfedef"))
+        self.assertEqual(result.undecodable_bytes, 2)
+        self.assertTrue(result.text.endswith("abc\ufffd\ufffddef"))
+
+    def test_mixed_encodings_follow_the_switches(self):
+        data = (b"\\usepackage[cp1255,latin9]{inputenc}\n" + "café ".encode('iso8859-15')
+                + b"\\inputencoding{cp1255}" + HEBREW.encode('cp1255') + PADDING.encode('ascii')
+                + b"\\inputencoding{latin9}" + "€".encode('iso8859-15'))
+        result = transcode_file(self._write(data), chunk_size=3)
+        self.assertEqual((result.encoding, result.source, result.switches), ("iso8859-15", "declared", 2))
+        self.assertEqual(result.text, "\\usepackage[cp1255,latin9]{inputenc}\ncafé \\inputencoding{cp1255}"
+                         + HEBREW + PADDING + "\\inputencoding{latin9}€")
+
+    def test_several_declarations_without_switches_are_ambiguous(self):
+        data = b"\\usepackage[cp1255,latin9]{inputenc}\n" + HEBREW.encode('cp1255')
+        result = transcode_file(self._write(data))
+        self.assertEqual((result.encoding, result.source), ("cp1255", "ambiguous"))
+        self.assertTrue(result.text.endswith(HEBREW))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.corpus import write_corpus
+from benchmarks.stub_toolchain import write_stub_toolchain
+from converter.lyx_converter import LyxConverter
+from converter.workspace import Workspace, scratch_root, set_origin
+
+HEADER = "#LyX 2.3\n\\lyxformat 544\n\\begin_document\n\\begin_header\n\\textclass article\n\\end_header\n"
+
+
+def _read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+class WorkspaceTest(unittest.TestCase):
+    """Checks that every job exports a private copy and leaves the source tree as it was."""
+
+    def setUp(self):
+        self._temp = tempfile.TemporaryDirectory()
+        self.root = self._temp.name
+        self.source = os.path.join(self.root, "in")
+        self.lyx_file_path = write_corpus(self.source, 1, 2000)[0]
+        self.scratch = os.path.join(self.root, "scratch")
+        os.makedirs(self.scratch)
+
+    def tearDown(self):
+        self._temp.cleanup()
+
+    def test_origin_points_at_the_original_directory(self):
+        inserted = set_origin(HEADER + "\\begin_body\n\\origin body text\n", "/data/notes")
+        self.assertIn("\\begin_header\n\\origin /data/notes/\n\\textclass", inserted)
+        self.assertIn("\\origin body text", inserted)
+        replaced = set_origin(inserted, "/other")
+        self.assertEqual(replaced.count("\\origin /"), 1)
+        self.assertIn("\\origin /other/\n", replaced)
+
+    def test_copy_is_private_and_removed(self):
+        with open(self.lyx_file_path, 'ab') as f:
+            f.write("שלום\n".encode('cp1255'))
+        with Workspace(self.lyx_file_path, self.scratch) as first, \
+                Workspace(self.lyx_file_path, self.scratch) as second:
+            self.assertNotEqual(first.directory, second.directory)
+            self.assertEqual(os.path.dirname(first.lyx_path), first.directory)
+            self.assertEqual(first.tex_path, first.lyx_path[:-4] + ".tex")
+            with open(first.lyx_path, 'rb') as f:
+                copy = f.read()
+            self.assertIn(f"\\origin {self.source}{os.sep}\n".encode('utf-8'), copy)
+            self.assertTrue(copy.endswith("שלום\n".encode('cp1255')))
+        self.assertEqual(os.listdir(self.scratch), [])
+
+    def test_workspace_is_removed_after_an_error(self):
+        with self.assertRaises(ValueError):
+            with Workspace(self.lyx_file_path, self.scratch):
+                raise ValueError("export failed")
+        self.assertEqual(os.listdir(self.scratch), [])
+
+    def test_unusable_scratch_directory_falls_back(self):
+        self.assertEqual(scratch_root(self.scratch), self.scratch)
+        fallback = scratch_root(os.path.join(self.root, "missing"))
+        self.assertNotEqual(fallback, os.path.join(self.root, "missing"))
+        self.assertEqual(scratch_root(self.scratch, needed_bytes=1 << 60), tempfile.gettempdir())
+
+    def test_concurrent_conversions_of_one_document(self):
+        lyx, pandoc = write_stub_toolchain(os.path.join(self.root, "stubs"), lyx_latency=0.2)
+        converter = LyxConverter(lyx, pandoc, scratch_directory=self.scratch)
+        outputs = [os.path.join(self.root, f"out{index}") for index in range(4)]
+        with ThreadPoolExecutor(4) as pool:
+            paths = list(pool.map(lambda output: converter.convert(self.lyx_file_path, output), outputs))
+
+        self.assertEqual(len({_read(path) for path in paths}), 1)
+        self.assertEqual(os.listdir(self.source), [os.path.basename(self.lyx_file_path)])
+        self.assertEqual(os.listdir(self.scratch), [])
+
+
+if __name__ == "__main__":
+    unittest.main()